@@ -0,0 +1,477 @@
+# ============================================================================ #
+#                             NBT_BrowseService.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Browse Service announcements, carried over the NBT Datagram Service.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+#   [MS-BRWS] Common Internet File System (CIFS) Browser Protocol
+#   [MS-MAIL] Remote Mailslot Protocol
+#   [IMPCIFS] Implementing CIFS, Part III: The Browse Service
+#             http://ubiqx.org/cifs/Browsing.html
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - Only the announcement frames are handled here.  These are the ones
+#     that carry the information needed to build a browse list passively,
+#     without ever having to query a browser.
+#
+#   - The SMB Transaction wrapper used by mailslot messages is handled
+#     just well enough to get at the data.  There is no SMB1 Transaction
+#     support in the SMB modules, and the browser should not need to
+#     depend upon them anyway.
+#
+# ============================================================================ #
+#
+"""NetBIOS over TCP/UDP (NBT) protocol: Browse Service Announcements
+
+Host Announcements, Domain Announcements, and Local Master Announcements
+are sent as Broadcast (or Direct Group) datagrams to the \\MAILSLOT\\BROWSE
+mailslot.  Each is wrapped in an SMB_COM_TRANSACTION request (a class 2
+mailslot write).
+
+This module provides:
+  * <MailslotData()> and <MailslotWrap()>, to unwrap and wrap mailslot
+    messages,
+  * The <Announcement> class and the <ParseAnnouncement()> function, to
+    compose and parse announcement frames, and
+  * The <BrowseList> class, which maintains a list of servers and a list
+    of domains (workgroups) from announcements as they arrive.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   struct              - Binary data packing and parsing tools.
+#   NBT_Core.TimerWheel - Browse list entry expiry.
+#
+
+import struct                           # Binary data handling.
+
+from NBT_Core import TimerWheel         # Timeout management.
+
+
+# Constants ------------------------------------------------------------------ #
+#
+
+# Mailslot names.
+BROWSE_MAILSLOT = "\\MAILSLOT\\BROWSE"
+
+# Browser frame opcodes (the subset handled here).
+BR_HOST_ANNOUNCE      = 0x01  # HostAnnouncement.
+BR_ANNOUNCE_REQUEST   = 0x02  # AnnouncementRequest.
+BR_DOMAIN_ANNOUNCE    = 0x0C  # DomainAnnouncement.
+BR_LMB_ANNOUNCE       = 0x0F  # LocalMasterAnnouncement.
+
+# Server type bits (a commonly used subset).
+SV_TYPE_WORKSTATION     = 0x00000001
+SV_TYPE_SERVER          = 0x00000002
+SV_TYPE_DOMAIN_CTRL     = 0x00000008
+SV_TYPE_PRINTQ_SERVER   = 0x00000200
+SV_TYPE_NT              = 0x00001000
+SV_TYPE_POTENTIAL_BROWSER = 0x00010000
+SV_TYPE_BACKUP_BROWSER  = 0x00020000
+SV_TYPE_MASTER_BROWSER  = 0x00040000
+SV_TYPE_DOMAIN_MASTER   = 0x00080000
+SV_TYPE_DOMAIN_ENUM     = 0x80000000
+
+# The announcement frame signature.
+BR_SIGNATURE = 0xAA55
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _format_Announce  - Fixed portion of the Host, Domain, and Local Master
+#                       Announcement frames.
+#   _format_TransData - The DataCount and DataOffset fields of an SMB
+#                       Transaction request.
+#   _format_Trans     - The Transaction request parameter words used for
+#                       a class 2 mailslot write.
+#   _SMB_TRANS_HDR    - A minimal SMB1 header for SMB_COM_TRANSACTION.
+#
+
+_format_Announce  = struct.Struct( "<BBL16sBBLBBH" )
+_format_TransData = struct.Struct( "<HH" )
+_format_Trans     = struct.Struct( "<BHHHHBBHLHHHHHBBHHHH" )
+
+_SMB_TRANS_HDR    = '\xffSMB\x25' + (27 * '\0')
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class Announcement( object ):
+  """A Host, Domain, or Local Master Announcement.
+
+  All three announcement frames share a single layout.  In a Domain
+  Announcement, the <name> is the name of the domain (workgroup) and the
+  <comment> is the name of the Local Master Browser for the domain.
+
+  Instance Attributes:
+    opcode      - One of BR_HOST_ANNOUNCE, BR_DOMAIN_ANNOUNCE, or
+                  BR_LMB_ANNOUNCE.
+    updateCount - Incremented (in theory) each time the announcement
+                  changes.  Generally ignored.
+    periodicity - The announcement interval, in milliseconds.
+    name        - The server or domain name.
+    osMajor     - Operating system major version.
+    osMinor     - Operating system minor version.
+    serverType  - The SV_TYPE_* bits.
+    comment     - The server comment, or (for Domain Announcements) the
+                  name of the Local Master Browser.
+
+  Doctest:
+    >>> a = Announcement( BR_HOST_ANNOUNCE, "zathras", 60000,
+    ...                   SV_TYPE_SERVER | SV_TYPE_NT, "Not the one." )
+    >>> b = ParseAnnouncement( a.compose() )
+    >>> print b.name, b.periodicity, hex( b.serverType ), b.comment
+    ZATHRAS 60000 0x1002 Not the one.
+  """
+  __slots__ = ( "opcode", "updateCount", "periodicity", "name",
+                "osMajor", "osMinor", "serverType", "comment" )
+
+  def __init__( self, opcode      = BR_HOST_ANNOUNCE,
+                      name        = "",
+                      periodicity = 720000,
+                      serverType  = 0,
+                      comment     = "",
+                      osMajor     = 4,
+                      osMinor     = 9,
+                      updateCount = 0 ):
+    """Create an announcement.
+
+    Input:
+      opcode      - The announcement type.
+      name        - The server or domain name.  This is converted to
+                    upper case, and may not exceed 15 octets.
+      periodicity - The announcement interval, in milliseconds.  The
+                    default is 12 minutes, the maximum interval.
+      serverType  - The SV_TYPE_* bits.
+      comment     - The server comment (or Local Master Browser name).
+      osMajor     - Operating system major version.
+      osMinor     - Operating system minor version.
+      updateCount - The update count.
+
+    Errors:
+      ValueError  - Raised if the name is too long.
+    """
+    if( len( name ) > 15 ):
+      raise ValueError( "Browse names are limited to 15 octets." )
+    self.opcode      = opcode
+    self.updateCount = updateCount
+    self.periodicity = periodicity
+    self.name        = name.upper()
+    self.osMajor     = osMajor
+    self.osMinor     = osMinor
+    self.serverType  = serverType
+    self.comment     = comment
+
+  def compose( self ):
+    """Compose the announcement frame.
+
+    Output: The announcement, as a string of octets.  This is the data
+            portion of the mailslot message; see <MailslotWrap()>.
+    """
+    return( _format_Announce.pack( self.opcode,
+                                   (0xFF & self.updateCount),
+                                   self.periodicity,
+                                   self.name,
+                                   self.osMajor,
+                                   self.osMinor,
+                                   self.serverType,
+                                   15, 1, BR_SIGNATURE )
+            + self.comment[:43] + '\0' )
+
+
+class BrowseList( object ):
+  """A browse list, built and maintained from received announcements.
+
+  Each announcement is applied as a delta: the entry for the announced
+  server (or domain) is added or replaced, and its expiry timer is
+  restarted.  Entries are kept on a timer wheel.  A server is dropped
+  if it has not been heard from for <missLimit> of its own announcement
+  periods.  An announcement with a server type of zero is treated as a
+  withdrawal, and removes the entry.
+
+  The lists returned by <servers()> and <domains()> are built only when
+  something has changed since the last time they were requested.
+  Otherwise, the cached list is returned.
+
+  To feed the list from a <DSEndpoint>, register a mailslot handler:
+    ep.register( None, lambda msg, addr: bl.update( msg.usrData ),
+                 BROWSE_MAILSLOT )
+
+  Properties:
+    version - A counter that is incremented whenever either list changes.
+
+  Doctest:
+    >>> now = [ 0.0 ]
+    >>> bl  = BrowseList( clock=lambda: now[0] )
+    >>> def ann( name, period, svType=SV_TYPE_SERVER ):
+    ...   a = Announcement( BR_HOST_ANNOUNCE, name, period, svType )
+    ...   return( MailslotWrap( a.compose() ) )
+    >>> bl.update( ann( "zoot", 60000 ) ), bl.update( ann( "dingo", 1000 ) )
+    (True, True)
+    >>> bl.update( ann( "spam", 60000, SV_TYPE_WORKSTATION ) )
+    True
+    >>> dom = Announcement( BR_DOMAIN_ANNOUNCE, "anthrax", 60000,
+    ...                     SV_TYPE_DOMAIN_ENUM, "ZOOT" )
+    >>> bl.update( MailslotWrap( dom.compose() ) )
+    True
+    >>> print [ a.name for a in bl.servers() ]
+    ['DINGO', 'SPAM', 'ZOOT']
+    >>> print [ a.name for a in bl.servers( SV_TYPE_SERVER ) ]
+    ['DINGO', 'ZOOT']
+    >>> print [ (a.name, a.comment) for a in bl.domains() ]
+    [('ANTHRAX', 'ZOOT')]
+    >>> now[0] += 5.0   # Dingo has missed three announcements.
+    >>> print [ a.name for a in bl.servers() ]
+    ['SPAM', 'ZOOT']
+    >>> bl.update( ann( "spam", 60000, 0 ) )    # Spam shuts down.
+    True
+    >>> print [ a.name for a in bl.servers() ], len( bl )
+    ['ZOOT'] 2
+    >>> bl.update( "This is not a mailslot message." )
+    False
+  """
+  def __init__( self, missLimit=3, clock=None ):
+    """Create an empty browse list.
+
+    Input:
+      missLimit - The number of announcement periods that may pass
+                  before an entry is considered stale.
+      clock     - A function returning the current time in seconds.
+                  This is for testing; the default is <monoClock()>.
+    """
+    # <_lists>    - Two dictionaries, one for servers and one for domains,
+    #               mapping names to TimerWheel timers.  The timer payload
+    #               is a (list index, Announcement) tuple.
+    # <_wheel>    - The expiry timer wheel.  One second resolution is more
+    #               than adequate.
+    # <_cache>    - The most recently returned lists, or None if they need
+    #               to be rebuilt.
+    self.missLimit = missLimit
+    self._lists    = ( {}, {} )
+    self._wheel    = TimerWheel( 1.0, 1024, clock )
+    self._cache    = [ None, None ]
+    self._version  = 0
+
+  def __len__( self ):
+    """The total number of servers and domains in the list.
+    """
+    return( len( self._lists[0] ) + len( self._lists[1] ) )
+
+  @property
+  def version( self ):
+    """A change counter.  Read-only."""
+    return( self._version )
+
+  def _changed( self, which ):
+    # Mark one of the lists as changed.
+    self._cache[ which ] = None
+    self._version += 1
+
+  def expire( self ):
+    """Remove stale entries.
+
+    Output: The number of entries removed.
+
+    Notes:  This is called automatically by <update()>, <servers()>,
+            and <domains()>.
+    """
+    expired = self._wheel.expire()
+    for timer in expired:
+      which, ann = timer.Data
+      del self._lists[ which ][ ann.name ]
+      self._changed( which )
+    return( len( expired ) )
+
+  def apply( self, ann=None ):
+    """Apply a parsed announcement to the browse list.
+
+    Input:  ann - An <Announcement>.
+
+    Output: True if the announcement was applied, else False (the
+            announcement was of an unknown type).
+    """
+    if( ann.opcode in (BR_HOST_ANNOUNCE, BR_LMB_ANNOUNCE) ):
+      which = 0
+    elif( BR_DOMAIN_ANNOUNCE == ann.opcode ):
+      which = 1
+    else:
+      return( False )
+
+    entries = self._lists[ which ]
+    timer   = entries.get( ann.name )
+    if( 0 == ann.serverType ):
+      # Withdrawal.
+      if( timer is not None ):
+        self._wheel.cancel( timer )
+        del entries[ ann.name ]
+        self._changed( which )
+      return( True )
+
+    delay = (self.missLimit * ann.periodicity) / 1000.0
+    if( timer is None ):
+      entries[ ann.name ] = self._wheel.start( (which, ann), delay )
+    else:
+      timer.Data = (which, ann)
+      self._wheel.restart( timer, delay )
+    self._changed( which )
+    return( True )
+
+  def update( self, usrData=None ):
+    """Apply a received \\MAILSLOT\\BROWSE message to the browse list.
+
+    Input:  usrData - The payload of a received datagram.
+
+    Output: True if the message was an announcement and was applied,
+            else False.
+    """
+    self.expire()
+    try:
+      slot, data = MailslotData( usrData )
+      if( slot != BROWSE_MAILSLOT ):
+        return( False )
+      ann = ParseAnnouncement( data )
+    except ValueError:
+      return( False )
+    return( self.apply( ann ) )
+
+  def _list( self, which ):
+    # Return the (cached) sorted list of announcements.
+    self.expire()
+    cached = self._cache[ which ]
+    if( cached is None ):
+      entries = self._lists[ which ]
+      cached  = tuple( entries[ k ].Data[1] for k in sorted( entries ) )
+      self._cache[ which ] = cached
+    return( cached )
+
+  def servers( self, svType=0 ):
+    """Return the list of known servers.
+
+    Input:  svType  - If non-zero, only servers with at least one of
+                      the given SV_TYPE_* bits set are returned.
+
+    Output: A tuple of <Announcement> objects, sorted by name.
+    """
+    servers = self._list( 0 )
+    if( svType ):
+      return( tuple( a for a in servers if( a.serverType & svType ) ) )
+    return( servers )
+
+  def domains( self ):
+    """Return the list of known domains (workgroups).
+
+    Output: A tuple of <Announcement> objects, sorted by name.  The
+            <comment> field of each is the name of the domain's Local
+            Master Browser.
+    """
+    return( self._list( 1 ) )
+
+
+# Functions ------------------------------------------------------------------ #
+#
+
+def ParseAnnouncement( data=None ):
+  """Parse a Host, Domain, or Local Master Announcement frame.
+
+  Input:  data  - The mailslot message data.
+
+  Errors: ValueError  - Raised if the data is too short, or is not an
+                        announcement frame.
+
+  Output: An <Announcement> object.
+  """
+  if( (not data) or (len( data ) < _format_Announce.size) ):
+    raise ValueError( "Browser frame short or empty." )
+  opcode, updCnt, period, name, osMaj, osMin, svType, bcMaj, bcMin, sig \
+    = _format_Announce.unpack_from( data )
+  if( opcode not in (BR_HOST_ANNOUNCE, BR_DOMAIN_ANNOUNCE, BR_LMB_ANNOUNCE) ):
+    raise ValueError( "Not an announcement frame: 0x%02X" % opcode )
+  ann = Announcement( opcode, name.split( '\0', 1 )[0].rstrip(),
+                      period, svType,
+                      data[_format_Announce.size:].split( '\0', 1 )[0],
+                      osMaj, osMin, updCnt )
+  return( ann )
+
+def MailslotData( usrData=None ):
+  """Unwrap a mailslot message.
+
+  Input:  usrData - The payload of a received datagram.
+
+  Errors: ValueError  - Raised if the payload is not a well-formed
+                        SMB_COM_TRANSACTION mailslot message.
+
+  Output: A tuple: (mailslot name, data).  The mailslot name is
+          converted to upper case.
+  """
+  if( (not usrData) or (len( usrData ) < 70)
+      or (not usrData.startswith( _SMB_TRANS_HDR[:5] )) ):
+    raise ValueError( "Not a mailslot message." )
+  pos = 35 + (2 * ord( usrData[32] ))
+  end = usrData.find( '\0', pos )
+  if( end < 0 ):
+    raise ValueError( "Unterminated mailslot name." )
+  count, offset = _format_TransData.unpack_from( usrData, 55 )
+  if( (offset + count) > len( usrData ) ):
+    raise ValueError( "Mailslot data exceeds the message length." )
+  return( (usrData[pos:end].upper(), usrData[offset:offset+count]) )
+
+def MailslotWrap( data=None, mailslot=BROWSE_MAILSLOT ):
+  """Wrap data in a class 2 (unreliable) mailslot write.
+
+  Input:
+    data      - The mailslot message data.
+    mailslot  - The mailslot name.
+
+  Output: An SMB_COM_TRANSACTION request, as a string of octets.  This
+          is the payload of the datagram that carries the message.
+  """
+  name   = mailslot + '\0'
+  offset = len( _SMB_TRANS_HDR ) + _format_Trans.size + len( name )
+  words  = _format_Trans.pack( 17,              # WordCount.
+                               0, len( data ),  # Total Param/Data count.
+                               0, 0, 0, 0,      # Max counts, Reserved1.
+                               0, 0, 0,         # Flags, Timeout, Res2.
+                               0, offset,       # ParameterCount/Offset.
+                               len( data ),     # DataCount.
+                               offset,          # DataOffset.
+                               3, 0,            # SetupCount, Reserved3.
+                               1, 1, 2,         # Write, priority, class.
+                               len( name ) + len( data ) )
+  return( _SMB_TRANS_HDR + words + name + data )
+
+# ============================================================================ #
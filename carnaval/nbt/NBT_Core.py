@@ -93,13 +93,48 @@ References:
 
 # Imports -------------------------------------------------------------------- #
 #
+#   os.times()          - On POSIX systems, element 4 is the elapsed real
+#                         time since a fixed point in the past.
+#   time                - Time access and conversions.
 #   ErrorCodeExceptions - Provides the CodedError() class, upon which the
 #                         NBTerror class is built.
 #
 
+import time                             # Time and clocks.
+
+from os import times                    # Process and elapsed times.
 from common.ErrorCodeExceptions import CodedError
 
 
+# Functions ------------------------------------------------------------------ #
+#
+
+def _pickClock():
+  # Select the best available monotonic clock.
+  #
+  # Output: A function that takes no arguments and returns a clock value
+  #         in seconds, as a float.
+  #
+  # Notes:  Python v2.7 has no time.monotonic().  On POSIX systems, the
+  #         fifth element of os.times() is the elapsed real time from
+  #         times(2), which does not jump when the system clock is set.
+  #         Its resolution is coarse (typically 10ms), but that is fine
+  #         for protocol timeouts.  If neither is available (e.g., on
+  #         Windows, where the value is always zero), we fall back to
+  #         the wall clock.
+  #
+  if( hasattr( time, "monotonic" ) ):
+    return( time.monotonic )
+  if( times()[4] ):
+    return( lambda: times()[4] )
+  return( time.time )
+
+# monoClock() - Return a monotonic clock value, in seconds (as a float).
+#               The value has no defined starting point.  It is only
+#               useful for measuring intervals.
+monoClock = _pickClock()
+
+
 # Classes -------------------------------------------------------------------- #
 #
 
@@ -262,6 +297,169 @@ class dLinkedList( object ):
       yield n.Data
       n = n.Next
 
+
+class TimerWheel( object ):
+  """
+  Hashed timing wheel.
+
+  A timer wheel keeps track of a large number of timers, each of which
+  can be started, restarted, or cancelled in constant time.  Timers are
+  hashed into a ring of buckets by their expiry time.  Expiry processing
+  only visits the buckets that have come due since the last check, so
+  the cost of finding expired timers does not depend upon the number of
+  running timers.
+
+  Each bucket is a <dLinkedList>, and each timer is a node in one of
+  those lists.  Timers that are further in the future than one full
+  turn of the wheel simply stay in their bucket until their time comes
+  around.
+
+  The wheel is driven by <monoClock()> unless a different clock is
+  given.  All times are in seconds.
+
+  Doctest:
+    >>> now = [ 100.0 ]
+    >>> tw  = TimerWheel( tick=1, slots=8, clock=lambda: now[0] )
+    >>> t1  = tw.start( "one", 2.5 )
+    >>> t2  = tw.start( "two", 4 )
+    >>> t3  = tw.start( "ten", 10 )
+    >>> now[0] = 103.0
+    >>> [ t.Data for t in tw.expire() ]
+    ['one']
+    >>> tw.restart( t2, 4 )     # Pushed back to 107.0
+    >>> now[0] = 110.5
+    >>> [ t.Data for t in tw.expire() ]
+    ['two', 'ten']
+    >>> len( tw ), t1.running()
+    (0, False)
+  """
+
+  class Timer( dLinkedList.Node ):
+    """A timer; a node in one of the wheel's bucket lists.
+
+    Instance Attributes:
+      Data      - The payload of the timer (whatever the caller wants
+                  to associate with it).
+      Deadline  - The clock value at which the timer expires.
+      Bucket    - The bucket list containing the timer, or None if the
+                  timer is not running.
+    """
+    def __init__( self, Data=None ):
+      super( TimerWheel.Timer, self ).__init__( Data )
+      self.Deadline = None
+      self.Bucket   = None
+
+    def running( self ):
+      """Return True if the timer is running (has not expired or been
+      cancelled).
+      """
+      return( self.Bucket is not None )
+
+  def __init__( self, tick=0.125, slots=512, clock=None ):
+    """Create a timer wheel.
+
+    Input:
+      tick  - The time span covered by each bucket, in seconds.  This
+              is the resolution of the wheel.  Timers may expire up to
+              one tick late, but never early.
+      slots - The number of buckets in the wheel.
+      clock - A function that returns the current time in seconds.
+              Defaults to <monoClock()>.
+    """
+    self._tick    = float( tick )
+    self._slots   = int( slots )
+    self._clock   = monoClock if( clock is None ) else clock
+    self._buckets = [ dLinkedList() for i in xrange( self._slots ) ]
+    self._curTick = int( self._clock() / self._tick )
+    self._count   = 0
+
+  def __len__( self ):
+    """The number of running timers."""
+    return( self._count )
+
+  def now( self ):
+    """Return the current time, as given by the wheel's clock."""
+    return( self._clock() )
+
+  def start( self, Data=None, delay=0 ):
+    """Create and start a new timer.
+
+    Input:
+      Data  - The timer payload.
+      delay - The number of seconds until the timer expires.
+
+    Output: The new <TimerWheel.Timer> object.
+    """
+    timer = self.Timer( Data )
+    self.restart( timer, delay )
+    return( timer )
+
+  def restart( self, timer=None, delay=0 ):
+    """(Re)start an existing timer.
+
+    Input:
+      timer - A <TimerWheel.Timer> object.  If it is running, it is
+              first removed from its current bucket.
+      delay - The number of seconds until the timer expires.
+    """
+    if( timer.Bucket is not None ):
+      timer.Bucket.remove( timer )
+    else:
+      self._count += 1
+    timer.Deadline = self._clock() + delay
+    tick = max( int( timer.Deadline / self._tick ), self._curTick )
+    timer.Bucket = self._buckets[ tick % self._slots ]
+    timer.Bucket.insert( timer )
+
+  def cancel( self, timer=None ):
+    """Stop a running timer.
+
+    Input:  timer - A <TimerWheel.Timer> object.
+
+    Output: True if the timer was running, else False.
+    """
+    if( timer.Bucket is None ):
+      return( False )
+    timer.Bucket.remove( timer )
+    timer.Bucket = None
+    self._count -= 1
+    return( True )
+
+  def expire( self, limit=None ):
+    """Remove and return timers that have expired.
+
+    Input:  limit - The maximum number of timers to return, or None for
+                    no limit.  Expired timers that are not returned due
+                    to the limit will be returned by a subsequent call.
+
+    Output: A list of expired <TimerWheel.Timer> objects.  The timers
+            are no longer running, and may be restarted.
+    """
+    now     = self._clock()
+    nowTick = int( now / self._tick )
+    expired = []
+    # If we have fallen more than a full turn behind, one pass over all
+    # of the buckets is enough.
+    if( (nowTick - self._curTick) >= self._slots ):
+      self._curTick = nowTick - self._slots + 1
+    while( True ):
+      bucket = self._buckets[ self._curTick % self._slots ]
+      timer  = bucket.Head
+      while( timer is not None ):
+        nextTimer = timer.Next
+        if( timer.Deadline <= now ):
+          if( (limit is not None) and (len( expired ) >= limit) ):
+            return( expired )
+          bucket.remove( timer )
+          timer.Bucket = None
+          self._count -= 1
+          expired.append( timer )
+        timer = nextTimer
+      if( self._curTick >= nowTick ):
+        break
+      self._curTick += 1
+    return( expired )
+
 # ============================================================================ #
 # "Fussbudgetry!", exclaimed Sally.  Then, after hesitating just long enough
 # to make it seem awkward, she stomped her foot.  Jennifer, in a clear act of
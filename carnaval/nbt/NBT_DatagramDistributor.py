@@ -0,0 +1,378 @@
+# ============================================================================ #
+#                          NBT_DatagramDistributor.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   NetBIOS over TCP/IP (IETF STD19) implementation: NetBIOS Datagram
+#   Distribution server (NBDD).
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - The NBDD is described in RFC1001, section 17.3, and RFC1002, section
+#     4.4.  Very few NBDD implementations were ever written.  Microsoft's
+#     WINS server does not provide one.
+#
+#   - Python v2.7 has no sendmmsg(), so there is no way to hand the kernel
+#     a batch of datagrams in a single call.  Instead, each received packet
+#     is copied once into a shared buffer and a memoryview of that buffer
+#     is passed to sendto() once for each group member.
+#
+# ============================================================================ #
+#
+"""NetBIOS over TCP/UDP (NBT) protocol: Datagram Distribution Server
+
+The NBDD relays Direct Group and Broadcast datagrams to the members of
+the destination group, on behalf of nodes (P and M nodes) that cannot
+reach those members via local broadcast.  It also answers NBDD Query
+messages, which ask whether the NBDD is willing to relay datagrams for
+a given name.
+
+Group membership is provided by a pluggable name source: a callable
+that is given an L2-encoded NBT name and returns an iterable of member
+IPv4 addresses (each a string of four octets), or None if the name is
+not known.  For example, given a dictionary of <GroupMemberTable>
+objects keyed by L2 name:
+
+    source = lambda name: (tables[name].members() if( name in tables )
+                           else None)
+
+The NBDD does not own a socket.  The caller passes each received packet
+to <NBDD.handlePacket()>, along with a send function (typically the
+sendto() method of the socket on which the packet was received).
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   socket              - Address format conversion.
+#   time                - Timing, for the benchmark.
+#   NBT_Core            - NBT exception class, and the monotonic clock.
+#   NBT_DatagramService - Datagram message parsing and composing.
+#
+
+import socket                           # Address conversion.
+import time                             # Benchmark timing.
+
+from NBT_Core             import NBTerror   # NBT exception class.
+from NBT_Core             import monoClock  # Monotonic clock.
+from NBT_DatagramService  import *          # Datagram Service messages.
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class NBDD( object ):
+  """NetBIOS Datagram Distribution server.
+
+  Received Direct Group and Broadcast datagrams (including fragments)
+  are relayed, unchanged except for the Sender Node Type which is set
+  to DS_SNT_NBDD, to each member of the destination group.  The packet
+  is copied once, into a shared buffer.  Nothing that varies from one
+  member to the next is written into the packet, so no per-member
+  composition is needed.  Fragments are relayed as they arrive; there
+  is no need to reassemble them.  The original sender is skipped.
+
+  Group membership lookups are cached for <cacheTTL> seconds.  NBDD
+  Query Requests are answered from the same cache.  The composed
+  response is stored in the cache entry so that subsequent queries
+  for the same name only need to have the DGM_ID patched.
+
+  Instance Attributes:
+    source    - The name source callable.
+    cacheTTL  - Lifetime of cached membership lookups, in seconds.
+    maxCache  - The maximum number of cache entries.  If the cache
+                fills, it is cleared.
+    fwdCount  - Number of packets relayed (counting each member).
+    qryCount  - Number of NBDD queries answered.
+    dropCount - Number of datagrams with no known members.
+    badCount  - Number of packets that could not be parsed, or were of
+                the wrong message type.
+    hits      - Cache hits.
+    misses    - Cache misses (name source lookups).
+
+  Doctest:
+    >>> ip   = [ chr( 10 ) + chr( 0 ) + chr( 0 ) + chr( i ) for i in (1, 2, 3) ]
+    >>> grp  = Name( "WORKERS", suffix='\\x00', scope="Meh" ).L2name
+    >>> src  = Name( "BOSS", scope="Meh" ).L2name
+    >>> now  = [ 0.0 ]
+    >>> dd   = NBDD( { grp: ip }.get, ip[0], clock=lambda: now[0] )
+    >>> sent = []
+    >>> def send( pkt, addr ):
+    ...   sent.append( (pkt.tobytes() if( isinstance( pkt, memoryview ) )
+    ...                 else pkt, addr) )
+    >>> # Relay a group datagram.  The sender (ip[0]) is skipped.
+    >>> dgd = DirectGroupDatagram( DS_SNT_P, 7, ip[0], DS_PORT, src, grp,
+    ...                            "Time for lunch." )
+    >>> dd.handlePacket( dgd.composeList()[0], None, send )
+    2
+    >>> print [ addr for pkt, addr in sent ]
+    [('10.0.0.2', 138), ('10.0.0.3', 138)]
+    >>> fwd = ParseDgm( sent[0][0] )
+    >>> print fwd.hdrSNT == DS_SNT_NBDD, fwd.usrData
+    True Time for lunch.
+    >>> # Queries.
+    >>> del sent[:]
+    >>> qry = QueryNBDD( DS_SNT_P, 99, ip[1], DS_PORT, grp )
+    >>> dd.handlePacket( qry.compose(), ('10.0.0.2', 138), send )
+    1
+    >>> print ParseDgm( sent[0][0] ).msgType == DS_DGM_POSRESP, dd.hits
+    True 1
+    >>> qry.qryName = Name( "SHIRKERS", scope="Meh" ).L2name
+    >>> dd.handlePacket( qry.compose(), ('10.0.0.2', 138), send )
+    1
+    >>> rsp = ParseDgm( sent[1][0] )
+    >>> print rsp.msgType == DS_DGM_NEGRESP, rsp.dgmId, dd.misses
+    True 99 2
+    >>> now[0] += 10
+    >>> dd.handlePacket( dgd.composeList()[0], None, send ), dd.misses
+    (2, 3)
+    >>> # Truncated packets are counted and dropped.
+    >>> dd.handlePacket( dgd.composeList()[0][:12], None, send ), dd.badCount
+    (0, 1)
+  """
+  def __init__( self, source   = None,
+                      srcIP    = None,
+                      srcPort  = DS_PORT,
+                      cacheTTL = 5.0,
+                      maxCache = 4096,
+                      clock    = None ):
+    """Create an NBDD.
+
+    Input:
+      source    - The name source.  A callable that takes an L2-encoded
+                  name and returns an iterable of member IPv4 addresses
+                  (four-octet strings), or None.
+      srcIP     - The NBDD's own IPv4 address (four octets).  This is
+                  used in the SOURCE_IP field of query responses.
+      srcPort   - The NBDD's UDP port, used in query responses.
+      cacheTTL  - Lifetime of cached membership lookups, in seconds.
+      maxCache  - Maximum number of cache entries.
+      clock     - A function returning the current time in seconds.
+                  This is for testing; the default is <monoClock()>.
+    """
+    self.source   = source
+    self.srcIP    = srcIP
+    self.srcPort  = srcPort
+    self.cacheTTL = cacheTTL
+    self.maxCache = maxCache
+    self._clock   = monoClock if( clock is None ) else clock
+
+    # <_cache>  - Maps L2 names to cache entries.  Each entry is a list:
+    #             [ expiry, ((IP, (dotted IP, port)), ...), response ]
+    #             The response is a bytearray holding the composed NBDD
+    #             query response, or None if it has not been needed yet.
+    self._cache = {}
+
+    self.fwdCount = self.qryCount = self.dropCount = self.badCount = 0
+    self.hits = self.misses = 0
+
+  def flush( self, name=None ):
+    """Remove cached membership information.
+
+    Input:  name  - The L2-encoded name to flush, or None to clear the
+                    entire cache.
+
+    Notes:  The name source should call this when group membership
+            changes, if it is important that the change be seen before
+            the cache entry expires.
+    """
+    if( name is None ):
+      self._cache.clear()
+    else:
+      self._cache.pop( name, None )
+
+  def _lookup( self, name ):
+    # Find the cache entry for a name, filling it in from the source as
+    # needed.
+    #
+    # Input:  name  - An L2-encoded NBT name.
+    #
+    # Output: The cache entry.
+    #
+    now   = self._clock()
+    entry = self._cache.get( name )
+    if( (entry is not None) and (entry[0] > now) ):
+      self.hits += 1
+      return( entry )
+
+    self.misses += 1
+    members = self.source( name ) if( self.source ) else None
+    addrs   = tuple( (ip, (socket.inet_ntoa( ip ), DS_PORT))
+                     for ip in (members or ()) )
+    if( len( self._cache ) >= self.maxCache ):
+      self._cache.clear()
+    entry = [ (now + self.cacheTTL), addrs, None ]
+    self._cache[ name ] = entry
+    return( entry )
+
+  def handlePacket( self, pkt=None, addr=None, send=None ):
+    """Relay a datagram, or answer a query.
+
+    Input:
+      pkt   - The received packet, as a string of octets.
+      addr  - The (IP, port) tuple from which the packet was received.
+      send  - A function that will be called as send( pkt, addr ) for
+              each packet to be sent.  The <pkt> may be a memoryview.
+
+    Output: The number of packets sent.
+    """
+    msgType = ord( pkt[0] ) if( pkt ) else None
+    if( msgType in (DS_DGM_GROUP, DS_DGM_BCAST) ):
+      return( self.relay( pkt, send ) )
+    if( DS_DGM_QUERY == msgType ):
+      return( self.answer( pkt, addr, send ) )
+    self.badCount += 1
+    return( 0 )
+
+  def relay( self, pkt=None, send=None ):
+    """Relay a Direct Group or Broadcast datagram to the group members.
+
+    Input:
+      pkt   - The received datagram (or fragment), as a string of octets.
+      send  - The send function; see <handlePacket()>.
+
+    Output: The number of packets sent.
+    """
+    try:
+      msg = ParseDgm( pkt, fast=True )
+    except (ValueError, TypeError, AssertionError, NBTerror):
+      self.badCount += 1
+      return( 0 )
+
+    addrs = self._lookup( msg.dstName )[1]
+    if( not addrs ):
+      self.dropCount += 1
+      return( 0 )
+
+    # Copy the packet once, and mark it as sent by the NBDD.
+    buf    = bytearray( pkt )
+    buf[1] = (buf[1] & ~DS_SNT_MASK & 0xFF) | DS_SNT_NBDD
+    view   = memoryview( buf )
+    srcIP  = msg.srcIP
+    count  = 0
+    for ip, dst in addrs:
+      if( ip != srcIP ):
+        send( view, dst )
+        count += 1
+    self.fwdCount += count
+    return( count )
+
+  def answer( self, pkt=None, addr=None, send=None ):
+    """Answer an NBDD Query.
+
+    Input:
+      pkt   - The received query, as a string of octets.
+      addr  - The (IP, port) tuple to which the response is sent.
+      send  - The send function; see <handlePacket()>.
+
+    Output: The number of packets sent (one, or zero on error).
+
+    Notes:  A Positive Response is sent if the name source knows of at
+            least one member of the queried group, else a Negative
+            Response is sent.
+    """
+    try:
+      qry = ParseDgm( pkt )
+    except (ValueError, TypeError, AssertionError, NBTerror):
+      qry = None
+    if( not isinstance( qry, QueryNBDD ) ):
+      self.badCount += 1
+      return( 0 )
+
+    entry = self._lookup( qry.qryName )
+    rsp   = entry[2]
+    if( rsp is None ):
+      klas = PositiveResponseNBDD if( entry[1] ) else NegativeResponseNBDD
+      rsp  = bytearray( klas( 0, self.srcIP, self.srcPort,
+                              qry.qryName ).compose() )
+      entry[2] = rsp
+    rsp[2] = (qry.dgmId >> 8) & 0xFF
+    rsp[3] = qry.dgmId & 0xFF
+    send( str( rsp ), addr )
+    self.qryCount += 1
+    return( 1 )
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( members=5000, count=200, size=400 ):
+  # Measure the cost of relaying group datagrams to a large group.
+  #
+  # Input:
+  #   members - Number of members in the group.
+  #   count   - Number of datagrams to relay.
+  #   size    - Payload size of each datagram.
+  #
+  # Notes:  Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_DatagramDistributor as m; m._bench()'
+  #
+  #         Packets are "sent" to a function that only counts them, so
+  #         this measures the NBDD, not the network stack.  The result
+  #         is compared against composing a new message for each member.
+  #
+  ips = [ socket.inet_aton( "10.%d.%d.%d" % (i >> 16, (i >> 8) & 0xFF,
+                                             i & 0xFF) )
+          for i in xrange( 1, members + 1 ) ]
+  grp = Name( "BIGGROUP", suffix='\x00' ).L2name
+  src = socket.inet_aton( "192.168.1.1" )
+  dgd = DirectGroupDatagram( DS_SNT_P, 1, src, DS_PORT,
+                             Name( "SENDER" ).L2name, grp, ('x' * size) )
+  pkt = dgd.composeList()[0]
+  nbdd = NBDD( { grp: ips }.get, src )
+  sent = [ 0 ]
+  def _send( pkt, addr ):
+    sent[0] += 1
+
+  start = time.time()
+  for i in xrange( count ):
+    nbdd.handlePacket( pkt, None, _send )
+  elapsed = time.time() - start
+  relayed = sent[0]
+
+  start = time.time()
+  for i in xrange( count ):
+    for ip in ips:
+      dgd.hdrSNT = DS_SNT_NBDD
+      _send( dgd.composeList()[0], (socket.inet_ntoa( ip ), DS_PORT) )
+  naive = time.time() - start
+
+  print "Members...........: %d" % members
+  print "Packets relayed...: %d" % relayed
+  print "Shared buffer.....: %.3f seconds (%.0f packets/second)" % \
+        (elapsed, (count * members) / elapsed)
+  print "Compose per member: %.3f seconds (%.0f packets/second)" % \
+        (naive, (count * members) / naive)
+
+# ============================================================================ #
@@ -0,0 +1,653 @@
+# ============================================================================ #
+#                            NBT_DatagramEndpoint.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   NetBIOS over TCP/IP (IETF STD19) implementation: NBT Datagram Service
+#   network endpoint.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - The NBT modules are written for Python v2.7, which has no asyncio.
+#     The endpoint defined here is a non-blocking UDP socket wrapper that
+#     can be driven by any select()/poll() style event loop.  It provides
+#     the fileno(), handleRead(), handleWrite(), and wantWrite() methods
+#     that such loops need, plus a simple poll() method that runs one
+#     pass of a select() loop on its own.
+#
+#   - The endpoint does not bind to a privileged port unless asked to.
+#     Binding to UDP/138 typically requires special privileges.
+#
+# ============================================================================ #
+#
+"""NetBIOS over TCP/UDP (NBT) protocol: Datagram Service Endpoint
+
+This module ties the pieces of the NBT Datagram Service together:
+
+  * Incoming UDP packets are parsed by <ParseDgm()>.
+  * Fragments are passed through a <Defrag> pool.
+  * Complete Direct Unique, Direct Group, and Broadcast datagrams are
+    handed to the handler registered for the L2-encoded destination
+    name and/or mailslot name (see <MailslotIndex>).
+  * Outgoing messages are sent one fragment at a time, using
+    <DSMessage.sendAll()>.
+
+Handlers are simple callables.  Each is called with two arguments: the
+parsed message object, and the (IP, port) address tuple from which the
+message was received.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   errno               - Error numbers, so that we can recognize EAGAIN.
+#   socket              - The usual network socket stuff.
+#   select              - Wait for socket readiness.
+#   time                - Timing, for the benchmark.
+#   collections.deque   - A queue of unsent packets.
+#   NBT_Core            - NBT exception class.
+#   NBT_DatagramService - Datagram message parsing, composing, and
+#                         reassembly.
+#
+
+import errno                            # Error numbers.
+import socket                           # Sockets.
+import select                           # Socket readiness.
+import time                             # Benchmark timing.
+
+from collections          import deque    # Outbound packet queue.
+from NBT_Core             import NBTerror # NBT exception class.
+from NBT_DatagramService  import *        # Datagram Service messages.
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _RCV_SIZE   - Default receive buffer size.  A maximal NetBIOS datagram
+#                 (512 bytes of payload plus two fully-scoped names) fits
+#                 well within this limit.
+#   _AGAIN      - The set of errno values that indicate that a non-blocking
+#                 operation would have blocked.
+#   _SMB_*      - Just enough SMB to find a mailslot name.
+#
+
+_RCV_SIZE = 2048
+_AGAIN    = ( errno.EAGAIN, errno.EWOULDBLOCK )
+
+# SMB_COM_TRANSACTION header prefix, and the length of an SMB1 header.
+_SMB_TRANS_PFX = '\xffSMB\x25'
+_SMB_HDR_LEN   = 32
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class DSEndpoint( object ):
+  """NBT Datagram Service UDP endpoint.
+
+  A non-blocking UDP socket, plus the plumbing needed to parse, reassemble,
+  and dispatch incoming datagrams, and to compose and send outgoing
+  datagrams.
+
+  Instance Attributes:
+    sock      - The underlying UDP socket.
+    srcIP     - The IPv4 address (four octets) written into the SOURCE_IP
+                field of datagrams composed by <sendTo()>.
+    srcPort   - The port number written into the SOURCE_PORT field.
+    defrag    - The <Defrag> pool used to reassemble fragments.
+    index     - The <MailslotIndex> used to find message handlers.
+    default   - A handler that receives any message for which there is
+                no registered handler, or None to drop such messages.
+    sendErrors- If True (the default), a Direct Unique datagram sent to
+                a name that has no registered handlers (and that is not
+                picked up by the <default> handler) is answered with a
+                Destination Name Not Present error datagram.
+    rcvCount  - Number of UDP packets received.
+    msgCount  - Number of complete messages handed to a handler.
+    badCount  - Number of packets that could not be parsed.
+    dropCount - Number of complete messages for which no handler was
+                available.
+    sndCount  - Number of UDP packets sent.
+    errCount  - Number of error datagrams sent.
+
+  Doctest:
+    >>> rcvd = []
+    >>> srv = DSEndpoint( '127.0.0.1', 0 )
+    >>> cli = DSEndpoint( '127.0.0.1', 0 )
+    >>> dn  = Name( "RECEIVER" ).L2name
+    >>> srv.register( dn, lambda msg, addr: rcvd.append( msg ) )
+    >>> ud  = (16 * "Beware the Jabberwock, my son! ")
+    >>> dgm = DirectUniqueDatagram( DS_SNT_B, 0, None, 0,
+    ...                             Name( "SENDER" ).L2name, dn, ud )
+    >>> dgm.maxData = 128
+    >>> cli.sendTo( dgm, srv.sock.getsockname() )
+    4
+    >>> while( not rcvd ):
+    ...   n = srv.poll( 1.0 )
+    >>> print rcvd[0].msgType == DS_DGM_UNIQUE, rcvd[0].usrData == ud
+    True True
+    >>> print srv.rcvCount, srv.msgCount, srv.badCount
+    4 1 0
+    >>> # An unknown destination name gets an error reply.
+    >>> dgm.dstName = Name( "NOBODY" ).L2name
+    >>> cli.sendTo( dgm, srv.sock.getsockname(), 0x0BAD )
+    4
+    >>> cli.default = lambda msg, addr: rcvd.append( msg )
+    >>> while( (srv.errCount < 1) or (cli.poll( 1.0 ) < 1) ):
+    ...   n = srv.poll( 0.01 )
+    >>> print type( rcvd[-1] ).__name__, hex( rcvd[-1].dgmId )
+    ErrorDatagram 0xbad
+    >>> # A truncated datagram is counted and dropped.
+    >>> srv.dispatch( chr( DS_DGM_UNIQUE ) + (11 * "\\0"), None )
+    False
+    >>> print srv.badCount
+    1
+    >>> srv.close(); cli.close()
+  """
+  def __init__( self, IP='', port=DS_PORT, defrag=None ):
+    """Create and bind an NBT Datagram Service endpoint.
+
+    Input:
+      IP      - The local interface address to which the socket will be
+                bound, in dotted-quad notation.  The empty string binds
+                to all interfaces.
+      port    - The local UDP port number.  Zero selects an ephemeral
+                port, which is handy for testing.
+      defrag  - A <Defrag> pool, or None.  If None, a new pool is
+                created with default settings.
+
+    Errors:
+      socket.error  - Raised if the socket cannot be created or bound.
+    """
+    self.sock = socket.socket( socket.AF_INET, socket.SOCK_DGRAM )
+    self.sock.setsockopt( socket.SOL_SOCKET, socket.SO_BROADCAST, 1 )
+    self.sock.bind( (IP, port) )
+    self.sock.setblocking( 0 )
+
+    IP, port      = self.sock.getsockname()
+    self.srcIP    = socket.inet_aton( IP )
+    self.srcPort  = port
+    self.defrag   = Defrag() if( defrag is None ) else defrag
+    self.index    = MailslotIndex( self.srcIP, self.srcPort )
+    self.default  = None
+    self.rcvSize  = _RCV_SIZE
+    self.sendErrors = True
+
+    self.rcvCount = self.msgCount = self.badCount = 0
+    self.dropCount = self.sndCount = self.errCount = 0
+
+    # <_outQ>     - Packets that could not be sent without blocking.
+    # <_dgmId>    - The most recently used datagram ID.
+    self._outQ     = deque()
+    self._dgmId    = 0
+
+  def fileno( self ):
+    """Return the socket file descriptor, for use with select() et. al.
+    """
+    return( self.sock.fileno() )
+
+  def close( self ):
+    """Close the endpoint socket.
+    """
+    self.sock.close()
+
+  def register( self, dstName=None, handler=None, mailslot=None ):
+    """Register a handler for a destination name and/or mailslot.
+
+    Input:
+      dstName   - The fully qualified, L2-encoded destination NBT name,
+                  or None to match any destination.
+      handler   - A callable, which will be called with a message object
+                  and the (IP, port) tuple from which it was received.
+      mailslot  - A mailslot name, or None to match any (or no)
+                  mailslot.
+
+    Notes:  See <MailslotIndex.add()>.
+    """
+    self.index.add( dstName, handler, mailslot )
+
+  def unregister( self, dstName=None, mailslot=None ):
+    """Remove the handler for a destination name and/or mailslot.
+
+    Input:
+      dstName   - The L2-encoded destination NBT name, or None.
+      mailslot  - The mailslot name, or None.
+
+    Output: True if a handler was removed, else False.
+    """
+    return( self.index.remove( dstName, mailslot ) )
+
+  def nextDgmId( self ):
+    """Return the next datagram ID in sequence.
+    """
+    self._dgmId = (self._dgmId + 1) & 0xFFFF
+    return( self._dgmId )
+
+  def dispatch( self, pkt=None, addr=None ):
+    """Parse, reassemble, and dispatch a single received packet.
+
+    Input:
+      pkt   - The received packet, as a string of octets.
+      addr  - The (IP, port) tuple from which the packet was received.
+
+    Output: True if a complete message was passed to a handler, else
+            False.
+
+    Notes:  Packets that cannot be parsed are counted and dropped.  The
+            Datagram Service is unreliable by design, so there is no
+            one to complain to.
+    """
+    try:
+      msg = ParseDgm( pkt, fast=True )
+    except (ValueError, TypeError, AssertionError, NBTerror):
+      self.badCount += 1
+      return( False )
+
+    if( isinstance( msg, (DSFragRecord, DSFragment) ) ):
+      msg = self.defrag.addFrag( msg )
+      if( msg is None ):
+        return( False )
+
+    handler = None
+    if( isinstance( msg, DSMessage ) ):
+      handler = self.index.lookup( msg.dstName, msg.usrData )
+    if( handler is None ):
+      handler = self.default
+      if( handler is None ):
+        self.dropCount += 1
+        if( self.sendErrors and (DS_DGM_UNIQUE == msg.msgType)
+            and (msg.dstName not in self.index) ):
+          self._send( self.index.errorReply( msg.dgmId ), addr )
+          self.errCount += 1
+        return( False )
+
+    self.msgCount += 1
+    handler( msg, addr )
+    return( True )
+
+  def handleRead( self, maxCount=64 ):
+    """Read and dispatch pending packets.
+
+    Input:  maxCount  - The maximum number of packets to read before
+                        returning.  This keeps a busy socket from
+                        starving the rest of the event loop.
+
+    Output: The number of packets read.
+    """
+    recvfrom = self.sock.recvfrom
+    rcvSize  = self.rcvSize
+    count    = 0
+    while( count < maxCount ):
+      try:
+        pkt, addr = recvfrom( rcvSize )
+      except socket.error as e:
+        if( e.args[0] in _AGAIN ):
+          break
+        raise
+      count += 1
+      self.dispatch( pkt, addr )
+    self.rcvCount += count
+    return( count )
+
+  def sendTo( self, msg=None, addr=None, dgmId=None ):
+    """Compose and send a datagram service message.
+
+    Input:
+      msg   - A <DSMessage> (Unique, Group, or Broadcast datagram), or
+              any other Datagram Service message object that provides a
+              compose() method.
+      addr  - The (IP, port) tuple to which the message is sent.
+      dgmId - If None, the next datagram ID in sequence is used.
+              Otherwise, the given datagram ID is used.
+
+    Output: The number of UDP packets (fragments) that were composed.
+
+    Notes:  The SOURCE_IP and SOURCE_PORT of a <DSMessage> are filled
+            in from the endpoint, unless they have already been set.
+
+            <DSMessage> fragments are sent directly from a reusable
+            buffer using <DSMessage.sendAll()>.  Packets that cannot be
+            sent without blocking are copied and queued, and will be
+            sent by <handleWrite()>.
+    """
+    if( dgmId is None ):
+      dgmId = self.nextDgmId()
+    if( isinstance( msg, DSMessage ) ):
+      if( msg.srcIP == (4 * '\0') ):
+        msg.srcIP   = self.srcIP
+        msg.srcPort = self.srcPort
+      return( msg.sendAll( self._send, addr, dgmId ) )
+    self._send( msg.compose( dgmId ), addr )
+    return( 1 )
+
+  def _send( self, pkt, addr ):
+    # Send a single packet, or queue it if the socket would block.
+    #
+    # Input:
+    #   pkt   - The packet, as a string or a memoryview.  Memoryviews
+    #           are copied if the packet is queued, since the buffer
+    #           underneath may be reused as soon as we return.
+    #   addr  - The (IP, port) destination address.
+    #
+    if( not self._outQ ):
+      try:
+        self.sock.sendto( pkt, addr )
+        self.sndCount += 1
+        return
+      except socket.error as e:
+        if( e.args[0] not in _AGAIN ):
+          raise
+    if( isinstance( pkt, memoryview ) ):
+      pkt = pkt.tobytes()
+    self._outQ.append( (pkt, addr) )
+
+  def wantWrite( self ):
+    """Return True if there are queued packets waiting to be sent.
+    """
+    return( bool( self._outQ ) )
+
+  def handleWrite( self ):
+    """Send queued packets until the queue is empty or the socket blocks.
+
+    Output: The number of packets sent.
+    """
+    outQ  = self._outQ
+    count = 0
+    while( outQ ):
+      pkt, addr = outQ[0]
+      try:
+        self.sock.sendto( pkt, addr )
+      except socket.error as e:
+        if( e.args[0] in _AGAIN ):
+          break
+        raise
+      outQ.popleft()
+      count += 1
+    self.sndCount += count
+    return( count )
+
+  def poll( self, timeout=None ):
+    """Run a single pass of a select() loop on this endpoint.
+
+    Input:  timeout - Maximum time to wait, in seconds, or None to
+                      wait indefinitely.
+
+    Output: The number of packets read.
+    """
+    wlist = [ self ] if( self._outQ ) else []
+    rlist, wlist, xlist = select.select( [ self ], wlist, [], timeout )
+    if( wlist ):
+      self.handleWrite()
+    if( rlist ):
+      return( self.handleRead() )
+    return( 0 )
+
+
+class MailslotIndex( object ):
+  """Map destination names and mailslot names to handlers.
+
+  Handlers may be registered for:
+    * A destination name and a mailslot name,
+    * A destination name alone (any mailslot, or no mailslot at all), or
+    * A mailslot name alone (any destination).
+
+  The destination name is the L2-encoded name, so unique, group, and
+  broadcast (wildcard) names are all matched the same way.  Mailslot
+  names are matched without regard to case.  Lookups are done in the
+  order given above, using dictionary lookups.  The mailslot name is
+  only parsed out of the message payload when a mailslot-specific
+  handler might match.
+
+  The index also keeps a precomposed Destination Name Not Present
+  (DS_ERR_NONAME) error datagram.  Replies are generated by patching the
+  DGM_ID field of a copy, so no message objects are created.
+
+  Doctest:
+    >>> dn = Name( "LOCALHOST" ).L2name
+    >>> ix = MailslotIndex( '\\x7f\\0\\0\\x01', 138 )
+    >>> ix.add( dn, lambda m, a: "host" )
+    >>> ix.add( dn, lambda m, a: "host browse", "\\\\mailslot\\\\browse" )
+    >>> ix.add( None, lambda m, a: "any browse", "\\\\MAILSLOT\\\\BROWSE" )
+    >>> def trans( slot ):
+    ...   s = '\\xffSMB\\x25' + (27 * '\\0') + chr( 17 ) + (34 * '\\0')
+    ...   return( s + '\\0\\0' + slot + '\\0' + "payload" )
+    >>> print MailslotName( trans( "\\\\MAILSLOT\\\\Net\\\\Netlogon" ) )
+    \\MAILSLOT\\NET\\NETLOGON
+    >>> print ix.lookup( dn, trans( "\\\\MAILSLOT\\\\BROWSE" ) )( 0, 0 )
+    host browse
+    >>> print ix.lookup( dn, "Not a mailslot message." )( 0, 0 )
+    host
+    >>> wn = Name( "*" ).L2name
+    >>> print ix.lookup( wn, trans( "\\\\MAILSLOT\\\\BROWSE" ) )( 0, 0 )
+    any browse
+    >>> print ix.lookup( wn, "Not a mailslot message." ), wn in ix, dn in ix
+    None False True
+    >>> print ParseDgm( ix.errorReply( 0x1234 ) ).dump()
+    Header:
+      Msg_Type....: 0x13 = Error message
+      Flags.......: 0x02
+        SNT.........: 0b00 = B node
+        FM..........: 0b10 = Unfragmented
+      DatagramID..: 0x1234 (4660)
+      Source IP...: 127.0.0.1
+      Source Port.: 138
+    Error.....: 0x82 = Destination Name Not Present
+    <BLANKLINE>
+  """
+  def __init__( self, srcIP=None, srcPort=DS_PORT, hdrSNT=DS_SNT_B ):
+    """Create an empty dispatch index.
+
+    Input:
+      srcIP   - The IPv4 address (four octets) to be placed into the
+                SOURCE_IP field of error replies.
+      srcPort - The port number to be placed into the SOURCE_PORT field
+                of error replies.
+      hdrSNT  - The Sender Node Type of error replies.
+    """
+    # <_names>  - Maps destination names (or None) to dictionaries that,
+    #             in turn, map mailslot names (or None) to handlers.
+    # <_slots>  - The number of mailslot-specific handlers registered.
+    #             If zero, there is never a need to parse the payload.
+    # <_errPkt> - The precomposed error reply.
+    self._names  = {}
+    self._slots  = 0
+    err = ErrorDatagram( hdrSNT, 0, srcIP, srcPort, DS_ERR_NONAME )
+    self._errPkt = bytearray( err.compose() )
+
+  def __contains__( self, dstName ):
+    """True if any handler is registered for the given destination name.
+    """
+    return( dstName in self._names )
+
+  def add( self, dstName=None, handler=None, mailslot=None ):
+    """Register a handler.
+
+    Input:
+      dstName   - The fully qualified, L2-encoded destination NBT name,
+                  or None to match any destination.
+      handler   - A callable, which will be called with a message object
+                  and the (IP, port) tuple from which it was received.
+      mailslot  - A mailslot name (e.g., "\\MAILSLOT\\BROWSE"), or None
+                  to match any (or no) mailslot.
+
+    Errors: ValueError  - Raised if both <dstName> and <mailslot> are
+                          None.  Use the endpoint's <default> handler
+                          to catch everything.
+
+    Notes:  Registering a handler for a name/mailslot combination that
+            already has a handler replaces the existing handler.
+    """
+    if( (dstName is None) and (mailslot is None) ):
+      raise ValueError( "A destination name or mailslot name is required." )
+    if( mailslot is not None ):
+      mailslot = mailslot.upper()
+    slots = self._names.setdefault( dstName, {} )
+    if( (mailslot is not None) and (mailslot not in slots) ):
+      self._slots += 1
+    slots[ mailslot ] = handler
+
+  def remove( self, dstName=None, mailslot=None ):
+    """Remove a handler.
+
+    Input:
+      dstName   - The destination name given when the handler was added.
+      mailslot  - The mailslot name given when the handler was added.
+
+    Output: True if a handler was removed, else False.
+    """
+    if( mailslot is not None ):
+      mailslot = mailslot.upper()
+    slots = self._names.get( dstName )
+    if( (slots is None) or (mailslot not in slots) ):
+      return( False )
+    del slots[ mailslot ]
+    if( mailslot is not None ):
+      self._slots -= 1
+    if( not slots ):
+      del self._names[ dstName ]
+    return( True )
+
+  def lookup( self, dstName=None, usrData=None ):
+    """Find the handler for a message.
+
+    Input:
+      dstName - The L2-encoded destination name of the message.
+      usrData - The message payload.
+
+    Output: The matching handler, or None.
+    """
+    slots = self._names.get( dstName )
+    if( not self._slots ):
+      return( None if( slots is None ) else slots.get( None ) )
+    mailslot = MailslotName( usrData )
+    if( slots is not None ):
+      if( mailslot in slots ):
+        return( slots[ mailslot ] )
+      if( None in slots ):
+        return( slots[ None ] )
+    slots = self._names.get( None )
+    if( (slots is not None) and (mailslot is not None) ):
+      return( slots.get( mailslot ) )
+    return( None )
+
+  def errorReply( self, dgmId=0 ):
+    """Return a composed Destination Name Not Present error datagram.
+
+    Input:  dgmId - The DGM_ID of the message being rejected.
+
+    Output: The error datagram, as a string of octets.
+    """
+    pkt = self._errPkt
+    pkt[2] = (dgmId >> 8) & 0xFF
+    pkt[3] = dgmId & 0xFF
+    return( str( pkt ) )
+
+
+# Functions ------------------------------------------------------------------ #
+#
+
+def MailslotName( usrData=None ):
+  """Extract the mailslot name from a datagram payload.
+
+  Input:  usrData - The payload of a Datagram Service message.
+
+  Output: The mailslot name, converted to upper case, or None if the
+          payload is not an SMB Transaction (mailslot) message.
+
+  Notes:  Mailslot messages are carried in SMB_COM_TRANSACTION
+          requests.  The mailslot name is the Transaction Name, which
+          follows the parameter words and the ByteCount field.  It is
+          always an OEM string, never Unicode.
+  """
+  if( (not usrData) or (len( usrData ) < _SMB_HDR_LEN + 3)
+      or (not usrData.startswith( _SMB_TRANS_PFX )) ):
+    return( None )
+  pos = _SMB_HDR_LEN + 3 + (2 * ord( usrData[_SMB_HDR_LEN] ))
+  end = usrData.find( '\0', pos )
+  if( end < 0 ):
+    return( None )
+  return( usrData[pos:end].upper() )
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=50000, size=200, frag=0 ):
+  # Measure datagram throughput between two endpoints on loopback.
+  #
+  # Input:
+  #   count - Number of messages to send.
+  #   size  - Payload size of each message.
+  #   frag  - If non-zero, the <maxData> value used to force NBT
+  #           fragmentation.
+  #
+  # Notes:  Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_DatagramEndpoint as m; m._bench()'
+  #
+  #         Sending is done in small bursts, interleaved with reading, so
+  #         that the loopback socket buffers do not overflow.
+  #
+  srv = DSEndpoint( '127.0.0.1', 0 )
+  cli = DSEndpoint( '127.0.0.1', 0 )
+  dst = srv.sock.getsockname()
+  dn  = Name( "BENCHMARK" ).L2name
+  got = [ 0 ]
+  def _count( msg, addr ):
+    got[0] += 1
+  srv.register( dn, _count )
+  dgm = DirectUniqueDatagram( DS_SNT_B, 0, None, 0,
+                              Name( "CLIENT" ).L2name, dn, ('x' * size) )
+  if( frag ):
+    dgm.maxData = frag
+  burst = max( 1, 32 / len( dgm.composeList() ) )
+
+  start = time.time()
+  sent  = 0
+  while( sent < count ):
+    for i in xrange( min( burst, count - sent ) ):
+      cli.sendTo( dgm, dst )
+    sent += i + 1
+    while( srv.poll( 0 ) ):
+      pass
+  while( srv.poll( 0.25 ) ):
+    pass
+  elapsed = time.time() - start
+
+  print "Messages sent.....: %d (%d packets)" % (count, cli.sndCount)
+  print "Messages received.: %d (%d packets)" % (got[0], srv.rcvCount)
+  print "Elapsed...........: %.3f seconds" % elapsed
+  print "Rate..............: %.0f messages/second" % (got[0] / elapsed)
+  srv.close()
+  cli.close()
+
+# ============================================================================ #
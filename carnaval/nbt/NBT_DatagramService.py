@@ -129,19 +129,24 @@ CONSTANTS:
 # Imports -------------------------------------------------------------------- #
 #
 #   struct                - Binary data packing and parsing tools.
-#   datetime              - Dates and times with microsecond resolution.
+#   bisect.bisect_right() - Binary search of a sorted list, used to place
+#                           fragments within the Defrag class.
 #   NBT_NameService.Name  - NBT Name object, for handling L2-encoded names.
+#   NBT_Core.NBTerror     - NBT exception class.
 #   NBT_Core.dLinkedList  - A doubly-linked list object, used to create an
 #                           LRU-ordered list within the Defrag class.
+#   NBT_Core.TimerWheel   - Timer wheel, used for Defrag set expiry.
 #   NBT_Core.hexstr()     - Utility to convert binary strings into human-
 #                           readable format, more or less.
 #
 
 import struct                           # Binary data handling.
-import datetime as dt                   # Timestamp handling.
 
+from bisect          import bisect_right # Sorted list search.
 from NBT_NameService import Name        # NBT Name class.
+from NBT_Core        import NBTerror    # NBT exception class.
 from NBT_Core        import dLinkedList # Doubly-linked list.
+from NBT_Core        import TimerWheel  # Timeout management.
 from common.HexDump  import hexstr      # Hexify binary values.
 
 
@@ -706,6 +711,140 @@ class DSMessage( DSHeader ):
     # Return the list of composed messages.
     return( msgList )
 
+  def composeVec( self, dgmId=None ):
+    """Generate the message fragments as scatter/gather vectors.
+
+    Input:
+      dgmID - Either None, or a 16-bit number used to map responses to
+              requests.  If None, the current value will be used.
+
+    Output: A generator.  Each item is a three-element tuple:
+              (header, names, payload)
+            <header> is the composed 14-byte header (including the
+            DGM_LEN and PACKET_OFFSET fields), <names> is the shared
+            source and destination name string, and <payload> is a
+            memoryview slice of the message payload.
+
+    Notes:  This is the gather-list version of <composeList()>.  The
+            names and the payload are never copied; the tuples are
+            suitable for passing to socket.sendmsg(), where that is
+            available.  Use <sendAll()> to send the fragments through
+            sendto().
+
+    Doctest:
+      >>> ip = chr( 192 ) + chr( 168 ) + chr( 0 ) + chr( 1 )
+      >>> sn = Name( "ZEKE" ).L2name
+      >>> dn = Name( "MILO" ).L2name
+      >>> ud = 40 * "#"
+      >>> DUD = DirectUniqueDatagram( DS_SNT_B, 3, ip, DS_PORT, sn, dn, ud )
+      >>> DUD.maxData = 16
+      >>> vecList = list( DUD.composeVec() )
+      >>> print len( vecList ), [ len( v[2] ) for v in vecList ]
+      3 [16, 16, 8]
+      >>> vecList[0][1] is vecList[2][1]
+      True
+      >>> [ h + n + p.tobytes() for h, n, p in vecList ] == DUD.composeList()
+      True
+    """
+    # (Optionally) update the message ID.
+    if( dgmId is not None ):
+      self._dgmId = (0xFFFF & int( dgmId ))
+
+    noms    = self._srcName + self._dstName
+    nomLen  = len( noms )
+    flags   = (self._hdrFlags & ~DS_FM_MASK)
+    usrLen  = len( self._usrData )
+    payload = memoryview( self._usrData )
+    m       = self._maxData
+    offset  = 0
+    flagsFM = DS_FIRST_FLAG
+    while( True ):
+      fragLen = min( m, (usrLen - offset) )
+      if( (offset + fragLen) < usrLen ):
+        flagsFM |= DS_MORE_FLAG
+      hdr = _format_DS_hdr.pack( self._msgType,
+                                 (flags | flagsFM),
+                                 self._dgmId,
+                                 self._srcIP,
+                                 self._srcPort )
+      hdr += _format_LenOff.pack( (nomLen + fragLen), offset )
+      yield( (hdr, noms, payload[offset:offset+fragLen]) )
+      offset += fragLen
+      if( offset >= usrLen ):
+        return
+      flagsFM = 0x0000
+
+  def sendAll( self, sendto=None, addr=None, dgmId=None ):
+    """Send the whole message, one fragment at a time.
+
+    Input:
+      sendto  - A function that will be called as sendto( pkt, addr )
+                for each fragment.  Typically, this is the sendto()
+                method of a UDP socket.
+      addr    - The destination address, passed through to <sendto>.
+      dgmID   - Either None, or a 16-bit number used to map responses to
+                requests.  If None, the current value will be used.
+
+    Output: The number of fragments sent.
+
+    Notes:  Each fragment is built in a single, reusable bytearray.
+            The names are copied into the buffer once; for each
+            fragment, only the header is packed and the payload slice
+            is copied.  <pkt> is passed to <sendto> as a memoryview of
+            the buffer, so it is only valid until <sendto> returns.
+            Callers that need to hold on to a packet must copy it
+            (e.g., using pkt.tobytes()).
+
+    Doctest:
+      >>> ip = chr( 192 ) + chr( 168 ) + chr( 0 ) + chr( 1 )
+      >>> sn = Name( "ZEKE" ).L2name
+      >>> dn = Name( "MILO" ).L2name
+      >>> ud = 40 * "#"
+      >>> DUD = DirectUniqueDatagram( DS_SNT_B, 3, ip, DS_PORT, sn, dn, ud )
+      >>> DUD.maxData = 16
+      >>> sent = []
+      >>> DUD.sendAll( lambda pkt, addr: sent.append( pkt.tobytes() ) )
+      3
+      >>> sent == DUD.composeList()
+      True
+    """
+    if( dgmId is not None ):
+      self._dgmId = (0xFFFF & int( dgmId ))
+
+    # Set up the buffer, with the names in place.
+    noms    = self._srcName + self._dstName
+    nomLen  = len( noms )
+    usrPos  = 14 + nomLen
+    usrData = self._usrData
+    usrLen  = len( usrData )
+    m       = self._maxData
+    buf     = bytearray( usrPos + min( m, usrLen ) )
+    buf[14:usrPos] = noms
+    bufView = memoryview( buf )
+    payload = memoryview( usrData )
+
+    flags   = (self._hdrFlags & ~DS_FM_MASK)
+    offset  = 0
+    flagsFM = DS_FIRST_FLAG
+    count   = 0
+    while( True ):
+      fragLen = min( m, (usrLen - offset) )
+      if( (offset + fragLen) < usrLen ):
+        flagsFM |= DS_MORE_FLAG
+      _format_DS_hdr.pack_into( buf, 0, self._msgType,
+                                        (flags | flagsFM),
+                                        self._dgmId,
+                                        self._srcIP,
+                                        self._srcPort )
+      _format_LenOff.pack_into( buf, 10, (nomLen + fragLen), offset )
+      buf[usrPos:usrPos+fragLen] = payload[offset:offset+fragLen]
+      sendto( bufView[:usrPos+fragLen], addr )
+      count  += 1
+      offset += fragLen
+      if( offset >= usrLen ):
+        return( count )
+      flagsFM = 0x0000
+
 
 class DSFragment( DSMessage ):
   """Datagram Message Fragment class.
@@ -849,6 +988,49 @@ class DSFragment( DSMessage ):
     return( hdr + lenOff + body )
 
 
+class DSFragRecord( object ):
+  """Lightweight received fragment record.
+
+  This is a stripped-down, read-mostly stand-in for a <DSFragment>,
+  returned by <ParseDgm()> when the <fast> option is used.  There are
+  no validating properties; the fields are filled in directly from the
+  received message and are only meant to be handed to <Defrag.addFrag()>.
+
+  Instance Attributes:
+    key       - The fragment set key.  This is the raw message header
+                with the F and M bits cleared, followed by the raw
+                source and destination names.  All fragments of the
+                same message have the same key.
+    msgType   - The Header.MSG_TYPE field.
+    hdrSNT    - The Sender Node Type subfield of Header.FLAGS.
+    hdrFM     - The First and More bits of Header.FLAGS.
+    dgmId     - The Header.DGM_ID field.
+    srcIP     - The source IPv4 address, as a string of four octets.
+    srcPort   - The source UDP port.
+    pktOffset - The offset of the <usrData> within the whole payload.
+    srcName   - The L2-encoded source name.
+    dstName   - The L2-encoded destination name.
+    usrData   - The message payload fragment.
+
+  Doctest:
+    >>> ip = chr( 192 ) + chr( 168 ) + chr( 0 ) + chr( 1 )
+    >>> sn = Name( "MOONBEAM" ).L2name
+    >>> dn = Name( "KAPOOR" ).L2name
+    >>> ud = (8 * "Asynchonous double buffer.  " ).rstrip()
+    >>> DUD = DirectUniqueDatagram( DS_SNT_P, 2, ip, DS_PORT, sn, dn, ud )
+    >>> DUD.maxData = 196
+    >>> frag = ParseDgm( DUD.composeList()[1], fast=True )
+    >>> print type( frag ).__name__, frag.hdrFM, frag.pktOffset
+    DSFragRecord 0 196
+    >>> frag.usrData == ud[196:]
+    True
+    >>> frag.key == ParseDgm( DUD.composeList()[0], fast=True ).key
+    True
+  """
+  __slots__ = ( "key", "msgType", "hdrSNT", "hdrFM", "dgmId", "srcIP",
+                "srcPort", "pktOffset", "srcName", "dstName", "usrData" )
+
+
 class DirectUniqueDatagram( DSMessage ):
   """Direct Unique (unicast) datagram class.
 
@@ -1567,15 +1749,32 @@ class Defrag( object ):
   of fragments that have matching metadata (message type, datagram Id,
   Sending Node Type, source IP and port, called and calling names).
 
-  Fragment sets that have timed out are removed lazily.  Each time a
-  fragment is added, the oldest sets in the pool are checked.  Sets that
-  have timed out, are thrown out of the pool (deleted).  By default, the
-  two eldest sets are checked, but this is a tunable parameter.  You can
+  Each set has a timer, kept on a timer wheel that is driven by a
+  monotonic clock.  Fragment sets that have timed out are removed lazily.
+  Each time a fragment is added, the wheel is checked and (by default)
+  up to two expired sets are thrown out of the pool (deleted).  You can
   also call the <checkTimeout()> method directly.
 
+  The pool also limits the memory it will use.  There is a byte budget
+  for the pool as a whole; when a new fragment would exceed the budget,
+  the least recently updated sets are evicted until there is room.
+  There is also a per-source quota, which keeps any one source IP from
+  hogging the pool.  Fragments that would exceed the quota are refused.
+
   Properties:
-    timeout - Get/set fragment pool timeout value, in milliseconds.
-    ckCount - Get/set the timeout check retry count.
+    timeout   - Get/set fragment pool timeout value, in milliseconds.
+    ckCount   - Get/set the number of expired sets removed per add.
+    maxBytes  - Get/set the pool-wide byte budget.
+    srcQuota  - Get/set the per-source byte quota.
+    byteCount - Get the number of bytes currently held.
+
+  Instance Attributes:
+    completed - Number of messages successfully reassembled.
+    expired   - Number of sets removed because they timed out.
+    evicted   - Number of sets removed to stay within <maxBytes>.
+    refused   - Number of fragments dropped due to resource limits.
+    discarded - Number of sets removed due to overlapping fragments or
+                an oversized payload.
 
   Doctest:
     >>> # Define source and destination addresses.
@@ -1611,6 +1810,38 @@ class Defrag( object ):
     Payload Size: 478
     Called Name.: [ FCFFECFJCACACACACACACACACACACACA\\x00]
     Payload Okay: True
+    >>> # An overlapping (here, duplicate) fragment spoils the set.
+    >>> DgmList = DGD.composeList()
+    >>> print fs.addFrag( ParseDgm( DgmList[0] ) ), len( fs._fsetDict )
+    None 1
+    >>> print fs.addFrag( ParseDgm( DgmList[0] ) ), len( fs._fsetDict )
+    None 0
+    >>> # So does a fragment that would take the payload past 512 bytes.
+    >>> f = ParseDgm( DgmList[1] )
+    >>> f.pktOffset = 500
+    >>> print fs.addFrag( ParseDgm( DgmList[0] ) ), fs.addFrag( f )
+    None None
+    >>> print len( fs._fsetDict ), fs.discarded
+    0 2
+    >>> # Resource limits, using a fake clock.
+    >>> def first( dgmId, src=ip ):
+    ...   d = DirectGroupDatagram( DS_SNT_B, dgmId, src, DS_PORT, sn, dn, ud )
+    ...   d.maxData = 16
+    ...   return( ParseDgm( d.composeList()[0] ) )
+    >>> now = [ 0.0 ]
+    >>> fs = Defrag( 1000, maxBytes=64, srcQuota=48, clock=lambda: now[0] )
+    >>> for i in range( 4 ):
+    ...   result = fs.addFrag( first( i ) )
+    >>> print len( fs ), fs.byteCount, fs.refused
+    3 48 1
+    >>> ip2 = ip[:3] + chr( 2 )
+    >>> result = fs.addFrag( first( 5, ip2 ) )
+    >>> result = fs.addFrag( first( 6, ip2 ) )
+    >>> print len( fs ), fs.byteCount, fs.evicted
+    4 64 1
+    >>> now[0] += 1.5
+    >>> print fs.checkTimeout(), len( fs ), fs.byteCount, fs.expired
+    4 0 0 4
   """
   class _fragSet( object ):
     # Maintain a matching set of fragments.
@@ -1627,6 +1858,15 @@ class Defrag( object ):
     #   * Source IP address and port number,
     #   * Calling and Called names.
     #
+    # Fragment payloads are copied, as they arrive, directly into their
+    # final position within a single reassembly buffer.  The set only
+    # keeps track of which byte ranges (spans) of the buffer have been
+    # filled.  Neighboring spans are merged as they are added, and the
+    # span list is kept sorted so that the insertion point can be found
+    # using a binary search.  Reassembly time is, therefore, proportional
+    # to the size of the payload rather than the square of the number of
+    # fragments.
+    #
 
     def __init__( self, key=None, frag=None ):
       # Create a new fragment set.
@@ -1647,8 +1887,12 @@ class Defrag( object ):
 
       # Initialize fields.
       self._key       = key                   # Dictionary key.
-      self._fsList    = None                  # Fragment list.
-      self._timestamp = dt.datetime.utcnow()  # Per-set timestamp.
+      self._buffer    = bytearray()           # Reassembly buffer.
+      self._starts    = []                    # Sorted span start offsets.
+      self._ends      = []                    # Matching span end offsets.
+      self._total     = None                  # Payload length, once known.
+      self._srcIP     = None                  # Source, for quota tracking.
+      self._timer     = None                  # Inactivity timer.
       self._fsAddFrag( frag )                 # Add the given fragment, if any.
 
     def _fsAddFrag( self, frag=None ):
@@ -1662,11 +1906,12 @@ class Defrag( object ):
       #         True:   Returned if the fragment was successfully added
       #                 to the set.
       #         False:  Returned to indicate that a fragment collision
-      #                 occurred (payload ranges overlapped) or that
+      #                 occurred (payload ranges overlapped), that
       #                 there is a fragment at an offset greater than a
       #                 fragment that is marked as the terminating
-      #                 (last) fragment in the set.  In either case, the
-      #                 set is invalid and should be discarded.
+      #                 (last) fragment in the set, or that the payload
+      #                 would exceed the 512 byte NetBIOS limit.  In any
+      #                 case, the set is invalid and should be discarded.
       #         A completed message will be one of the following object
       #         types:
       #           * DirectUniqueDatagram
@@ -1677,61 +1922,59 @@ class Defrag( object ):
         # Don't waste time with empty fragments.
         return( True )
 
-      # Create a fragment tuple.  An <_fsList> tuple contains the following:
-      #     * The payload offset.
-      #     * The offset of the next fragment, or zero (0) if this is
-      #       the last fragment in the set.
-      #     * The fragment content (payload).
-      if( frag.hdrFM & DS_MORE_FLAG ):
-        nextFrag = frag.pktOffset + len( frag.usrData )
-      else:
-        nextFrag = 0
-      fragTuple = (frag.pktOffset, nextFrag, frag.usrData)
-
-      # If the list is empty add the tuple, update the timestamp, and return.
-      if( not self._fsList ):
-        self._fsList    = [ fragTuple ]
-        self._timestamp = dt.datetime.utcnow()
-        return( True )
-
-      # Non-empty list.
-      #   Figure out where the new tuple fits in the list.
-      i = 0
-      llen = len( self._fsList )
-      while( (i < llen) and (self._fsList[i][0] < frag.pktOffset) ):
-        i += 1
-
-      # Can we merge the tuple with a right-hand neighbor?
-      if( i < llen ):
-        # There is at least one tuple greater than the new one.
-        if( fragTuple[1] == self._fsList[i][0] ):
-          # Merge them.
-          oldFrag   = self._fsList.pop( i )
-          fragTuple = (fragTuple[0], oldFrag[1], (fragTuple[2] + oldFrag[2]))
-        elif( (0 == fragTuple[1]) or (fragTuple[1] > self._fsList[i][0]) ):
-          # Overlapping fragments, or a fragment beyond the terminal fragment.
+      # The span covered by the new fragment.
+      data   = frag.usrData
+      start  = frag.pktOffset
+      end    = start + len( data )
+      starts = self._starts
+      ends   = self._ends
+
+      # An oversized payload can only be the result of testing or evil
+      # intent.  Either way, it is not passed along.
+      if( end > 512 ):
+        return( False )
+
+      # Check the fragment against the terminal fragment (if any).
+      if( not (frag.hdrFM & DS_MORE_FLAG) ):
+        if( (self._total is not None) or (ends and (ends[-1] > end)) ):
+          # A second terminal fragment, or data beyond the terminus.
           return( False )
-        # else: the new and found fragments are not immediate neighbors.
-
-      # Can we merge the tuple with a left-hand neighbor?
-      if( i > 0 ):
-        j = i - 1                         # Left neighbor index.
-        lnNextOffset = self._fsList[j][1] # Left neighbor's next packet offset.
-        # There is at least one tuple less than the new one.
-        if( lnNextOffset == frag.pktOffset ):
-          # Merge them.
-          oldFrag   = self._fsList.pop( j )
-          i         = j
-          fragTuple = (oldFrag[0], fragTuple[1], (oldFrag[2]+fragTuple[2]))
-        elif( (0 == lnNextOffset) or (lnNextOffset > fragTuple[0]) ):
-          # Overlapping fragments, or a fragment beyond the terminal fragment.
-          return( False )
-        # else: the new and found fragments are not immediate neighbors.
+        self._total = end
+      elif( (self._total is not None) and (end > self._total) ):
+        # A fragment beyond the terminal fragment.
+        return( False )
+
+      # Find the insertion point, and check for overlap with the left and
+      # right neighbors (if any).
+      i = bisect_right( starts, start )
+      if( ((i > 0) and (ends[i-1] > start)) or
+          ((i < len( starts )) and (starts[i] < end)) ):
+        return( False )
+
+      # Copy the payload into place, growing the buffer as needed.
+      buf = self._buffer
+      if( end > len( buf ) ):
+        buf.extend( bytearray( end - len( buf ) ) )
+      buf[start:end] = data
+
+      # Record the span, merging with neighbors where they touch.
+      joinL = ((i > 0) and (ends[i-1] == start))
+      joinR = ((i < len( starts )) and (starts[i] == end))
+      if( joinL and joinR ):
+        ends[i-1] = ends[i]
+        del starts[i], ends[i]
+      elif( joinL ):
+        ends[i-1] = end
+      elif( joinR ):
+        starts[i] = start
+      else:
+        starts.insert( i, start )
+        ends.insert( i, end )
 
       # If the new fragment completes the set, we can create the message
       # object and return it.  The set is then no longer needed.
-      if( 0 == fragTuple[0] == fragTuple[1] ):
-        # Our current tuple represents a completed message.
+      if( (1 == len( starts )) and (0 == starts[0]) and
+          (ends[0] == self._total) ):
         # What type of message are we re-creating?
         if( DS_DGM_BCAST == frag.msgType ):
           klas = BroadcastDatagram
@@ -1740,58 +1983,58 @@ class Defrag( object ):
         else:
           klas = DirectUniqueDatagram
         # Create and return the fragment set message object.
-        return( klas( hdrSNT  = frag.hdrSNT,
-                      dgmId   = frag.dgmId,
-                      srcIP   = frag.srcIP,
-                      srcPort = frag.srcPort,
-                      srcName = frag.srcName,
-                      dstName = frag.dstName,
-                      usrData = fragTuple[2] ) )
-
-      # else: Place the tuple into the set at position <i>, then
-      #       update the timestamp, and return successfully.
-      self._fsList.insert( i, fragTuple )
-      self._timestamp = dt.datetime.utcnow()
+        #   The payload is assigned directly; its length has already been
+        #   checked, and the setter would make a second copy.
+        msg = klas( hdrSNT  = frag.hdrSNT,
+                    dgmId   = frag.dgmId,
+                    srcIP   = frag.srcIP,
+                    srcPort = frag.srcPort,
+                    srcName = frag.srcName,
+                    dstName = frag.dstName )
+        msg._usrData = str( buf[:self._total] )
+        return( msg )
+
+      # Not done yet.
       return( True )
 
-    def _fsExpired( self, timmy=None ):
-      # Determine whether or not the set has timed out.
-      #
-      # Input:
-      #   timmy - The timeout value, as a datetime.timedelta object.
-      #
-      # Output: True if the difference between then and now is greater than
-      #         <timmy>, else False.
-      #
-      if( (dt.datetime.utcnow() - self._timestamp) > timmy ):
-        return( True )
-      return( False )
-
   # Defrag class methods...
   #
-  def __init__( self, timeout=5000, ckCount=2 ):
+  def __init__( self, timeout  = 5000,
+                      ckCount  = 2,
+                      maxBytes = 0x400000,
+                      srcQuota = 0x40000,
+                      clock    = None ):
     """Create and initialize a Defrag pool.
 
     Input:
-      timeout - Fragment list inactivity timeout, in milliseconds.
-                Values less than 250 are stored as 250.  Values greater
-                than 65,535 are set to 65,535 (sixty-five and a half
-                seconds-ish).  The default timeout is 5000 (5 seconds).
-      ckCount - Unless disabled, <checkTimeout()> is called each time a
-                fragment is added to the pool.  By default, it is called
-                twice per call to <addFrag()>, which should be just a
-                little bit more than enough to keep the pool clean.
-                Setting this value to zero disables the timeout check.
+      timeout   - Fragment list inactivity timeout, in milliseconds.
+                  Values less than 250 are stored as 250.  Values greater
+                  than 65,535 are set to 65,535 (sixty-five and a half
+                  seconds-ish).  The default timeout is 5000 (5 seconds).
+      ckCount   - Unless disabled, <checkTimeout()> is called each time a
+                  fragment is added to the pool.  This is the maximum
+                  number of expired sets that will be removed per call
+                  to <addFrag()>.  The default is 2, which should be just
+                  a little bit more than enough to keep the pool clean.
+                  Setting this value to zero disables the timeout check.
+      maxBytes  - The maximum number of payload buffer bytes held by the
+                  pool, across all sets.  The default is 4MiB.  Zero
+                  means no limit.
+      srcQuota  - The maximum number of payload buffer bytes held on
+                  behalf of any single source IP.  The default is
+                  256KiB.  Zero means no limit.
+      clock     - A function returning the current time in seconds.
+                  This is for testing; the default is <monoClock()>.
 
     Errors:
       ValueError      - Raised if the input value cannot be converted to
                         an integer.
-      AssertionError  - Raised if either input is negative.
+      AssertionError  - Raised if any input is negative.
     """
     # <timeout>   - The number of milliseconds (1/1000 sec) that must have
     #               elapsed since the last update to a fragment set before
     #               the fragment set is considered to have timed out.
-    # <ckCount>   - The number of LRU fragment sets to be checked each
+    # <ckCount>   - The number of expired fragment sets to be removed each
     #               time a new fragment is added to the pool.
     # <_fsetDict> - A dictionary to map fragment keys to fragSets.  The
     #               keys are formed from message header fields.  The
@@ -1800,20 +2043,37 @@ class Defrag( object ):
     #               sets of fragments.
     # <_fsetLRU>  - A doubly-linked list used to keep the <_fragSet>
     #               instances in order from most recently to least
-    #               recently used.
+    #               recently used.  Sets are evicted from the tail when
+    #               the byte budget is exceeded.
+    # <_wheel>    - A TimerWheel, holding one timer per fragment set.
+    # <_srcBytes> - Maps source IPs to the number of bytes held.
+    # <_byteCount>- Total number of buffer bytes held.
     #
-    self.timeout = timeout
-    self.ckCount = ckCount
-    self._fsetDict = {}
-    self._fsetLRU  = dLinkedList()
+    self._wheel     = TimerWheel( 0.125, 512, clock )
+    self.timeout    = timeout
+    self.ckCount    = ckCount
+    self.maxBytes   = maxBytes
+    self.srcQuota   = srcQuota
+    self._fsetDict  = {}
+    self._fsetLRU   = dLinkedList()
+    self._srcBytes  = {}
+    self._byteCount = 0
+    # Statistics.
+    self.completed = self.expired = self.evicted = 0
+    self.refused   = self.discarded = 0
+
+  def __len__( self ):
+    """The number of incomplete fragment sets in the pool."""
+    return( len( self._fsetDict ) )
 
   def addFrag( self, frag=None ):
     """Add a fragment to the fragment pool.
 
-    Input:  frag  - A DSFragment message fragment object.
+    Input:  frag  - A DSFragment message fragment object, or a
+                    DSFragRecord as returned by ParseDgm( msg, True ).
 
     Errors: AssertionError  - Raised if the input is not a DSFragment
-                              object.
+                              or DSFragRecord object.
 
     Output: If the input fragment completes a message, the message is
             returned (and the fragments are removed from the pool).
@@ -1822,58 +2082,143 @@ class Defrag( object ):
               * DirectGroupDatagram
               * BroadcastDatagram
             Otherwise, None is returned.
+
+    Notes:  A fragment that would push its source over the <srcQuota>
+            is refused (dropped).  A fragment that would push the pool
+            over <maxBytes> causes the least recently updated sets to be
+            evicted until there is room.
     """
-    # Sanity check.
-    assert( isinstance( frag, DSFragment ) ), \
-      "Expected a DSFragment, not type %s." % type( frag ).__name__
-
-    # Create the key by re-creating the header structure and adding
-    # the calling and called names.  This could be short-circuted if
-    # we used the actual message header (with FM bits removed) instead
-    # of parsing it and then rebuilding it.
-    key = _format_DS_hdr.pack( frag.msgType,
-                               frag.hdrSNT,  # FM bits *NOT* in the key.
-                               frag.dgmId,
-                               frag.srcIP,
-                               frag.srcPort )
-    key += frag.srcName + frag.dstName
-
-    # Add the fragment to the fragment pool.
-    if( key in self._fsetDict ):
-      # There is already a matching fragment set.
-      node = self._fsetDict[ key ]
-      self._fsetLRU.remove( node )
-      result = node.Data._fsAddFrag( frag )
-      if( True == result ):
-        # Re-insert the node at the top of the LRU queue.
-        self._fsetLRU.insert( node )
-      else:
-        # Delete the dictionary entry; the fragSet is no longer in use.
-        del self._fsetDict[ key ]
-        if( False == result ):
-          return( None )  # A mangled fragSet has been deleted.
-        return( result )  # Successfully defragged a message.
+    # Clear out some of the dead wood first, to make room.
+    if( self._ckCount ):
+      self.checkTimeout( self._ckCount )
+
+    if( isinstance( frag, DSFragRecord ) ):
+      # The key was sliced out of the received message by ParseDgm().
+      key = frag.key
     else:
+      # Create the key by re-creating the header structure and adding
+      # the calling and called names.
+      assert( isinstance( frag, DSFragment ) ), \
+        "Expected a DSFragment, not type %s." % type( frag ).__name__
+      key = _format_DS_hdr.pack( frag.msgType,
+                                 frag.hdrSNT,  # FM bits *NOT* in the key.
+                                 frag.dgmId,
+                                 frag.srcIP,
+                                 frag.srcPort )
+      key += frag.srcName + frag.dstName
+
+    # Find the matching fragment set, if any, and figure out how much the
+    # set's buffer will need to grow to hold the new fragment.
+    node = self._fsetDict.get( key )
+    grow = frag.pktOffset + len( frag.usrData )
+    if( node is not None ):
+      grow -= len( node.Data._buffer )
+    if( (grow > 0) and not self._reserve( frag.srcIP, grow, node ) ):
+      self.refused += 1
+      return( None )
+
+    if( node is None ):
       # No matching fragment set; create one and add it at the top of the list.
-      node = self._fsetLRU.Node( self._fragSet( key, frag ) )
+      fset = self._fragSet( key )
+      fset._srcIP = frag.srcIP
+      fset._timer = self._wheel.start( None, self._timeout )
+      node = self._fsetLRU.Node( fset )
+      fset._timer.Data = node
       self._fsetLRU.insert( node )
-      self._fsetDict[ key ] = self._fsetLRU.Head
+      self._fsetDict[ key ] = node
+    else:
+      # There is already a matching fragment set.
+      fset = node.Data
+      self._fsetLRU.remove( node )
+      self._fsetLRU.insert( node )
+      self._wheel.restart( fset._timer, self._timeout )
+
+    # Add the fragment to the set.
+    before = len( fset._buffer )
+    result = fset._fsAddFrag( frag )
+    self._charge( fset._srcIP, len( fset._buffer ) - before )
+    if( result is True ):
+      return( None )  # Fragment was added to the pool, no message generated.
+
+    # Delete the set; it is no longer in use.
+    self._dropSet( node )
+    if( result is False ):
+      self.discarded += 1
+      return( None )  # A mangled fragSet has been deleted.
+    self.completed += 1
+    return( result )  # Successfully defragged a message.
+
+  def checkTimeout( self, limit=None ):
+    """Remove fragment sets that have timed out.
+
+    Input:  limit - The maximum number of sets to remove, or None to
+                    remove all expired sets.
+
+    Output: The number of fragment sets that were removed.
+    """
+    expired = self._wheel.expire( limit )
+    for timer in expired:
+      self._dropSet( timer.Data )
+    self.expired += len( expired )
+    return( len( expired ) )
+
+  def _charge( self, srcIP, nBytes ):
+    # Adjust the byte counts for a source IP and for the pool as a whole.
+    #
+    # Input:
+    #   srcIP   - The source IP address of the fragment set.
+    #   nBytes  - The (possibly negative) number of bytes to add.
+    #
+    if( nBytes ):
+      self._byteCount += nBytes
+      held = self._srcBytes.get( srcIP, 0 ) + nBytes
+      if( held > 0 ):
+        self._srcBytes[ srcIP ] = held
+      else:
+        self._srcBytes.pop( srcIP, None )
 
-    # Call checkTimeout().
-    i = self._ckCount
-    while( (i > 0) and self.checkTimeout() ):
-      i -= 1
-    return( None )  # Fragment was added to the pool, no message was generated.
+  def _reserve( self, srcIP, nBytes, node ):
+    # Make room for <nBytes> more bytes on behalf of <srcIP>.
+    #
+    # Input:
+    #   srcIP   - The source IP address of the incoming fragment.
+    #   nBytes  - The number of buffer bytes the fragment needs.
+    #   node    - The LRU node of the set to which the fragment will be
+    #             added, or None for a new set.  This set is never
+    #             evicted to make room for itself.
+    #
+    # Output: True if there is room, else False.
+    #
+    if( self._srcQuota and
+        ((self._srcBytes.get( srcIP, 0 ) + nBytes) > self._srcQuota) ):
+      return( False )
+    if( self._maxBytes ):
+      if( nBytes > self._maxBytes ):
+        return( False )
+      while( (self._byteCount + nBytes) > self._maxBytes ):
+        eldest = self._fsetLRU.Tail
+        if( eldest is node ):
+          return( False )
+        self._dropSet( eldest )
+        self.evicted += 1
+    return( True )
+
+  def _dropSet( self, node ):
+    # Remove a fragment set from the pool and release its resources.
+    #
+    # Input:  node  - The LRU node containing the set.
+    #
+    fset = node.Data
+    del self._fsetDict[ fset._key ]
+    self._fsetLRU.remove( node )
+    self._wheel.cancel( fset._timer )
+    self._charge( fset._srcIP, -len( fset._buffer ) )
 
-  def checkTimeout( self ):
-    """Check the oldest set(s) in the pool, and delete if expired.
+  @property
+  def byteCount( self ):
+    """The number of payload buffer bytes currently held by the pool.
     """
-    node = self._fsetLRU.Tail
-    if( node and (node.Data._fsExpired( self._timeout )) ):
-      del self._fsetDict[ node.key ]
-      self._fsetLRU.remove( node )
-      return( True )
-    return( False )
+    return( self._byteCount )
 
   @property
   def timeout( self ):
@@ -1890,14 +2235,13 @@ class Defrag( object ):
             Assigned values are silently forced into the range
             250...65535.
     """
-    ms = (self._timeout.microseconds / 1000) + (1000 * self._timeout.seconds)
-    return( ms )
+    return( int( round( self._timeout * 1000 ) ) )
   @timeout.setter
   def timeout( self, timeout=None ):
     timeout = int( timeout )
     assert( timeout >= 0 ), "<timeout> cannot be negative."
     timeout = max( 250, min( timeout, 0xFFFF ) )
-    self._timeout = dt.timedelta( milliseconds=timeout )
+    self._timeout = timeout / 1000.0
 
   @property
   def ckCount( self ):
@@ -1908,8 +2252,8 @@ class Defrag( object ):
                         to an integer.
       AssertionError  - Thrown if the assigned value is negative.
 
-    Notes:  This value is used to set the maximum number of times the
-            pool will be checked for past-due sets, per call to
+    Notes:  This value is used to set the maximum number of past-due
+            sets that will be removed from the pool per call to
             addFrag().  The default is 2.
     """
     return( self._ckCount )
@@ -1919,15 +2263,54 @@ class Defrag( object ):
     assert( ckCount >= 0 ), "<ckCount> must not be negative."
     self._ckCount = ckCount
 
+  @property
+  def maxBytes( self ):
+    """Pool-wide byte budget.
+
+    Errors:
+      ValueError      - Thrown if the assigned value cannot be converted
+                        to an integer.
+      AssertionError  - Thrown if the assigned value is negative.
+
+    Notes:  Zero means that there is no limit.  Lowering the limit does
+            not immediately evict any sets.
+    """
+    return( self._maxBytes )
+  @maxBytes.setter
+  def maxBytes( self, maxBytes=None ):
+    maxBytes = int( maxBytes )
+    assert( maxBytes >= 0 ), "<maxBytes> must not be negative."
+    self._maxBytes = maxBytes
+
+  @property
+  def srcQuota( self ):
+    """Per-source byte quota.
+
+    Errors:
+      ValueError      - Thrown if the assigned value cannot be converted
+                        to an integer.
+      AssertionError  - Thrown if the assigned value is negative.
+
+    Notes:  Zero means that there is no limit.
+    """
+    return( self._srcQuota )
+  @srcQuota.setter
+  def srcQuota( self, srcQuota=None ):
+    srcQuota = int( srcQuota )
+    assert( srcQuota >= 0 ), "<srcQuota> must not be negative."
+    self._srcQuota = srcQuota
+
 
 # Functions ------------------------------------------------------------------ #
 #
 
-def ParseDgm( msg=None ):
+def ParseDgm( msg=None, fast=False ):
   """Parse an NBT Datagram Service message.
 
   Input:
-    msg - A byte string (type str) received from the network.
+    msg   - A byte string (type str) received from the network.
+    fast  - If True, fragments are returned as lightweight
+            <DSFragRecord> objects rather than <DSFragment> objects.
 
   Errors:
     NBTerror( 1005 )  - Raised if the message type cannot be determined
@@ -1940,6 +2323,7 @@ def ParseDgm( msg=None ):
           the following:
             DSFragment            - The message is a fragmented message
                                     message.
+            DSFragRecord          - A fragment, if <fast> is True.
             DirectUniqueDatagram  - A unicast datagram message message.
             DirectGroupDatagram   - A multicast datagram 2*message.
             BroadcastDatagram     - A broadcast datagram 2*message.
@@ -1955,7 +2339,57 @@ def ParseDgm( msg=None ):
           The goal is to correctly and forgivingly parse the incoming
           message, throwing an exception only when something is deeply
           wrong in a truly meaningful way.
+
+          The <fast> option is meant for receive loops that pass
+          fragments straight to a <Defrag> pool.  The fragment set key
+          is sliced directly out of the received header, and the names
+          are only checked for basic label structure.  Anything unusual
+          (such as a label string pointer) is handed off to the full
+          parser, so errors are reported in the usual way.
   """
+  def _fastFrag():
+    # Parse a fragment into a DSFragRecord, if possible.
+    #
+    # Output: A DSFragRecord, or None if the message should be passed
+    #         to the full parser instead.
+    #
+    dgmLen, pktOffset = _format_LenOff.unpack_from( msg, 10 )
+    if( len( msg ) != (dgmLen + 14) ):
+      return( None )
+    # Walk the labels of the two names.
+    names = []
+    pos   = 14
+    while( len( names ) < 2 ):
+      start  = pos
+      labLen = ord( msg[pos] ) if( pos < len( msg ) ) else 0
+      if( 0x20 != labLen ):
+        return( None )
+      while( labLen ):
+        if( labLen > 63 ):
+          return( None )
+        pos += labLen + 1
+        if( pos >= len( msg ) ):
+          return( None )
+        labLen = ord( msg[pos] )
+      pos += 1
+      if( (pos - start) > 255 ):
+        return( None )
+      names.append( msg[start:pos] )
+    frag = DSFragRecord()
+    frag.key       = msg[0] + chr( hdrFlags & DS_SNT_MASK ) + msg[2:10] \
+                   + msg[14:pos]
+    frag.msgType   = msgType
+    frag.hdrSNT    = hdrFlags & DS_SNT_MASK
+    frag.hdrFM     = hdrFlags & DS_FM_MASK
+    frag.dgmId     = dgmId
+    frag.srcIP     = srcIP
+    frag.srcPort   = srcPort
+    frag.pktOffset = pktOffset
+    frag.srcName   = names[0]
+    frag.dstName   = names[1]
+    frag.usrData   = msg[pos:]
+    return( frag )
+
   def _DGmsg():
     # Parse a message message.
     #
@@ -2031,6 +2465,13 @@ def ParseDgm( msg=None ):
 
   # We should now have enough information to determine the packet type.
   if( msgType in [ DS_DGM_UNIQUE, DS_DGM_GROUP, DS_DGM_BCAST ] ):
+    if( len( msg ) < 14 ):
+      # No room for the DGM_LENGTH and PACKET_OFFSET fields.
+      raise ValueError( "NBT datagram message header is too short." )
+    if( fast and (DS_FIRST_FLAG != (hdrFlags & DS_FM_MASK)) ):
+      frag = _fastFrag()
+      if( frag is not None ):
+        return( frag )
     return( _DGmsg() )
   elif( DS_DGM_ERROR == msgType ):
     return( ErrorDatagram( hdrFlags, dgmId, srcIP, srcPort, ord( msg[10] ) ) )
@@ -2045,4 +2486,45 @@ def ParseDgm( msg=None ):
   s = "Parsing failed, unknown message type: 0x%02X" % msgType
   raise NBTerror( 1005, s )
 
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( size=512, maxDatas=(128, 32, 8, 2, 1) ):
+  # Measure fragment reassembly time against the number of fragments.
+  #
+  # Input:
+  #   size      - The payload size.  <Defrag> discards anything larger
+  #               than the NetBIOS limit of 512 bytes.
+  #   maxDatas  - A sequence of fragment payload sizes to be tested.
+  #
+  # Notes:  Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_DatagramService as m; m._bench()'
+  #
+  #         Fragments are parsed ahead of time and added to the pool in
+  #         random order, so only the Defrag code is measured.  If the
+  #         reassembly is linear, the time per fragment should stay
+  #         (roughly) constant as the number of fragments grows.
+  #
+  from random import Random
+  from time   import time
+  rand = Random( 1 )
+  sn   = Name( "SENDER" ).L2name
+  dn   = Name( "RECEIVER" ).L2name
+  ud   = ''.join( chr( rand.randrange( 256 ) ) for i in xrange( size ) )
+  print "   Bytes  Frags  Seconds  us/frag"
+  for maxData in maxDatas:
+    dgm = DirectUniqueDatagram( DS_SNT_B, 1, None, DS_PORT, sn, dn, ud )
+    dgm.maxData = maxData
+    frags = [ ParseDgm( pkt ) for pkt in dgm.composeList() ]
+    rand.shuffle( frags )
+    pool  = Defrag()
+    start = time()
+    for frag in frags:
+      result = pool.addFrag( frag )
+    elapsed = time() - start
+    assert( result.usrData == ud ), "Reassembly failed."
+    print "%8d %6d %8.4f %8.2f" % (size, len( frags ), elapsed,
+                                  (1e6 * elapsed) / len( frags ))
+
 # ============================================================================ #
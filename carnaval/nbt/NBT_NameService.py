@@ -215,6 +215,8 @@ CONSTANTS:
 import struct                               # Binary data handling.
 
 from NBT_Core       import NBTerror         # NBT exception class.
+from NBT_Core       import monoClock        # Monotonic clock.
+from NBT_Core       import dLinkedList      # Doubly-linked list.
 from common.HexDump import hexbyte, hexstr  # Byte to hex string conversion.
 
 
@@ -2726,7 +2728,7 @@ class LocalNameTable( object ):
                             [NS_DRG, NS_CNF, NS_ACT, NS_PRM]
     """
     if( len( nom ) >= 34 ):     # An L2 encoded name with scope.
-      if( nom[:33].lower() != self._scope.lower() ):
+      if( nom[33:].lower() != self._scope.lower() ):
         return( None )
       nom = nom[1:][:32]
     elif( 32 != len( nom ) ):   # Not an L1, unscoped name.
@@ -2783,6 +2785,359 @@ class LocalNameTable( object ):
     return( tmplst )
 
 
+class GroupMemberTable( object ):
+  """Maintain the member list of an NBNS group name.
+
+  An NBNS keeps a list of member IPv4 addresses for each registered group
+  name (names registered with the NS_GROUP_BIT set) and for each Internet
+  Group (0x1C) name.  Members come and go all the time; they register,
+  refresh, and release independently of one another, and a busy domain
+  may have tens of thousands of members per name.
+
+  This class keeps the member list in a form that is cheap to update and
+  cheap to send:
+
+    * The members are stored, in wire format, as a packed array of
+      ADDR_ENTRY records (NB_FLAGS + NB_ADDRESS).  Adding a member
+      appends six bytes.  Releasing a member copies the last entry into
+      the vacated slot and truncates the array.  Refreshing a member
+      only touches the expiry list.  All three are O(1).
+
+    * A wire-format copy of the RDATA is cached, and is only rebuilt
+      when the member list has actually changed.  Queries between
+      changes are answered from the cache.
+
+    * Each member has its own expiry time (the time of its last
+      registration or refresh, plus the table TTL).  There is one
+      doubly-linked list of members for each TTL value in use.  A
+      member that is added or refreshed goes to the head of the list
+      for the current TTL, which is O(1), and each list stays in order
+      of expiry time.  Expired members are always found at the tails
+      of the lists.  The TTL rarely changes, so there are seldom more
+      than one or two lists.
+
+  Note that an NBT Name Service message sent over UDP may be no larger
+  than 576 bytes, which leaves room for fewer than ninety address
+  entries.  Over TCP, RDLENGTH (a 16-bit field) limits the answer to
+  10922 entries.  The table itself has no such limit; <compose()>
+  truncates the answer and sets the TC bit.
+
+  Properties:
+    TTL   - Get/set the member Time To Live, in seconds.
+    rdata - Get the wire-format RDATA for the whole member list.
+
+  Doctest:
+    >>> ip = lambda n: chr( 10 ) + chr( 0 ) + chr( 0 ) + chr( n )
+    >>> gmt = GroupMemberTable( TTL=300 )
+    >>> for i in range( 1, 5 ):
+    ...   gmt.add( ip( i ), NS_ONT_H, now=(1000 + i) )
+    True
+    True
+    True
+    True
+    >>> gmt.release( ip( 2 ) )
+    True
+    >>> print len( gmt ), hexstr( gmt.rdata[6:] )
+    3 \\xE0\\x00\\x0A\\x00\\x00\\x04\\xE0\\x00\\x0A\\x00\\x00\\x03
+    >>> gmt.refresh( ip( 1 ), now=1200 )
+    True
+    >>> [ hexstr( m ) for m in gmt.expire( now=1303.5 ) ]
+    ['\\\\x0A\\\\x00\\\\x00\\\\x03']
+    >>> ip( 1 ) in gmt, ip( 3 ) in gmt
+    (True, False)
+    >>> gmt.TTL = 10
+    >>> gmt.add( ip( 5 ), NS_ONT_H, now=1250 )
+    True
+    >>> [ hexstr( m ) for m in gmt.expire( now=1270 ) ]
+    ['\\\\x0A\\\\x00\\\\x00\\\\x05']
+    >>> gmt.TTL = 100
+    >>> gmt.add( ip( 6 ), NS_ONT_H, now=1250 )
+    True
+    >>> [ hexstr( m ) for m in gmt.expire( now=1400 ) ]
+    ['\\\\x0A\\\\x00\\\\x00\\\\x04', '\\\\x0A\\\\x00\\\\x00\\\\x06']
+    >>> gmt.TTL = 300
+    >>> L2name = Name( "WORKGROUP", suffix='\\x1C' ).L2name
+    >>> nqr = ParseMsg( gmt.compose( 42, L2name ) )
+    >>> print nqr.TrnId, nqr.TTL, nqr.RDlen
+    42 300 6
+    >>> for NBflags, NBaddr in nqr.AddrList:
+    ...   print "0x%04X %s" % (NBflags, hexstr( NBaddr ))
+    0xE000 \\x0A\\x00\\x00\\x01
+    >>> for i in range( 100 ):
+    ...   added = gmt.add( chr( 192 ) + chr( 168 ) + chr( 0 ) + chr( i ) )
+    >>> msg = gmt.compose( 43, L2name )
+    >>> nqr = ParseMsg( msg )
+    >>> print len( msg ), nqr.TCbit, nqr.RDlen, len( nqr.AddrList )
+    572 True 516 86
+    >>> nqr = ParseMsg( gmt.compose( 43, L2name, maxLen=0xFFFF ) )
+    >>> print nqr.TCbit, len( nqr.AddrList )
+    False 101
+  """
+  class _Member( object ):
+    # A single member of the group.
+    #
+    # Instance Attributes:
+    #   IP      - The member's IPv4 address (four octets).  This is the
+    #             dictionary key under which the member is stored.
+    #   Slot    - The index of the member's ADDR_ENTRY within the packed
+    #             RDATA array.
+    #   Expiry  - The time (a <monoClock()> value) at which the member
+    #             expires unless it is refreshed.
+    #   TTL     - The TTL used to calculate <Expiry>.  This selects the
+    #             expiry list on which the member is kept.
+    #
+    __slots__ = ( "IP", "Slot", "Expiry", "TTL" )
+
+    def __init__( self, IP, Slot, Expiry ):
+      self.IP     = IP
+      self.Slot   = Slot
+      self.Expiry = Expiry
+      self.TTL    = None
+
+  def __init__( self, G=True, TTL=259200 ):
+    """Create an empty group member table.
+
+    Input:
+      G   - Boolean; if True (the default) the NB_FLAGS.G bit is set in
+            each of the composed ADDR_ENTRY records.
+      TTL - The number of seconds that a member remains in the table
+            after it was last registered or refreshed.  This is also
+            the TTL value sent in composed query responses.  The
+            default is three days.
+
+    Errors:
+      ValueError  - Raised if <TTL> cannot be converted to an integer.
+    """
+    # <_Gbit>       - Either NS_GROUP_BIT or zero.
+    # <_memberDict> - Maps member IPv4 addresses to <dLinkedList.Node>
+    #                 objects, each of which holds a <_Member>.
+    # <_slotList>   - Maps RDATA slot numbers back to <_Member> objects, so
+    #                 that a released slot can be refilled.
+    # <_rdata>      - A packed array of ADDR_ENTRY records.
+    # <_rdCache>    - The <_rdata> as a string, or None if <_rdata> has
+    #                 changed since the string was created.
+    # <_expLists>   - Maps TTL values to lists of members, each with the
+    #                 latest expiry time first.
+    #
+    self._Gbit       = (NS_GROUP_BIT if( G ) else 0x0000)
+    self.TTL         = TTL
+    self._memberDict = {}
+    self._slotList   = []
+    self._rdata      = bytearray()
+    self._rdCache    = ''
+    self._expLists   = {}
+
+  def __len__( self ):
+    return( len( self._slotList ) )
+
+  def __contains__( self, IP ):
+    return( IP in self._memberDict )
+
+  @property
+  def TTL( self ):
+    """Member Time To Live, in seconds.
+
+    Errors:
+      ValueError  - Thrown if the assigned value cannot be converted to
+                    an integer.
+
+    Notes:  Changing the TTL does not change the expiry time of existing
+            members.  The new value is applied as members are added or
+            refreshed.  Lowering the TTL is allowed; members added or
+            refreshed afterward may expire before older members.
+    """
+    return( self._TTL )
+  @TTL.setter
+  def TTL( self, TTL=None ):
+    self._TTL = (0xFFFFFFFF & long( TTL ))
+
+  @property
+  def rdata( self ):
+    """The wire-format RDATA; a string of ADDR_ENTRY records.
+    """
+    if( self._rdCache is None ):
+      self._rdCache = str( self._rdata )
+    return( self._rdCache )
+
+  def add( self, IP=None, ONT=NS_ONT_B, now=None ):
+    """Add a member to the table, or refresh an existing member.
+
+    Input:
+      IP  - The member's IPv4 address, as a string of four octets.
+      ONT - The member's Owner Node Type; one of the NS_ONT_* values.
+      now - The current time, as a <monoClock()> value.  If None,
+            the clock is read.
+
+    Errors:
+      ValueError  - Raised if <IP> is not a four-octet string.
+
+    Output: True if a new member was added, False if an existing member
+            was refreshed.
+    """
+    if( (not isinstance( IP, str )) or (4 != len( IP )) ):
+      raise ValueError( "Member IP must be a 4-octet IPv4 address." )
+    expiry  = (monoClock() if( now is None ) else now) + self._TTL
+    NBflags = self._Gbit | (ONT & NS_ONT_MASK)
+
+    node = self._memberDict.get( IP )
+    if( node is not None ):
+      # Existing member; refresh it, and patch the flags if they changed.
+      member = node.Data
+      self._dequeue( node )
+      member.Expiry = expiry
+      self._enqueue( node )
+      pos = 6 * member.Slot
+      if( NBflags != _format_Short.unpack_from( self._rdata, pos )[0] ):
+        _format_Short.pack_into( self._rdata, pos, NBflags )
+        self._rdCache = None
+      return( False )
+
+    # New member; append an address entry.
+    member = self._Member( IP, len( self._slotList ), expiry )
+    node   = dLinkedList.Node( member )
+    self._slotList.append( member )
+    self._rdata += _format_AddrEntry.pack( NBflags, IP )
+    self._rdCache = None
+    self._enqueue( node )
+    self._memberDict[ IP ] = node
+    return( True )
+
+  def refresh( self, IP=None, now=None ):
+    """Reset the expiry time of an existing member.
+
+    Input:
+      IP  - The member's IPv4 address, as a string of four octets.
+      now - The current time, as a <monoClock()> value.  If None,
+            the clock is read.
+
+    Output: True if the member was found and refreshed, else False.
+    """
+    node = self._memberDict.get( IP )
+    if( node is None ):
+      return( False )
+    self._dequeue( node )
+    node.Data.Expiry = (monoClock() if( now is None ) else now) + self._TTL
+    self._enqueue( node )
+    return( True )
+
+  def release( self, IP=None ):
+    """Remove a member from the table.
+
+    Input:
+      IP  - The member's IPv4 address, as a string of four octets.
+
+    Output: True if the member was found and removed, else False.
+    """
+    node = self._memberDict.pop( IP, None )
+    if( node is None ):
+      return( False )
+    self._dequeue( node )
+    self._dropSlot( node.Data.Slot )
+    return( True )
+
+  def expire( self, now=None ):
+    """Remove all members whose expiry time has passed.
+
+    Input:
+      now - The current time, as a <monoClock()> value.  If None,
+            the clock is read.
+
+    Output: A list of the IPv4 addresses of the members that were
+            removed, oldest first.
+    """
+    now  = (monoClock() if( now is None ) else now)
+    gone = []
+    for TTL, expList in self._expLists.items():
+      node = expList.Tail
+      while( (node is not None) and (node.Data.Expiry <= now) ):
+        member = node.Data
+        expList.remove( node )
+        del self._memberDict[ member.IP ]
+        self._dropSlot( member.Slot )
+        gone.append( member )
+        node = expList.Tail
+      if( expList.Head is None ):
+        del self._expLists[ TTL ]
+    gone.sort( key=lambda member: member.Expiry )
+    return( [ member.IP for member in gone ] )
+
+  def _enqueue( self, node ):
+    # Insert <node> at the head of the expiry list for the current TTL.
+    # Every member on that list was added or refreshed no later than
+    # this one, so the list stays in order of descending expiry time.
+    member     = node.Data
+    member.TTL = self._TTL
+    expList    = self._expLists.get( member.TTL )
+    if( expList is None ):
+      expList = self._expLists[ member.TTL ] = dLinkedList()
+    expList.insert( node )
+
+  def _dequeue( self, node ):
+    # Remove <node> from its expiry list.  Empty lists are discarded.
+    TTL     = node.Data.TTL
+    expList = self._expLists[ TTL ]
+    expList.remove( node )
+    if( expList.Head is None ):
+      del self._expLists[ TTL ]
+
+  def members( self ):
+    """A generator that iterates the member IPv4 addresses.
+
+    Notes:  Addresses are returned in RDATA order, which is not
+            necessarily the order in which they were added.
+    """
+    for member in self._slotList:
+      yield member.IP
+
+  def compose( self, TrnId=0, L2name=None, RD=True, maxLen=576 ):
+    """Compose a positive Name Query Response from the member list.
+
+    Input:
+      TrnId   - Transaction Id, copied from the query.
+      L2name  - The L2-encoded group name, copied from the query.
+      RD      - Recursion Desired, copied from the query.
+      maxLen  - The maximum message length.  The default is the UDP
+                limit given in [RFC1002].  Pass a larger value if the
+                response will be sent via TCP.
+
+    Output: A byte string; the formatted name query response message.
+
+    Notes:  The RDATA is taken from the cached member list.  If the
+            message would be longer than <maxLen>, or if there are more
+            members than can be described by the 16-bit RDLENGTH field,
+            the address list is truncated and the TC bit is set.
+    """
+    rdata = self.rdata
+    resp  = NameQueryResponse( TrnId, RD, True, NS_RCODE_POS_RSP,
+                               L2name, self._TTL )
+    resp.RDlen = 0
+    hdrLen = len( resp.compose() )
+    limit  = min( max( 0, (maxLen - hdrLen) ), 0xFFFF ) // 6 * 6
+    if( len( rdata ) > limit ):
+      rdata = rdata[:limit]
+      resp.TCbit = True
+    resp.RDlen = len( rdata )
+    return( resp.compose() + rdata )
+
+  def _dropSlot( self, slot ):
+    # Remove an ADDR_ENTRY record from the packed RDATA array.
+    #
+    # Input:  slot  - The index of the record to be removed.
+    #
+    # Notes:  The last entry in the array is moved into the vacated slot,
+    #         so that only twelve bytes need to be touched, no matter how
+    #         large the array is.
+    #
+    last = self._slotList.pop()
+    if( last.Slot != slot ):
+      pos = 6 * slot
+      self._rdata[pos:pos+6] = self._rdata[-6:]
+      last.Slot = slot
+      self._slotList[ slot ] = last
+    del self._rdata[-6:]
+    self._rdCache = None
+
+
 # Functions ------------------------------------------------------------------ #
 #
 
@@ -0,0 +1,439 @@
+# ============================================================================ #
+#                             NBT_SessionClient.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   NetBIOS over TCP/IP (IETF STD19) implementation: NBT Session Service
+#   client-side connection handling.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - Retarget Session Responses are followed, but only up to a limit.
+#     Two servers that point at one another would otherwise keep a
+#     client busy forever.  See the notes for RetargetResponse() in
+#     NBT_SessionService.py.
+#
+# ============================================================================ #
+#
+"""NetBIOS over TCP/UDP (NBT) protocol: Session Service Client
+
+Setting up an NBT session costs a TCP connect plus a Session Request
+round trip.  If the server responds with a Retarget Session Response,
+the client must start over with another connect.
+
+The <SessionPool> cuts these costs:
+  * Sessions that are no longer needed are returned to the pool, and
+    are handed out again to later callers that want a session with the
+    same Called Name at the same address.
+  * Retarget destinations are remembered for a while, so that later
+    connects go directly to the real endpoint.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   socket              - The usual network socket stuff.
+#   select              - Check idle pooled sockets for input.
+#   time                - Timing, for the benchmark.
+#   NBT_Core            - NBT exception class, and the monotonic clock.
+#   NBT_SessionService  - Session Service message composition and parsing.
+#
+
+import socket                           # Sockets.
+import select                           # Socket readiness.
+import time                             # Benchmark timing.
+
+from NBT_Core           import NBTerror     # NBT exception class.
+from NBT_Core           import monoClock    # Monotonic clock.
+from NBT_SessionService import *            # Session Service messages.
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _KEEPALIVE  - A Session Keepalive message.
+#
+
+_KEEPALIVE = Keepalive()
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class SessionPool( object ):
+  """A pool of established NBT sessions.
+
+  Sessions are keyed by (Called Name, IP, port), where the Called Name
+  is L2 encoded and the IP address and port are those of the original
+  destination (not the retarget destination, if any).
+
+  Instance Attributes:
+    callingName - The L2-encoded Calling Name sent in Session Requests.
+    maxIdle     - Maximum number of idle sessions kept per key.
+    idleTime    - Seconds an idle session may stay in the pool.
+    retargetTTL - Seconds for which a retarget destination is
+                  remembered.
+    maxHops     - Maximum number of Retarget Session Responses that will
+                  be followed when setting up a session.
+    timeout     - The socket timeout used for connecting and for the
+                  Session Request, or None to block.
+    reused      - Number of sessions handed out from the pool.
+    created     - Number of new sessions established.
+    retargets   - Number of Retarget Session Responses received.
+    shortcuts   - Number of connects that went straight to a remembered
+                  retarget destination.
+
+  Doctest:
+    >>> import threading
+    >>> from nbt.NBT_NameService import Name, LocalNameTable, NS_ACT
+    >>> from nbt.NBT_SessionServer import SessionAcceptor
+    >>> srv = Name( "SERVER", suffix='\\x20' )
+    >>> lnt = LocalNameTable( '\\x7f\\0\\0\\x01' )
+    >>> lnt.updateEntry( srv.L1name, Status=NS_ACT )
+    >>> real, front = [ SessionAcceptor( lnt, '127.0.0.1', 0 )
+    ...                 for i in (0, 1) ]
+    >>> held = []
+    >>> real.default = lambda sock, addr, called, calling: held.append( sock )
+    >>> front.retarget( srv.L1name, socket.inet_aton( '127.0.0.1' ),
+    ...                 real.sock.getsockname()[1] )
+    >>> done = []
+    >>> def serve( acc ):
+    ...   while( not done ):
+    ...     n = acc.poll( 0.01 )
+    >>> ts = [ threading.Thread( target=serve, args=(a,) )
+    ...        for a in (real, front) ]
+    >>> for t in ts: t.start()
+    >>> pool = SessionPool( Name( "CLIENT" ).L2name, timeout=5 )
+    >>> port = front.sock.getsockname()[1]
+    >>> s1 = pool.get( srv.L2name, '127.0.0.1', port )
+    >>> pool.release( s1 )
+    >>> s2 = pool.get( srv.L2name, '127.0.0.1', port )
+    >>> s3 = pool.get( srv.L2name, '127.0.0.1', port )
+    >>> (s1 is s2), pool.created, pool.reused, pool.retargets, pool.shortcuts
+    (True, 2, 1, 1, 1)
+    >>> try:
+    ...   s4 = pool.get( Name( "NOBODY" ).L2name, '127.0.0.1', port )
+    ... except NBTerror as e:
+    ...   print e.eCode
+    1002
+    >>> pool.close(); s2.close(); s3.close()
+    >>> done.append( True )
+    >>> for t in ts: t.join()
+    >>> real.close(); front.close()
+  """
+  def __init__( self, callingName = None,
+                      maxIdle     = 4,
+                      idleTime    = 60.0,
+                      retargetTTL = 300.0,
+                      maxHops     = 4,
+                      timeout     = None,
+                      clock       = None ):
+    """Create a session pool.
+
+    Input:
+      callingName - The L2-encoded Calling Name to use in Session
+                    Requests.
+      maxIdle     - Maximum number of idle sessions kept per key.
+      idleTime    - Seconds an idle session may stay in the pool.
+                    The server will probably time out sessions that
+                    stay idle much longer than this.
+      retargetTTL - Seconds for which a retarget destination is
+                    remembered.
+      maxHops     - Maximum number of Retarget Session Responses that
+                    will be followed for a single connect.
+      timeout     - Socket timeout for session setup, or None.
+      clock       - A function returning the current time in seconds.
+                    This is for testing; the default is <monoClock()>.
+    """
+    self.callingName = callingName
+    self.maxIdle     = maxIdle
+    self.idleTime    = idleTime
+    self.retargetTTL = retargetTTL
+    self.maxHops     = maxHops
+    self.timeout     = timeout
+    self.reused = self.created = self.retargets = self.shortcuts = 0
+    self._clock = monoClock if( clock is None ) else clock
+    # <_idle>     - Maps keys to lists of (socket, release time) tuples.
+    #               The most recently released session is at the end.
+    # <_owner>    - Maps sessions that have been handed out to their keys.
+    # <_retarget> - Maps keys to ((IP, port), expiry time) tuples.
+    self._idle     = {}
+    self._owner    = {}
+    self._retarget = {}
+
+  def __len__( self ):
+    """The number of idle sessions in the pool.
+    """
+    return( sum( len( lst ) for lst in self._idle.itervalues() ) )
+
+  def _recvAll( self, sock, count ):
+    # Read exactly <count> bytes from a blocking socket.
+    buf = ''
+    while( len( buf ) < count ):
+      data = sock.recv( count - len( buf ) )
+      if( not data ):
+        raise NBTerror( 1005, "Connection closed during session setup" )
+      buf += data
+    return( buf )
+
+  def _request( self, dest, calledName ):
+    # Connect and send a Session Request.
+    #
+    # Input:
+    #   dest        - The (IP, port) address to which to connect.
+    #   calledName  - The L2-encoded Called Name.
+    #
+    # Output: A tuple.  If the session was established, the tuple is
+    #         (socket, None).  If the server sent a Retarget Session
+    #         Response, the tuple is (None, (IP, port)).
+    #
+    # Errors: NBTerror( 1002 )  - A Negative Session Response was
+    #                             received.
+    #         NBTerror( 1005 )  - The response could not be parsed.
+    #         socket.error      - Passed through from the socket.
+    #
+    sock = socket.create_connection( dest, self.timeout )
+    try:
+      sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+      sock.sendall( SessionRequest( calledName, self.callingName ) )
+      mType, mLen = ParseMsg( self._recvAll( sock, 4 ) )
+      body = self._recvAll( sock, mLen ) if( mLen ) else ''
+    except:
+      sock.close()
+      raise
+    if( SS_POSITIVE_RESPONSE == mType ):
+      sock.settimeout( None )
+      return( (sock, None) )
+    sock.close()
+    if( SS_RETARGET_RESPONSE == mType ):
+      IP, port = ParseRetarget( body )
+      return( (None, (socket.inet_ntoa( IP ), port)) )
+    if( SS_NEGATIVE_RESPONSE == mType ):
+      s = "Negative Session Response: %s" % ErrCodeStr( ord( body ) )
+      raise NBTerror( 1002, s )
+    s = "Unexpected %s during session setup" % MsgTypeStr( mType )
+    raise NBTerror( 1005, s )
+
+  def _connect( self, key ):
+    # Establish a new session, following retargets as needed.
+    #
+    # Input:  key - The pool key: (calledName, IP, port).
+    #
+    # Output: The connected socket.
+    #
+    calledName, IP, port = key
+    now  = self._clock()
+    dest = (IP, port)
+    rt   = self._retarget.get( key )
+    if( rt is not None ):
+      if( rt[1] > now ):
+        try:
+          sock, rdr = self._request( rt[0], calledName )
+          if( sock is not None ):
+            self.shortcuts += 1
+            return( sock )
+        except (socket.error, NBTerror):
+          pass
+      # Expired, or no longer valid.  Start over.
+      del self._retarget[ key ]
+
+    for hop in xrange( self.maxHops + 1 ):
+      sock, rdr = self._request( dest, calledName )
+      if( sock is not None ):
+        if( dest != (IP, port) ):
+          self._retarget[ key ] = (dest, now + self.retargetTTL)
+        return( sock )
+      self.retargets += 1
+      dest = rdr
+    raise NBTerror( 1002, "Too many Retarget Session Responses" )
+
+  def _alive( self, sock ):
+    # Check that an idle session is still usable.
+    #
+    # An idle session should not have any input waiting, except for
+    # Session Keepalives (which are read and discarded).  Anything
+    # else, including end-of-file, means that the session is unusable.
+    #
+    while( select.select( [ sock ], [], [], 0 )[0] ):
+      try:
+        data = sock.recv( 4, socket.MSG_PEEK )
+      except socket.error:
+        return( False )
+      if( data != _KEEPALIVE ):
+        return( False )
+      sock.recv( 4 )
+    return( True )
+
+  def get( self, calledName=None, IP=None, port=SS_PORT ):
+    """Return an established NBT session.
+
+    Input:
+      calledName  - The L2-encoded Called Name.
+      IP          - The server IP address, in dotted-quad notation.
+      port        - The server port.
+
+    Output: A connected socket, on which the NBT session has been set
+            up.  The socket is in blocking mode.  When it is no longer
+            needed, pass it to <release()> to return it to the pool, or
+            to <discard()> to close it.
+
+    Errors: NBTerror( 1002 )  - A Negative Session Response was
+                                received, or too many Retarget Session
+                                Responses were received.
+            NBTerror( 1005 )  - A response could not be parsed.
+            socket.error      - Passed through from the socket.
+    """
+    key  = (calledName, IP, port)
+    idle = self._idle.get( key )
+    if( idle ):
+      tooOld = self._clock() - self.idleTime
+      while( idle ):
+        sock, released = idle.pop()
+        if( (released > tooOld) and self._alive( sock ) ):
+          self.reused += 1
+          self._owner[ sock ] = key
+          return( sock )
+        sock.close()
+    sock = self._connect( key )
+    self.created += 1
+    self._owner[ sock ] = key
+    return( sock )
+
+  def release( self, sock=None ):
+    """Return a session to the pool.
+
+    Input:  sock  - A session socket returned by <get()>.  The session
+                    must be idle; that is, there must be no outstanding
+                    requests or unread responses.
+
+    Notes:  If the pool already holds <maxIdle> sessions for the key,
+            the oldest is closed.
+    """
+    key  = self._owner.pop( sock )
+    idle = self._idle.setdefault( key, [] )
+    idle.append( (sock, self._clock()) )
+    if( len( idle ) > self.maxIdle ):
+      idle.pop( 0 )[0].close()
+
+  def discard( self, sock=None ):
+    """Close a session instead of returning it to the pool.
+
+    Input:  sock  - A session socket returned by <get()>.
+    """
+    self._owner.pop( sock, None )
+    sock.close()
+
+  def forget( self, calledName=None, IP=None, port=SS_PORT ):
+    """Forget the retarget destination (if any) for a key.
+    """
+    self._retarget.pop( (calledName, IP, port), None )
+
+  def close( self ):
+    """Close all idle sessions, and forget all retarget destinations.
+    """
+    for idle in self._idle.itervalues():
+      for sock, released in idle:
+        sock.close()
+    self._idle.clear()
+    self._retarget.clear()
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=2000 ):
+  # Measure session setup latency against a loopback stand-in server.
+  #
+  # Input:  count - Number of sessions to set up in each test.
+  #
+  # Notes:  The stand-in consists of two <SessionAcceptor>s.  The first
+  #         retargets all sessions to the second.  Three cases are
+  #         measured:
+  #           * No pooling and no retarget cache; two connects per
+  #             session.
+  #           * Retarget cache only; one connect per session.
+  #           * Pooled sessions.
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_SessionClient as m; m._bench()'
+  #
+  import threading
+  from NBT_NameService   import Name, LocalNameTable, NS_ACT
+  from NBT_SessionServer import SessionAcceptor
+  srv = Name( "SERVER", suffix='\x20' )
+  lnt = LocalNameTable( '\x7f\0\0\x01' )
+  lnt.updateEntry( srv.L1name, Status=NS_ACT )
+  real  = SessionAcceptor( lnt, '127.0.0.1', 0 )
+  front = SessionAcceptor( lnt, '127.0.0.1', 0 )
+  real.default = lambda sock, addr, called, calling: sock.close()
+  front.retarget( srv.L1name, socket.inet_aton( '127.0.0.1' ),
+                  real.sock.getsockname()[1] )
+  done = []
+  def _serve( acc ):
+    while( not done ):
+      acc.poll( 0.05 )
+  threads = [ threading.Thread( target=_serve, args=(acc,) )
+              for acc in (real, front) ]
+  for t in threads:
+    t.start()
+
+  port    = front.sock.getsockname()[1]
+  calling = Name( "CLIENT" ).L2name
+  def _run( title, pool, keep ):
+    start = time.time()
+    for i in xrange( count ):
+      sock = pool.get( srv.L2name, '127.0.0.1', port )
+      if( keep ):
+        pool.release( sock )
+      else:
+        pool.discard( sock )
+    elapsed = time.time() - start
+    print "%s: %8.1f us per session" % (title, (elapsed * 1e6) / count)
+    pool.close()
+
+  _run( "Retarget every time", SessionPool( calling, retargetTTL=0 ), False )
+  _run( "Retarget cache only", SessionPool( calling ), False )
+  # The stand-in closes its end of each session, so pooled sessions
+  # would fail the liveness check.  Keep them open for this test.
+  held = []
+  real.default = lambda sock, addr, called, calling: held.append( sock )
+  _run( "Pooled sessions....", SessionPool( calling ), True )
+
+  done.append( True )
+  for t in threads:
+    t.join()
+  for sock in held:
+    sock.close()
+  real.close()
+  front.close()
+
+# ============================================================================ #
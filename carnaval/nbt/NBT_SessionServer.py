@@ -0,0 +1,1352 @@
+# ============================================================================ #
+#                             NBT_SessionServer.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   NetBIOS over TCP/IP (IETF STD19) implementation: NBT Session Service
+#   server-side connection handling.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - The NBT modules are written for Python v2.7, which has neither
+#     asyncio nor the selectors module.  The classes defined here use
+#     non-blocking sockets and select.poll() (falling back to
+#     select.select() on platforms that lack poll()).  No threads are
+#     used.
+#
+# ============================================================================ #
+#
+"""NetBIOS over TCP/UDP (NBT) protocol: Session Service Server
+
+The <SessionAcceptor> accepts TCP connections on the NBT Session Service
+port, reads the Session Request from each, checks the Called Name against
+a <LocalNameTable>, and sends the appropriate response.  Connections that
+are accepted are handed off to a handler (e.g., an SMB server).
+
+The <SessionRelay> accepts NBT sessions on behalf of a backend server,
+optionally rewriting the Called Name, and then relays the session.
+
+The <KeepaliveManager> sends Session Keepalives on idle sessions, and
+closes sessions that have been idle for too long.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   errno               - Error numbers, so that we can recognize EAGAIN.
+#   socket              - The usual network socket stuff.
+#   select              - Wait for socket readiness.
+#   time                - Timing, for the benchmark.
+#   NBT_Core            - NBT exception class, and the timer wheel.
+#   NBT_NameService     - Name state flags.
+#   NBT_SessionService  - Session Service message composition and parsing.
+#
+
+import errno                            # Error numbers.
+import socket                           # Sockets.
+import select                           # Socket readiness.
+import time                             # Benchmark timing.
+
+from NBT_Core             import NBTerror     # NBT exception class.
+from NBT_Core             import TimerWheel   # Timeout management.
+from NBT_NameService      import NS_DRG, NS_CNF
+from NBT_SessionService   import *            # Session Service messages.
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _AGAIN      - The set of errno values that indicate that a non-blocking
+#                 operation would have blocked.
+#   _POS_RESP   - Precomposed Positive Session Response.
+#   _NEG_RESP   - Precomposed Negative Session Responses, by error code.
+#   _KEEPALIVE  - Precomposed Session Keepalive.
+#   _IN, _OUT   - Input and output poll event flags.
+#   _INERR      - Poll events that indicate that a read should be tried.
+#   _RELAY_BUFSIZE  - Default per-direction buffer size for relayed
+#                     sessions.
+#   _ST_*       - Relayed session states:
+#                   _ST_REQ   - Waiting for the client's Session Request.
+#                   _ST_CONN  - Connecting to the backend.
+#                   _ST_RSP   - Waiting for the backend's response.
+#                   _ST_RELAY - Session established; relaying data.
+#                   _ST_CLOSE - Sending a final response to the client.
+#
+
+_AGAIN    = ( errno.EAGAIN, errno.EWOULDBLOCK )
+_POS_RESP = PositiveResponse()
+_NEG_RESP = dict( (eCode, NegativeResponse( eCode ))
+                  for eCode in ( SS_ERR_NOT_LISTENING, SS_ERR_NOT_ANSWERING,
+                                 SS_ERR_NOT_PRESENT, SS_ERR_INSUFFICIENT,
+                                 SS_ERR_UNSPECIFIED ) )
+_KEEPALIVE = Keepalive()
+
+if( hasattr( select, "poll" ) ):
+  _IN, _OUT = select.POLLIN, select.POLLOUT
+  _INERR    = _IN | select.POLLHUP | select.POLLERR
+else:
+  _IN, _OUT = 1, 4
+  _INERR    = _IN
+
+_RELAY_BUFSIZE = 0x24000
+
+_ST_REQ, _ST_CONN, _ST_RSP, _ST_RELAY, _ST_CLOSE = range( 5 )
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class KeepaliveManager( object ):
+  """Send Session Keepalives to idle sessions, and close dead ones.
+
+  All sessions share a single <TimerWheel>.  Each session has one timer,
+  which is set to expire when the session would become idle.  Traffic
+  on a session does not touch the wheel at all; <touch()> just records
+  the time (as of the most recent call to <expire()>).  When a timer
+  fires, the session's idle time is checked:
+    * If the session has seen traffic since the timer was set, the
+      timer is simply pushed back.
+    * If the session has been idle for <idleLimit> seconds, it is
+      closed.
+    * Otherwise, a Session Keepalive is sent and the timer is restarted.
+  The cost of <touch()> is a single assignment, and the cost of
+  <expire()> depends only upon the number of timers that fire, not
+  upon the number of sessions.
+
+  Instance Attributes:
+    kaInterval  - Seconds of idle time before a Keepalive is sent.
+    idleLimit   - Seconds of idle time before the session is closed.
+                  Zero means that idle sessions are never closed.
+    pingCount   - Number of Keepalives sent.
+    closeCount  - Number of sessions closed.
+
+  Doctest:
+    >>> now  = [ 0.0 ]
+    >>> log  = []
+    >>> kam  = KeepaliveManager( 10, 25, clock=lambda: now[0],
+    ...                          ping=lambda k: log.append( ("ping", k) ),
+    ...                          close=lambda k: log.append( ("close", k) ) )
+    >>> a, b = kam.add( "a" ), kam.add( "b" )
+    >>> def run( secs ):
+    ...   for i in xrange( secs ):
+    ...     now[0] += 1
+    ...     kam.touch( a )
+    ...     n = kam.expire()
+    >>> run( 12 ); log
+    [('ping', 'b')]
+    >>> run( 14 ); log
+    [('ping', 'b'), ('ping', 'b'), ('close', 'b')]
+    >>> len( kam ), kam.pingCount, kam.closeCount
+    (1, 2, 1)
+  """
+  class Session( object ):
+    """A session being monitored for idleness.
+
+    Instance Attributes:
+      key   - The session key; the value passed to the ping and close
+              functions.
+      last  - The time at which traffic was last seen on the session.
+      timer - The session's <TimerWheel.Timer>.
+    """
+    __slots__ = ( "key", "last", "timer" )
+
+  def __init__( self, kaInterval = 60.0,
+                      idleLimit  = 900.0,
+                      ping       = None,
+                      close      = None,
+                      clock      = None ):
+    """Create a Keepalive manager.
+
+    Input:
+      kaInterval  - Seconds of idle time before a Keepalive is sent.
+      idleLimit   - Seconds of idle time before the session is closed.
+                    Zero disables the idle limit.
+      ping        - A function that sends a Keepalive.  It is called
+                    with the session key.  The default treats the key
+                    as a socket and sends a Session Keepalive message.
+                    If the function raises socket.error, the session is
+                    closed.
+      close       - A function that closes a session, called with the
+                    session key.  The default calls the key's close()
+                    method.
+      clock       - A function returning the current time in seconds.
+                    This is for testing; the default is <monoClock()>.
+
+    Errors:
+      ValueError  - Raised if <kaInterval> is not positive.
+    """
+    if( kaInterval <= 0 ):
+      raise ValueError( "Keepalive interval must be greater than zero." )
+    self.kaInterval = float( kaInterval )
+    self.idleLimit  = float( idleLimit )
+    self.pingCount  = 0
+    self.closeCount = 0
+    self._ping  = ping  if( ping  ) else (lambda k: k.send( _KEEPALIVE ))
+    self._close = close if( close ) else (lambda k: k.close())
+    self._wheel = TimerWheel( 1.0, 1024, clock )
+    self._now   = self._wheel.now()
+
+  def __len__( self ):
+    """The number of sessions being monitored.
+    """
+    return( len( self._wheel ) )
+
+  def add( self, key=None ):
+    """Start monitoring a session.
+
+    Input:  key - The session key, typically the session socket.
+
+    Output: A <KeepaliveManager.Session> handle, to be passed to
+            <touch()> and <remove()>.
+    """
+    sess = self.Session()
+    sess.key   = key
+    sess.last  = self._now
+    sess.timer = self._wheel.start( sess, self.kaInterval )
+    return( sess )
+
+  def touch( self, sess=None ):
+    """Record traffic on a session.
+
+    Input:  sess  - The session handle returned by <add()>.
+
+    Notes:  The time recorded is the time of the most recent call to
+            <expire()>, which keeps this call as cheap as possible.
+    """
+    sess.last = self._now
+
+  def remove( self, sess=None ):
+    """Stop monitoring a session.
+
+    Input:  sess  - The session handle returned by <add()>.
+
+    Output: True if the session was being monitored, else False.
+    """
+    return( self._wheel.cancel( sess.timer ) )
+
+  def _expire( self, sess ):
+    # Close an idle session.
+    self._close( sess.key )
+    self.closeCount += 1
+
+  def expire( self ):
+    """Process sessions whose timers have fired.
+
+    Output: The number of timers that fired.
+
+    Notes:  This should be called about once per second.
+    """
+    wheel = self._wheel
+    now   = self._now = wheel.now()
+    limit = self.idleLimit
+    fired = wheel.expire()
+    for timer in fired:
+      sess = timer.Data
+      idle = now - sess.last
+      if( limit and (idle >= limit) ):
+        self._expire( sess )
+        continue
+      if( idle >= self.kaInterval ):
+        try:
+          self._ping( sess.key )
+        except socket.error:
+          self._expire( sess )
+          continue
+        self.pingCount += 1
+        delay = self.kaInterval
+      else:
+        delay = self.kaInterval - idle
+      if( limit ):
+        delay = min( delay, limit - idle )
+      wheel.restart( timer, delay )
+    return( len( fired ) )
+
+
+class SessionAcceptor( object ):
+  """NBT Session Service listener.
+
+  The acceptor listens on a TCP port.  For each new connection, it waits
+  (without blocking) for the Session Request, and then responds:
+    * If the Called Name is not an active unique name in the local name
+      table, a Negative Session Response (Called Name Not Present) is
+      sent and the connection is closed.
+    * If the Called Name has been set up to be retargeted, a Retarget
+      Session Response is sent and the connection is closed.
+    * If there is no handler for the Called Name, a Negative Session
+      Response (Not Listening On Called Name) is sent and the connection
+      is closed.
+    * Otherwise, a Positive Session Response is sent and the connection
+      is passed to the handler.
+  All responses are precomposed.  The Called Name lookup is a single
+  dictionary lookup in the <LocalNameTable>.
+
+  Connections that do not send a Session Request within <reqTimeout>
+  seconds are closed.  If there are more than <maxPending> connections
+  waiting for a Session Request, new connections are closed as soon as
+  they are accepted.
+
+  Handlers are called as:
+    handler( sock, addr, calledName, callingName )
+  where <sock> is the (non-blocking) connected socket, <addr> is the
+  remote address, and the two names are L2 encoded.
+
+  Instance Attributes:
+    sock      - The listening socket.
+    nameTable - The <LocalNameTable> used to validate Called Names.
+    default   - The handler used for names that have no specific handler,
+                or None.
+    accepted  - Number of sessions accepted.
+    refused   - Number of Negative Session Responses sent, plus the number
+                of connections closed because <maxPending> was reached.
+    retargeted- Number of Retarget Session Responses sent.
+    timedOut  - Number of connections closed for lack of a request.
+    badCount  - Number of connections closed due to malformed messages.
+
+  Doctest:
+    >>> from NBT_NameService import Name, LocalNameTable, NS_ACT
+    >>> srv = Name( "SERVER", suffix='\\x20' )
+    >>> lnt = LocalNameTable( '\\x7f\\0\\0\\x01' )
+    >>> lnt.updateEntry( srv.L1name, Status=NS_ACT )
+    >>> acc = SessionAcceptor( lnt, '127.0.0.1', 0 )
+    >>> got = []
+    >>> acc.default = lambda sock, addr, called, calling: got.append( sock )
+    >>> def call( nom ):
+    ...   c = socket.create_connection( acc.sock.getsockname() )
+    ...   c.sendall( SessionRequest( Name( nom, suffix='\\x20' ).L2name,
+    ...                              Name( "CLIENT" ).L2name ) )
+    ...   c.settimeout( 0 )
+    ...   while( True ):
+    ...     acc.poll( 0.1 )
+    ...     try:
+    ...       if( c.recv( 1, socket.MSG_PEEK ) ):
+    ...         break
+    ...     except socket.error:
+    ...       pass
+    ...   while( acc.poll( 0 ) ):
+    ...     pass
+    ...   c.settimeout( None )
+    ...   rsp = c.recv( 16 )
+    ...   c.close()
+    ...   return( ParseMsg( rsp )[0] == SS_POSITIVE_RESPONSE )
+    >>> print call( "SERVER" ), len( got ), call( "NOBODY" ), acc.refused
+    True 1 False 1
+    >>> acc.retarget( srv.L1name, '\\x7f\\0\\0\\x02', 1139 )
+    >>> print call( "SERVER" ), acc.retargeted
+    False 1
+    >>> got[0].close(); acc.close()
+  """
+  class _Pending( object ):
+    # A connection that is waiting for a Session Request.
+    #
+    #   sock  - The connected socket.
+    #   addr  - The remote address.
+    #   buf   - Receive buffer; exactly one Session Request in size.
+    #   count - Number of bytes in <buf>.
+    #   timer - Request timeout timer.
+    #
+    __slots__ = ( "sock", "addr", "buf", "count", "timer" )
+
+  def __init__( self, nameTable  = None,
+                      IP         = '',
+                      port       = SS_PORT,
+                      backlog    = 1024,
+                      reqTimeout = 5.0,
+                      maxPending = 4096,
+                      clock      = None ):
+    """Create and bind a Session Service listener.
+
+    Input:
+      nameTable   - The <LocalNameTable> used to validate Called Names.
+      IP          - The local interface address to which the socket will
+                    be bound, in dotted-quad notation.  The empty string
+                    binds to all interfaces.
+      port        - The local TCP port number.  Zero selects an
+                    ephemeral port, which is handy for testing.
+      backlog     - The listen() backlog.  A deep backlog smooths out
+                    connection storms.
+      reqTimeout  - Seconds to wait for a Session Request.
+      maxPending  - Maximum number of connections waiting for a Session
+                    Request.
+      clock       - A function returning the current time in seconds.
+                    This is for testing; the default is <monoClock()>.
+
+    Errors:
+      socket.error  - Raised if the socket cannot be created or bound.
+    """
+    self.sock = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+    self.sock.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+    self.sock.bind( (IP, port) )
+    self.sock.listen( backlog )
+    self.sock.setblocking( 0 )
+
+    self.nameTable  = nameTable
+    self.reqTimeout = reqTimeout
+    self.maxPending = maxPending
+    self.default    = None
+
+    self.accepted = self.refused = self.retargeted = 0
+    self.timedOut = self.badCount = 0
+
+    # <_handlers> - Maps L1-encoded Called Names to handlers.
+    # <_retarget> - Maps L1-encoded Called Names to precomposed Retarget
+    #               Session Responses.
+    # <_pending>  - Maps file descriptors to _Pending records.
+    # <_wheel>    - Request timeouts.
+    # <_poller>   - A select.poll() object, or None.
+    self._handlers = {}
+    self._retarget = {}
+    self._pending  = {}
+    self._wheel    = TimerWheel( 0.25, 64, clock )
+    self._poller   = select.poll() if( hasattr( select, "poll" ) ) else None
+    if( self._poller ):
+      self._poller.register( self.sock, select.POLLIN )
+
+  def fileno( self ):
+    """Return the listening socket file descriptor.
+    """
+    return( self.sock.fileno() )
+
+  def __len__( self ):
+    """The number of connections waiting for a Session Request.
+    """
+    return( len( self._pending ) )
+
+  def close( self ):
+    """Close the listening socket and all pending connections.
+    """
+    for p in self._pending.values():
+      self._drop( p )
+    self.sock.close()
+
+  def listen( self, L1name=None, handler=None ):
+    """Register a handler for a Called Name.
+
+    Input:
+      L1name  - The L1-encoded Called Name.  The name must also be in
+                the local name table.
+      handler - The handler, or None to remove the handler.
+    """
+    if( handler is None ):
+      self._handlers.pop( L1name, None )
+    else:
+      self._handlers[ L1name ] = handler
+
+  def retarget( self, L1name=None, IP=None, port=SS_PORT ):
+    """Redirect sessions for a Called Name to another IP and port.
+
+    Input:
+      L1name  - The L1-encoded Called Name.
+      IP      - The IPv4 address (four octets) to which clients are
+                redirected, or None to cancel the redirection.
+      port    - The port to which clients are redirected.
+    """
+    if( IP is None ):
+      self._retarget.pop( L1name, None )
+    else:
+      self._retarget[ L1name ] = RetargetResponse( IP, port )
+
+  def _drop( self, p ):
+    # Forget about a pending connection, and close it.
+    self._forget( p )
+    p.sock.close()
+
+  def _forget( self, p ):
+    # Forget about a pending connection, but leave it open.
+    del self._pending[ p.sock.fileno() ]
+    self._wheel.cancel( p.timer )
+    if( self._poller ):
+      self._poller.unregister( p.sock )
+
+  def _respond( self, p, rsp ):
+    # Send a (negative or retarget) response and close the connection.
+    try:
+      p.sock.send( rsp )
+    except socket.error:
+      pass
+    self._drop( p )
+
+  def handleAccept( self, maxCount=64 ):
+    """Accept new connections.
+
+    Input:  maxCount  - The maximum number of connections to accept
+                        before returning.
+
+    Output: The number of connections accepted.
+    """
+    count = 0
+    while( count < maxCount ):
+      try:
+        sock, addr = self.sock.accept()
+      except socket.error as e:
+        if( e.args[0] in _AGAIN ):
+          break
+        raise
+      count += 1
+      if( len( self._pending ) >= self.maxPending ):
+        sock.close()
+        self.refused += 1
+        continue
+      sock.setblocking( 0 )
+      p = self._Pending()
+      p.sock  = sock
+      p.addr  = addr
+      p.buf   = bytearray( 72 )
+      p.count = 0
+      p.timer = self._wheel.start( p, self.reqTimeout )
+      self._pending[ sock.fileno() ] = p
+      if( self._poller ):
+        self._poller.register( sock, select.POLLIN )
+    return( count )
+
+  def handleRequest( self, p ):
+    """Read from a pending connection, and respond to the request.
+
+    Input:  p - The pending connection record.
+    """
+    try:
+      n = p.sock.recv_into( memoryview( p.buf )[p.count:] )
+    except socket.error as e:
+      if( e.args[0] not in _AGAIN ):
+        self._drop( p )
+      return
+    if( 0 == n ):
+      self._drop( p )
+      return
+    p.count += n
+
+    while( p.count >= 4 ):
+      try:
+        mType, mLen = ParseMsg( str( p.buf[:4] ) )
+      except NBTerror:
+        mType = None
+      if( SS_SESSION_KEEPALIVE == mType ):
+        p.buf[:p.count-4] = p.buf[4:p.count]
+        p.count -= 4
+      elif( SS_SESSION_REQUEST == mType ):
+        if( p.count == 72 ):
+          self._answer( p )
+        return
+      else:
+        self.badCount += 1
+        self._respond( p, _NEG_RESP[ SS_ERR_UNSPECIFIED ] )
+        return
+
+  def _answer( self, p ):
+    # Respond to a complete Session Request.
+    try:
+      called, calling = ParseCNames( str( p.buf[4:] ) )
+    except (NBTerror, ValueError):
+      self.badCount += 1
+      self._respond( p, _NEG_RESP[ SS_ERR_UNSPECIFIED ] )
+      return
+
+    L1name = called[1:33]
+    entry  = None
+    if( self.nameTable is not None ):
+      entry = self.nameTable.findEntry( L1name, True )
+    if( (entry is None) or entry[1] or (entry[2] & (NS_DRG | NS_CNF)) ):
+      self.refused += 1
+      self._respond( p, _NEG_RESP[ SS_ERR_NOT_PRESENT ] )
+      return
+
+    rsp = self._retarget.get( L1name )
+    if( rsp is not None ):
+      self.retargeted += 1
+      self._respond( p, rsp )
+      return
+
+    handler = self._handlers.get( L1name, self.default )
+    if( handler is None ):
+      self.refused += 1
+      self._respond( p, _NEG_RESP[ SS_ERR_NOT_LISTENING ] )
+      return
+
+    self._forget( p )
+    try:
+      p.sock.send( _POS_RESP )
+    except socket.error:
+      p.sock.close()
+      return
+    self.accepted += 1
+    handler( p.sock, p.addr, called, calling )
+
+  def expire( self ):
+    """Close connections that have not sent a Session Request in time.
+
+    Output: The number of connections closed.
+    """
+    expired = self._wheel.expire()
+    for timer in expired:
+      self._drop( timer.Data )
+    self.timedOut += len( expired )
+    return( len( expired ) )
+
+  def poll( self, timeout=None ):
+    """Run a single pass of an event loop on the acceptor.
+
+    Input:  timeout - Maximum time to wait, in seconds, or None to
+                      wait indefinitely.
+
+    Output: The number of sockets that were ready.
+    """
+    if( self._poller ):
+      ms    = None if( timeout is None ) else int( timeout * 1000 )
+      ready = [ fd for fd, ev in self._poller.poll( ms ) ]
+    else:
+      ready = select.select( [ self.sock ] + self._pending.keys(),
+                             [], [], timeout )[0]
+      ready = [ (fd if( isinstance( fd, int ) ) else fd.fileno())
+                for fd in ready ]
+    lfd = self.sock.fileno()
+    for fd in ready:
+      if( fd == lfd ):
+        self.handleAccept()
+      elif( fd in self._pending ):
+        self.handleRequest( self._pending[ fd ] )
+    self.expire()
+    return( len( ready ) )
+
+
+class SessionRelay( object ):
+  """NBT Session Service relay.
+
+  The relay accepts NBT sessions on behalf of a backend server.  For
+  each new connection:
+    * The Session Request is read from the client.  The Called Name may
+      be rewritten (e.g., to map a legacy server name to a new one).
+    * A non-blocking connect is made to the backend, and the (possibly
+      rewritten) Session Request is passed along.
+    * If the backend sends a Retarget Session Response, the relay
+      follows it (up to <maxHops> times), so that the client never
+      needs to reach the retarget destination itself.  Any other
+      response is passed back to the client.
+  Once the session is established, the byte stream is copied in both
+  directions without further parsing.  Session Message framing is
+  preserved simply because every byte is passed through in order.
+
+  Each direction has a fixed buffer, allocated when the connection is
+  accepted and reused for the life of the session.  Data is read with
+  recv_into() and written from a memoryview of the buffer, so nothing
+  is copied in Python.  Backpressure falls out of the buffer state: a
+  socket is only polled for input while there is room in the buffer
+  that it feeds, and only polled for output while there is data to be
+  written to it.  A slow reader therefore slows down the writer on the
+  other side, rather than causing memory to pile up in the relay.
+
+  Instance Attributes:
+    sock      - The listening socket.
+    backend   - The backend (IP, port) address.
+    rewrite   - A dictionary mapping L2-encoded Called Names to the
+                names to be sent to the backend, or a function that
+                takes a Called Name and returns the name to send.  None
+                leaves the names alone.
+    sessions  - Number of sessions established.
+    refused   - Number of sessions refused by the backend, or that
+                failed because the backend could not be reached.
+    timedOut  - Number of connections closed because session setup
+                took too long.
+    badCount  - Number of connections closed due to malformed messages.
+    byteCount - Number of bytes relayed (in both directions) after
+                session setup.
+
+  Doctest:
+    >>> import threading
+    >>> from NBT_NameService import Name, LocalNameTable, NS_ACT
+    >>> old, new = Name( "OLDSERVER", suffix='\\x20' ), \\
+    ...            Name( "NEWSERVER", suffix='\\x20' )
+    >>> lnt = LocalNameTable( '\\x7f\\0\\0\\x01' )
+    >>> lnt.updateEntry( new.L1name, Status=NS_ACT )
+    >>> back = SessionAcceptor( lnt, '127.0.0.1', 0 )
+    >>> def echo( sock, addr, called, calling ):
+    ...   sock.setblocking( 1 )
+    ...   while( True ):
+    ...     data = sock.recv( 0x10000 )
+    ...     if( not data ):
+    ...       break
+    ...     sock.sendall( data )
+    ...   sock.close()
+    >>> back.default = lambda *args: threading.Thread( target=echo,
+    ...                                                args=args ).start()
+    >>> relay = SessionRelay( back.sock.getsockname(), '127.0.0.1', 0,
+    ...                       rewrite={ old.L2name: new.L2name } )
+    >>> done = []
+    >>> def serve( svc ):
+    ...   while( not done ):
+    ...     n = svc.poll( 0.01 )
+    >>> ts = [ threading.Thread( target=serve, args=(s,) )
+    ...        for s in (back, relay) ]
+    >>> for t in ts: t.start()
+    >>> def call( nom, data ):
+    ...   c = socket.create_connection( relay.sock.getsockname() )
+    ...   c.sendall( SessionRequest( nom.L2name, Name( "CLIENT" ).L2name ) )
+    ...   rsp = c.recv( 16 )
+    ...   if( SS_POSITIVE_RESPONSE == ParseMsg( rsp )[0] ):
+    ...     c.sendall( SessionMessage( len( data ) ) + data )
+    ...     rsp = ''
+    ...     while( len( rsp ) < len( data ) + 4 ):
+    ...       rsp += c.recv( 0x10000 )
+    ...     rsp = rsp[4:]
+    ...   c.close()
+    ...   return( rsp )
+    >>> data = 'x' * 100000
+    >>> call( old, data ) == data
+    True
+    >>> ParseErrCode( call( Name( "NOBODY", suffix='\\x20' ), data )[4] )
+    130
+    >>> scoped = Name( "OLDSERVER", suffix='\\x20', scope="example.com" )
+    >>> c = socket.create_connection( relay.sock.getsockname() )
+    >>> names = scoped.L2name + Name( "CLIENT" ).L2name
+    >>> c.sendall( "\\x81\\0\\0" + chr( len( names ) ) + names )
+    >>> ParseErrCode( c.recv( 16 )[4] ); c.close()
+    143
+    >>> relay.rewrite[ old.L2name ] = scoped.L2name
+    >>> ParseErrCode( call( old, data )[4] )
+    143
+    >>> relay.badCount
+    2
+    >>> done.append( True )
+    >>> for t in ts: t.join()
+    >>> relay.sessions, relay.refused
+    (1, 1)
+    >>> relay.close(); back.close()
+  """
+  class _Pipe( object ):
+    # One direction of a relayed session.
+    #
+    #   src   - The socket from which data is read.
+    #   dst   - The socket to which data is written.
+    #   buf   - The fixed buffer.
+    #   view  - A memoryview of <buf>.
+    #   head  - Offset of the first byte in <buf> that has not been
+    #           written.
+    #   tail  - Offset of the end of the data in <buf>.
+    #   eof   - True once <src> has reached end-of-file.
+    #
+    __slots__ = ( "src", "dst", "buf", "view", "head", "tail", "eof" )
+
+    def __init__( self, src, dst, bufSize ):
+      self.src  = src
+      self.dst  = dst
+      self.buf  = bytearray( bufSize )
+      self.view = memoryview( self.buf )
+      self.head = self.tail = 0
+      self.eof  = False
+
+  class _Relay( object ):
+    # The state of a relayed session.
+    #
+    #   client  - The client socket.
+    #   server  - The backend socket, or None.
+    #   up      - The client to server <_Pipe>.
+    #   down    - The server to client <_Pipe>.
+    #   state   - One of the _ST_* values.
+    #   request - The Session Request to be sent to the backend.
+    #   hops    - The number of retargets followed.
+    #   timer   - Session setup timer.
+    #
+    __slots__ = ( "client", "server", "up", "down",
+                  "state", "request", "hops", "timer" )
+
+  def __init__( self, backend    = None,
+                      IP         = '',
+                      port       = SS_PORT,
+                      rewrite    = None,
+                      bufSize    = _RELAY_BUFSIZE,
+                      backlog    = 128,
+                      reqTimeout = 5.0,
+                      maxHops    = 4,
+                      clock      = None ):
+    """Create and bind a Session Service relay.
+
+    Input:
+      backend     - The (IP, port) address of the backend server.
+      IP          - The local interface address to which the listening
+                    socket will be bound.  The empty string binds to
+                    all interfaces.
+      port        - The local TCP port number.
+      rewrite     - A dictionary or a function used to rewrite Called
+                    Names.  See the class description.
+      bufSize     - The size of each of the two buffers allocated per
+                    session.  The default is a bit more than one
+                    maximum-sized Session Message.
+      backlog     - The listen() backlog.
+      reqTimeout  - Seconds allowed for session setup, from accept() to
+                    the backend's Positive Session Response.
+      maxHops     - Maximum number of backend retargets followed.
+      clock       - A function returning the current time in seconds.
+                    This is for testing; the default is <monoClock()>.
+
+    Errors:
+      ValueError    - Raised if <bufSize> is too small to hold a
+                      Session Request.
+      socket.error  - Raised if the socket cannot be created or bound.
+    """
+    if( bufSize < 72 ):
+      raise ValueError( "Buffer size (%d) is too small." % bufSize )
+    self.sock = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+    self.sock.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+    self.sock.bind( (IP, port) )
+    self.sock.listen( backlog )
+    self.sock.setblocking( 0 )
+
+    self.backend    = backend
+    self.rewrite    = rewrite
+    self.reqTimeout = reqTimeout
+    self.maxHops    = maxHops
+    self.sessions   = self.refused = self.timedOut = self.badCount = 0
+    self.byteCount  = 0
+    self._bufSize   = bufSize
+    # <_socks>  - Maps file descriptors to (_Relay, isClient) tuples.
+    # <_masks>  - Maps file descriptors to the events being polled for.
+    # <_wheel>  - Session setup timeouts.
+    # <_poller> - A select.poll() object, or None.
+    self._socks  = {}
+    self._masks  = {}
+    self._wheel  = TimerWheel( 0.25, 64, clock )
+    self._poller = select.poll() if( hasattr( select, "poll" ) ) else None
+    self._lfd    = self.sock.fileno()
+    self._masks[ self._lfd ] = _IN
+    if( self._poller ):
+      self._poller.register( self._lfd, _IN )
+
+  def fileno( self ):
+    """Return the listening socket file descriptor.
+    """
+    return( self._lfd )
+
+  def __len__( self ):
+    """The number of open client connections.
+    """
+    return( sum( 1 for r, isClient in self._socks.itervalues() if isClient ) )
+
+  def close( self ):
+    """Close the listening socket and all relayed sessions.
+    """
+    for r, isClient in self._socks.values():
+      if( isClient ):
+        self._close( r )
+    self.sock.close()
+
+  def _watch( self, sock, mask ):
+    # Set the events to be polled for on a socket.
+    fd = sock.fileno()
+    if( self._masks.get( fd ) != mask ):
+      if( self._poller ):
+        if( fd in self._masks ):
+          self._poller.modify( fd, mask )
+        else:
+          self._poller.register( fd, mask )
+      self._masks[ fd ] = mask
+
+  def _forget( self, sock ):
+    # Stop polling a socket, and close it.
+    fd = sock.fileno()
+    if( self._masks.pop( fd, None ) is not None ):
+      if( self._poller ):
+        self._poller.unregister( fd )
+    self._socks.pop( fd, None )
+    sock.close()
+
+  def _close( self, r ):
+    # Close both ends of a relayed session.
+    self._wheel.cancel( r.timer )
+    if( r.server is not None ):
+      self._forget( r.server )
+      r.server = None
+    if( r.client is not None ):
+      self._forget( r.client )
+      r.client = None
+
+  def _update( self, r ):
+    # Recalculate the events of interest for both sockets of a session.
+    #
+    # This is where backpressure is applied: input is only accepted
+    # when there is room in the buffer, and output is only requested
+    # when there is something to write.
+    #
+    up, down, st = r.up, r.down, r.state
+    mask = 0
+    if( _ST_REQ == st ):
+      mask = _IN
+    elif( _ST_RELAY == st ):
+      if( (not up.eof) and (up.tail < self._bufSize) ):
+        mask = _IN
+      if( down.tail > down.head ):
+        mask |= _OUT
+    elif( _ST_CLOSE == st ):
+      mask = _OUT
+    self._watch( r.client, mask )
+    if( r.server is not None ):
+      mask = 0
+      if( _ST_CONN == st ):
+        mask = _OUT
+      else:
+        if( (not down.eof) and (down.tail < self._bufSize) ):
+          mask = _IN
+        if( up.tail > up.head ):
+          mask |= _OUT
+      self._watch( r.server, mask )
+
+  def _fill( self, p, limit ):
+    # Read from a pipe's source socket into its buffer.
+    #
+    # Output: The number of bytes read, or -1 if the read would block.
+    #
+    if( (p.tail == limit) and p.head ):
+      # Out of room at the end of the buffer; shift the data down.
+      p.buf[:p.tail-p.head] = p.view[p.head:p.tail]
+      p.tail -= p.head
+      p.head  = 0
+    try:
+      n = p.src.recv_into( p.view[p.tail:limit] )
+    except socket.error as e:
+      if( e.args[0] in _AGAIN ):
+        return( -1 )
+      raise
+    if( 0 == n ):
+      p.eof = True
+    p.tail += n
+    return( n )
+
+  def _drain( self, p ):
+    # Write buffered data from a pipe to its destination socket.
+    #
+    # Output: The number of bytes written.
+    #
+    try:
+      n = p.dst.send( p.view[p.head:p.tail] )
+    except socket.error as e:
+      if( e.args[0] in _AGAIN ):
+        return( 0 )
+      raise
+    p.head += n
+    if( p.head == p.tail ):
+      p.head = p.tail = 0
+      if( p.eof ):
+        p.dst.shutdown( socket.SHUT_WR )
+    return( n )
+
+  def _refuse( self, r, eCode ):
+    # Send a Negative Session Response to the client, then close.
+    if( r.server is not None ):
+      self._forget( r.server )
+      r.server = None
+    rsp = _NEG_RESP[ eCode ]
+    r.down.buf[:len( rsp )] = rsp
+    r.down.head, r.down.tail = 0, len( rsp )
+    r.state = _ST_CLOSE
+
+  def _connect( self, r, dest ):
+    # Start a non-blocking connect to the backend.
+    #
+    # The Session Request is (re)loaded into the upstream buffer, to be
+    # sent once the connection completes.
+    #
+    sock = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+    sock.setblocking( 0 )
+    sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+    err = sock.connect_ex( dest )
+    if( err and (err not in (errno.EINPROGRESS,) + _AGAIN) ):
+      sock.close()
+      self.refused += 1
+      self._refuse( r, SS_ERR_UNSPECIFIED )
+      return
+    r.server = sock
+    r.up.dst = r.down.src = sock
+    n = len( r.request )
+    r.up.view[:n] = r.request
+    r.up.head, r.up.tail = 0, n
+    r.down.head = r.down.tail = 0
+    r.down.eof  = False
+    r.state = _ST_CONN
+    self._socks[ sock.fileno() ] = (r, False)
+
+  def _request( self, r ):
+    # Handle a complete Session Request from the client.
+    #
+    # The whole request, as given by the length in its header, has been
+    # read.  The names in a Session Request never carry a scope, so
+    # anything other than two 34-byte names is malformed, as is a
+    # rewritten name that is scoped.
+    #
+    rw = self.rewrite
+    try:
+      if( 72 != r.up.tail ):
+        raise ValueError( "Bad Session Request length." )
+      called, calling = ParseCNames( r.up.view[4:72].tobytes() )
+      if( rw is not None ):
+        called = rw( called ) if( callable( rw ) ) \
+                 else rw.get( called, called )
+      r.request = SessionRequest( called, calling )
+    except (NBTerror, ValueError):
+      self.badCount += 1
+      self._refuse( r, SS_ERR_UNSPECIFIED )
+      return
+    r.hops    = 0
+    self._connect( r, self.backend )
+
+  def _reqEnd( self, p ):
+    # Return the offset of the end of the Session Request in <p>.buf.
+    #
+    # Until the four-byte header has been read, the header is all that
+    # is known to be there.  After that, the length is taken from the
+    # header, so that a malformed request is consumed whole.
+    #
+    if( p.tail < 4 ):
+      return( 4 )
+    return( 4 + ParseMsg( p.view[:4].tobytes() )[1] )
+
+  def _response( self, r ):
+    # Inspect the backend's response to the Session Request.
+    down = r.down
+    if( down.tail < 4 ):
+      return
+    try:
+      mType, mLen = ParseMsg( down.view[:4].tobytes() )
+    except NBTerror:
+      mType, mLen = None, 0
+    if( down.tail < 4 + mLen ):
+      return
+    if( SS_POSITIVE_RESPONSE == mType ):
+      self._wheel.cancel( r.timer )
+      self.sessions += 1
+      r.state = _ST_RELAY
+    elif( (SS_RETARGET_RESPONSE == mType) and (r.hops < self.maxHops) ):
+      IP, port = ParseRetarget( down.view[4:10].tobytes() )
+      r.hops += 1
+      self._forget( r.server )
+      r.server = None
+      self._connect( r, (socket.inet_ntoa( IP ), port) )
+    elif( SS_NEGATIVE_RESPONSE == mType ):
+      self.refused += 1
+      self._forget( r.server )
+      r.server = None
+      r.state  = _ST_CLOSE
+    else:
+      self.badCount += 1
+      self._refuse( r, SS_ERR_UNSPECIFIED )
+
+  def _event( self, r, isClient, ev ):
+    # Handle poll events on one of a session's sockets.
+    up, down, st = r.up, r.down, r.state
+    if( isClient ):
+      if( _ST_REQ == st ):
+        n = self._fill( up, self._reqEnd( up ) )
+        if( 0 == n ):
+          return( False )
+        if( up.tail < 4 ):
+          return( True )
+        try:
+          if( up.buf[0] != SS_SESSION_REQUEST ):
+            raise NBTerror( 1005 )
+          end = self._reqEnd( up )
+        except (NBTerror, ValueError):
+          end = 0
+        if( (end < 4) or (end > self._bufSize) ):
+          self.badCount += 1
+          self._refuse( r, SS_ERR_UNSPECIFIED )
+        elif( end == up.tail ):
+          self._request( r )
+        return( True )
+      if( st in (_ST_CONN, _ST_RSP) ):
+        # The client is not polled during setup, so this is a hangup.
+        return( False )
+      if( ev & _OUT ):
+        self.byteCount += self._drain( down )
+        if( (_ST_CLOSE == st) and (down.tail == 0) ):
+          return( False )
+      if( (_ST_RELAY == st) and (ev & _INERR) and not up.eof ):
+        if( self._fill( up, self._bufSize ) >= 0 ):
+          self.byteCount += self._drain( up )
+    else:
+      if( _ST_CONN == st ):
+        err = r.server.getsockopt( socket.SOL_SOCKET, socket.SO_ERROR )
+        if( err ):
+          self.refused += 1
+          self._refuse( r, SS_ERR_UNSPECIFIED )
+          return( True )
+        r.state = _ST_RSP
+      if( ev & _OUT ):
+        n = self._drain( up )
+        if( _ST_RELAY == r.state ):
+          self.byteCount += n
+      if( (ev & _INERR) and not down.eof ):
+        n = self._fill( down, self._bufSize )
+        if( _ST_RSP == r.state ):
+          if( 0 == n ):
+            self.refused += 1
+            self._refuse( r, SS_ERR_UNSPECIFIED )
+          else:
+            self._response( r )
+        elif( n >= 0 ):
+          self.byteCount += self._drain( down )
+    # Done when both directions have been shut down and flushed.
+    if( up.eof and down.eof and (up.tail == 0) and (down.tail == 0) ):
+      return( False )
+    return( True )
+
+  def handleAccept( self, maxCount=64 ):
+    """Accept new client connections.
+
+    Input:  maxCount  - The maximum number of connections to accept
+                        before returning.
+
+    Output: The number of connections accepted.
+    """
+    count = 0
+    while( count < maxCount ):
+      try:
+        sock, addr = self.sock.accept()
+      except socket.error as e:
+        if( e.args[0] in _AGAIN ):
+          break
+        raise
+      count += 1
+      sock.setblocking( 0 )
+      sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+      r = self._Relay()
+      r.client  = sock
+      r.server  = None
+      r.up      = self._Pipe( sock, None, self._bufSize )
+      r.down    = self._Pipe( None, sock, self._bufSize )
+      r.state   = _ST_REQ
+      r.request = None
+      r.hops    = 0
+      r.timer   = self._wheel.start( r, self.reqTimeout )
+      self._socks[ sock.fileno() ] = (r, True)
+      self._update( r )
+    return( count )
+
+  def expire( self ):
+    """Close sessions that have taken too long to set up.
+
+    Output: The number of sessions closed.
+    """
+    expired = self._wheel.expire()
+    for timer in expired:
+      self._close( timer.Data )
+    self.timedOut += len( expired )
+    return( len( expired ) )
+
+  def poll( self, timeout=None ):
+    """Run a single pass of an event loop on the relay.
+
+    Input:  timeout - Maximum time to wait, in seconds, or None to
+                      wait indefinitely.
+
+    Output: The number of sockets that were ready.
+    """
+    if( self._poller ):
+      ms    = None if( timeout is None ) else int( timeout * 1000 )
+      ready = self._poller.poll( ms )
+    else:
+      masks = self._masks.items()
+      rl, wl, xl = select.select( [ fd for fd, m in masks if( m & _IN ) ],
+                                  [ fd for fd, m in masks if( m & _OUT ) ],
+                                  [], timeout )
+      ready = [ (fd, _IN) for fd in rl ] + [ (fd, _OUT) for fd in wl ]
+    for fd, ev in ready:
+      if( fd == self._lfd ):
+        self.handleAccept()
+        continue
+      entry = self._socks.get( fd )
+      if( entry is None ):
+        continue
+      r, isClient = entry
+      try:
+        alive = self._event( r, isClient, ev )
+      except socket.error:
+        alive = False
+      if( alive ):
+        self._update( r )
+      else:
+        self._close( r )
+    self.expire()
+    return( len( ready ) )
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=20000, burst=200 ):
+  # Measure the Session Request acceptance rate over loopback.
+  #
+  # Input:
+  #   count - Number of connections to make.
+  #   burst - Number of connections opened at once, to simulate a
+  #           connection storm.
+  #
+  # Notes:  Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_SessionServer as m; m._bench()'
+  #
+  import threading
+  from NBT_NameService import Name, LocalNameTable, NS_ACT
+  srv = Name( "SERVER", suffix='\x20' )
+  lnt = LocalNameTable( '\x7f\0\0\x01' )
+  lnt.updateEntry( srv.L1name, Status=NS_ACT )
+  acc = SessionAcceptor( lnt, '127.0.0.1', 0 )
+  acc.default = lambda sock, addr, called, calling: sock.close()
+  req  = SessionRequest( srv.L2name, Name( "CLIENT" ).L2name )
+  addr = acc.sock.getsockname()
+  done = [ False ]
+  def _clients():
+    for i in xrange( 0, count, burst ):
+      socks = [ socket.create_connection( addr ) for j in xrange( burst ) ]
+      for s in socks:
+        s.sendall( req )
+      for s in socks:
+        s.recv( 16 )
+        s.close()
+    done[0] = True
+
+  start = time.time()
+  t = threading.Thread( target=_clients )
+  t.start()
+  while( not done[0] ):
+    acc.poll( 0.05 )
+  elapsed = time.time() - start
+  t.join()
+  acc.close()
+
+  print "Sessions accepted.: %d" % acc.accepted
+  print "Elapsed...........: %.3f seconds" % elapsed
+  print "Rate..............: %.0f sessions/second" % (acc.accepted / elapsed)
+
+def _benchIdle( sizes=(5000, 50000), seconds=600, active=0.05 ):
+  # Simulate keepalive handling for large numbers of sessions.
+  #
+  # Input:
+  #   sizes   - The session counts to simulate.
+  #   seconds - The number of simulated seconds.
+  #   active  - The fraction of sessions that see traffic each second.
+  #
+  # Notes:  A simulated clock is used, and the ping and close functions
+  #         do nothing, so the figures show only the manager's overhead.
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_SessionServer as m; m._benchIdle()'
+  #
+  import random
+  rand = random.Random( 139 )
+  for count in sizes:
+    now   = [ 0.0 ]
+    kam   = KeepaliveManager( 60, 300, clock=lambda: now[0],
+                              ping=lambda k: None, close=lambda k: None )
+    sess  = [ kam.add( i ) for i in xrange( count ) ]
+    # Only a quarter of the sessions are ever active; the rest go idle.
+    busy  = sess[:count // 4]
+    nBusy = int( count * active )
+    fired = 0
+    spent = 0.0
+    for t in xrange( seconds ):
+      now[0] += 1.0
+      for s in rand.sample( busy, nBusy ):
+        kam.touch( s )
+      start  = time.time()
+      fired += kam.expire()
+      spent += time.time() - start
+    start = time.time()
+    for s in sess:
+      kam.touch( s )
+    perTouch = (time.time() - start) / count
+    print "Sessions..........: %d" % count
+    print "  Keepalives sent.: %d" % kam.pingCount
+    print "  Sessions closed.: %d" % kam.closeCount
+    print "  Timers fired....: %d" % fired
+    print "  expire() cost...: %.3f ms per simulated second" % \
+          ((spent * 1000.0) / seconds)
+    print "  Cost per timer..: %.3f us" % ((spent * 1000000.0) / fired)
+    print "  touch() cost....: %.3f us" % (perTouch * 1000000.0)
+
+def _benchRelay( count=2000, size=0x1FFFF ):
+  # Compare relayed throughput with a direct socket-to-socket copy.
+  #
+  # Input:
+  #   count - Number of Session Messages to send.
+  #   size  - Session Message payload size.  The default is the NBT
+  #           maximum.
+  #
+  # Notes:  The sink is a <SessionAcceptor> that hands each session to
+  #         a thread that reads and discards everything it receives.
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_SessionServer as m; m._benchRelay()'
+  #
+  import threading
+  from NBT_NameService import Name, LocalNameTable, NS_ACT
+  srv = Name( "SERVER", suffix='\x20' )
+  lnt = LocalNameTable( '\x7f\0\0\x01' )
+  lnt.updateEntry( srv.L1name, Status=NS_ACT )
+  sink  = SessionAcceptor( lnt, '127.0.0.1', 0 )
+  relay = SessionRelay( sink.sock.getsockname(), '127.0.0.1', 0 )
+  done  = []
+  def _discard( sock, addr, called, calling ):
+    sock.setblocking( 1 )
+    buf = bytearray( 0x40000 )
+    while( sock.recv_into( buf ) ):
+      pass
+    sock.close()
+  sink.default = lambda *args: threading.Thread( target=_discard,
+                                                 args=args ).start()
+  def _serve( svc ):
+    while( not done ):
+      svc.poll( 0.05 )
+  threads = [ threading.Thread( target=_serve, args=(svc,) )
+              for svc in (sink, relay) ]
+  for t in threads:
+    t.start()
+
+  req = SessionRequest( srv.L2name, Name( "CLIENT" ).L2name )
+  msg = SessionMessage( size ) + ('x' * size)
+  def _run( title, addr ):
+    c = socket.create_connection( addr )
+    c.sendall( req )
+    c.recv( 4 )
+    start = time.time()
+    for i in xrange( count ):
+      c.sendall( msg )
+    c.shutdown( socket.SHUT_WR )
+    c.recv( 1 )     # Wait for the far end to close.
+    elapsed = time.time() - start
+    c.close()
+    print "%s: %7.1f MiB/second" % \
+          (title, (count * len( msg )) / elapsed / 0x100000)
+
+  _run( "Direct.", sink.sock.getsockname() )
+  _run( "Relayed", relay.sock.getsockname() )
+
+  done.append( True )
+  for t in threads:
+    t.join()
+  relay.close()
+  sink.close()
+
+# ============================================================================ #
@@ -77,7 +77,8 @@ interact with next layer protocols (such as SMB).
 
 The NBT Session Service is simple.  It is implemented here as a set of
 functions.  In some cases, the functions do nothing more than return a
-constant value.
+constant value.  The <SessionFramer> class splits a received byte stream
+into messages.
 
 CONSTANTS:
 
@@ -168,6 +169,8 @@ SS_ERR_UNSPECIFIED    = 0x8F  # Unspecified Error
 #   _formatIPPort - Convert an IPv4 address (expressed as a string of octets)
 #                   and a port number (as a unsigned short) into a six-byte
 #                   string of octets.  ...and back again.
+#   _SS_BUFSIZE   - Default SessionFramer receive buffer size.  Room for
+#                   (almost) two maximum-sized messages.
 #
 #   _msgLenDict   - Used to validate Session Service messages by mapping
 #                   message types to the fixed value of their own length
@@ -181,6 +184,8 @@ SS_ERR_UNSPECIFIED    = 0x8F  # Unspecified Error
 _formatLong   = struct.Struct( "!L" )
 _formatIPPort = struct.Struct( "!4sH" )
 
+_SS_BUFSIZE   = 0x40000
+
 _msgLenDict   = { SS_SESSION_REQUEST  : 68,
                   SS_POSITIVE_RESPONSE: 0,
                   SS_NEGATIVE_RESPONSE: 1,
@@ -201,6 +206,198 @@ _errCodeDict  = { SS_ERR_NOT_LISTENING: "Not Listening on Called Name",
                   SS_ERR_UNSPECIFIED  : "Unspecified Error" }
 
 
+# Classes -------------------------------------------------------------------- #
+#
+
+class SessionFramer( object ):
+  """Split a Session Service byte stream into messages.
+
+  The framer reads from a stream socket (or anything else that provides
+  a recv_into() method) into a single, reusable buffer, and hands back
+  complete messages as (message type, payload) tuples.  The payload is
+  a memoryview of the buffer, so the data is never copied on its way
+  to the next layer up.
+
+  Partial messages (including partial headers) are kept in the buffer
+  until the rest arrives.  By default, the buffer is large enough to
+  hold the largest possible NBT message, so a message never has to be
+  pieced together.  A partial message is only moved (to the front of
+  the buffer) when there is not enough room left after it for the rest
+  of the message.  If the message is larger than the whole buffer, a
+  larger buffer (sized to the message, rounded up to a multiple of
+  64KiB) is allocated to replace it.
+
+  Important:  The memoryviews returned by <frames()> are only valid
+              until the next call to <recv()> or <feed()>.  If the
+              payload is needed after that, copy it (e.g., using the
+              tobytes() method of the memoryview).
+
+  Instance Attributes:
+    sock    - The stream socket from which data is read.
+    rcvCount- Number of bytes read or fed into the framer.
+    msgCount- Number of messages returned.
+
+  Doctest:
+    >>> fr = SessionFramer()
+    >>> msg = SessionMessage( 5 ) + "Hello" + Keepalive()
+    >>> msg += SessionMessage( 7 ) + "Goodbye"
+    >>> fr.feed( msg[:3] ), list( fr.frames() )   # Partial header.
+    (3, [])
+    >>> fr.feed( msg[3:13] )
+    10
+    >>> [ (t, v.tobytes()) for t, v in fr.frames() ]
+    [(0, 'Hello'), (133, '')]
+    >>> fr.feed( msg[13:] ), len( fr )
+    (11, 11)
+    >>> [ (t, v.tobytes()) for t, v in fr.frames() ], len( fr )
+    ([(0, 'Goodbye')], 0)
+    >>> fr.feed( "\\x83\\0\\0\\x02\\x8F\\x8F" )
+    6
+    >>> try:
+    ...   list( fr.frames() )
+    ... except NBTerror as e:
+    ...   print e.eCode
+    1002
+  """
+  def __init__( self, sock=None, bufSize=_SS_BUFSIZE ):
+    """Create a Session Service framer.
+
+    Input:
+      sock    - A connected stream socket, or None if the data will be
+                provided using <feed()>.
+      bufSize - The initial size of the receive buffer.  Larger buffers
+                allow more messages to be read per recv() call.  The
+                buffer will grow as needed to hold a large message.
+
+    Errors:
+      AssertionError  - Raised if <bufSize> is less than 4.
+    """
+    assert( bufSize >= 4 ), "Buffer size (%d) is too small." % bufSize
+    # <_buf>  - The receive buffer.
+    # <_view> - A memoryview of the receive buffer.
+    # <_rpos> - Start of the first incomplete (or unreturned) message.
+    # <_wpos> - End of the data in the buffer.
+    self.sock     = sock
+    self._buf     = bytearray( bufSize )
+    self._view    = memoryview( self._buf )
+    self._rpos    = 0
+    self._wpos    = 0
+    self.rcvCount = 0
+    self.msgCount = 0
+
+  # The maximum message length.
+  maxLen = 0x0001FFFF
+
+  def __len__( self ):
+    """The number of bytes buffered but not yet returned.
+    """
+    return( self._wpos - self._rpos )
+
+  def _header( self, pos ):
+    # Parse a message header.
+    #
+    # Input:  pos - The buffer offset of the header.
+    #
+    # Output: A tuple: (message type, message length)
+    #
+    # Errors: NBTerror( 1002 ), NBTerror( 1005 ); see ParseMsg().
+    #
+    buf   = self._buf
+    mType = buf[pos]
+    if( buf[pos+1] & 0xFE ):
+      raise NBTerror( 1002,
+                      "Malformed Session Service message (non-zero FLAGS)" )
+    mLen = ((buf[pos+1] << 16) | (buf[pos+2] << 8) | buf[pos+3])
+    if( (SS_SESSION_MESSAGE != mType) and (_msgLenDict.get( mType ) != mLen) ):
+      # Not the fast path.  Let ParseMsg() sort out the error.
+      ParseMsg( str( buf[pos:pos+4] ) )
+    return( (mType, mLen) )
+
+  def _makeRoom( self ):
+    # Ensure that there is room in the buffer for the remainder of the
+    # current partial message, moving it to the front if necessary.
+    #
+    rpos, wpos = self._rpos, self._wpos
+    if( rpos == wpos ):
+      self._rpos = self._wpos = 0
+      return
+    need = 4
+    if( (wpos - rpos) >= 4 ):
+      need += self._header( rpos )[1]
+    if( (rpos + need) > len( self._buf ) ):
+      count = wpos - rpos
+      if( need > len( self._buf ) ):
+        # Replace the buffer with one that will hold the message.
+        buf = bytearray( (need + 0xFFFF) & ~0xFFFF )
+        buf[:count] = self._view[rpos:wpos]
+        self._buf  = buf
+        self._view = memoryview( buf )
+      else:
+        self._buf[:count] = self._view[rpos:wpos]
+      self._rpos = 0
+      self._wpos = count
+
+  def recv( self ):
+    """Read available data from the socket into the buffer.
+
+    Output: The number of bytes read.  Zero indicates that the peer
+            has closed the connection.
+
+    Errors: socket.error  - Passed through from the socket.  With a
+                            non-blocking socket, this may indicate that
+                            there is nothing to read.
+    """
+    self._makeRoom()
+    count = self.sock.recv_into( self._view[self._wpos:] )
+    self._wpos    += count
+    self.rcvCount += count
+    return( count )
+
+  def feed( self, data=None ):
+    """Copy data into the buffer.
+
+    Input:  data  - A string of octets.
+
+    Output: The number of bytes copied, which may be less than the
+            length of <data> if the buffer is full.  Call <frames()>
+            and then feed the remainder.
+    """
+    self._makeRoom()
+    count = min( len( data ), (len( self._buf ) - self._wpos) )
+    self._buf[self._wpos:self._wpos+count] = data[:count]
+    self._wpos    += count
+    self.rcvCount += count
+    return( count )
+
+  def frames( self ):
+    """Return the complete messages that are in the buffer.
+
+    Output: A generator.  Each item is a tuple:
+              (message type, payload memoryview)
+            For SS_SESSION_MESSAGE, the payload is the next layer
+            message (e.g., an SMB message).  For other message types,
+            it is the body of the Session Service message; use
+            ParseCNames(), ParseErrCode() or ParseRetarget() as
+            appropriate.
+
+    Errors: NBTerror( 1002 )  - A malformed message header was found.
+            NBTerror( 1005 )  - An unknown message type was found.
+
+    Notes:  A stream that has produced an error should be closed.  There
+            is no way to find the start of the next message.
+    """
+    view = self._view
+    while( (self._wpos - self._rpos) >= 4 ):
+      pos = self._rpos
+      mType, mLen = self._header( pos )
+      end = pos + 4 + mLen
+      if( end > self._wpos ):
+        return
+      self._rpos     = end
+      self.msgCount += 1
+      yield( (mType, view[pos+4:end]) )
+
+
 # Functions ------------------------------------------------------------------ #
 #
 
@@ -632,6 +829,41 @@ def dump( msg=None, indent=0 ):
   return( s )
 
 
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=20000, size=0xFFFF ):
+  # Measure SessionFramer throughput over a local socket pair.
+  #
+  # Input:
+  #   count - Number of Session Messages to send.
+  #   size  - Payload size of each message.
+  #
+  # Notes:  Run from the directory above the one containing this module:
+  #           $ python -c 'import nbt.NBT_SessionService as m; m._bench()'
+  #
+  import socket, threading, time
+  rcv, snd = socket.socketpair()
+  msg = SessionMessage( size ) + ('x' * size)
+  def _sender():
+    for i in xrange( count ):
+      snd.sendall( msg )
+    snd.close()
+  fr = SessionFramer( rcv )
+  got = 0
+  start = time.time()
+  threading.Thread( target=_sender ).start()
+  while( fr.recv() ):
+    for mType, payload in fr.frames():
+      got += len( payload )
+  elapsed = time.time() - start
+  rcv.close()
+
+  print "Messages received.: %d" % fr.msgCount
+  print "Elapsed...........: %.3f seconds" % elapsed
+  print "Throughput........: %.1f MiB/second" % (got / elapsed / 0x100000)
+
+
 # ============================================================================ #
 # "...and then", said the long nose weevil, "Glenda the Gladiator landed her
 # fighter jet on the deck of a suburban shopping mall and became Secretary of
@@ -0,0 +1,543 @@
+# ============================================================================ #
+#                              SMB2_Connection.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Carnaval Toolkit: Multiplexed SMB2/3 client connection.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - Python v2.7 has neither asyncio nor concurrent.futures.  The
+#     connection uses a receiver thread, and a minimal future class
+#     (<SMB2_Future>) built on threading.Event.  Any number of threads
+#     may send requests over the same connection at the same time.
+#
+# References:
+#
+#   [MS-SMB2]   Microsoft Corporation, "Server Message Block (SMB)
+#               Protocol Versions 2 and 3", sections 3.2.4 (sending
+#               requests), 3.2.5.1 (receiving responses), and 3.2.5.1.5
+#               (interim responses)
+#               http://msdn.microsoft.com/en-us/library/cc246482.aspx
+#
+# ============================================================================ #
+#
+"""Carnaval Toolkit: Multiplexed SMB2/3 Client Connection
+
+An <SMB2_Connection> lets many requests share a single Direct TCP
+connection.  Each request is assigned MessageIds from the connection's
+<SMB2_CreditWindow>, and an <SMB2_Future> is returned immediately.  A
+receiver thread reads responses, matches them to futures by MessageId,
+and completes the futures.
+
+Interim (STATUS_PENDING) responses are handled quietly: the credits they
+grant are applied, the AsyncId is recorded in the future (so that the
+request can be cancelled), and the future remains pending until the
+final response arrives.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   socket          - For shutting down the connection.
+#   struct          - Raised by malformed headers (struct.error).
+#   threading       - Receiver thread, locks, and events.
+#   SMB_Core        - The SMBerror exception class.
+#   SMB_Status      - NT Status codes.
+#   SMB2_Header     - SMB2 header composition and header views.
+#   SMB2_Credits    - Credit and MessageId management.
+#   SMB2_ReadWrite  - The receiver, which places READ data.
+#   SMB_Transport   - Direct TCP framing.
+#
+
+import socket       # Sockets.
+import struct       # Binary data handling.
+import threading    # Threads, locks, and events.
+
+from SMB_Core       import SMBerror
+from SMB_Status     import STATUS_PENDING
+from SMB2_Header    import *
+from SMB2_Header    import _SMB2_Header
+from SMB2_Credits   import SMB2_CreditWindow
+from SMB2_ReadWrite import SMB2_Receiver
+from SMB_Transport  import SMB_Transport
+
+
+# Constants ------------------------------------------------------------------ #
+#
+
+SMB2_UNSOLICITED_ID = 0xFFFFFFFFFFFFFFFF  # MessageId of oplock breaks.
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class SMB2_Future( object ):
+  """The pending result of an SMB2 request.
+
+  Instance Attributes:
+    messageId - The MessageId of the request.
+    asyncId   - The AsyncId given by the server in an interim response,
+                or None.
+    interim   - Number of interim responses received.
+    into      - The buffer into which READ response data is placed, or
+                None.
+
+  Doctest:
+    >>> f = SMB2_Future( 7 )
+    >>> f.done(), f.result( 0 )
+    (False, None)
+    >>> f.addCallback( lambda fut: fut.messageId )
+    >>> f.addCallback( lambda fut: 1 / 0 )
+    >>> f.setResult( "done" )
+    >>> f.done(), f.result()
+    (True, 'done')
+  """
+  __slots__ = ( "messageId", "asyncId", "interim", "handler", "into",
+                "_event", "_result", "_error", "_callbacks" )
+
+  def __init__( self, messageId=0, handler=None, into=None ):
+    """Create a future.
+
+    Input:
+      messageId - The MessageId of the request.
+      handler   - A function that converts the response into the result
+                  of the future.  See <SMB2_Connection.send()>.
+      into      - A destination buffer for READ data, or None.
+    """
+    self.messageId  = messageId
+    self.asyncId    = None
+    self.interim    = 0
+    self.handler    = handler
+    self.into       = into
+    self._event     = threading.Event()
+    self._result    = None
+    self._error     = None
+    self._callbacks = []
+
+  def done( self ):
+    """True if the result (or an error) is available."""
+    return( self._event.is_set() )
+
+  def _finish( self ):
+    # Wake up waiters and run callbacks.  An exception raised by a
+    # callback is discarded, so that it cannot stop the other callbacks
+    # or be mistaken for a failure of the request.
+    self._event.set()
+    callbacks, self._callbacks = self._callbacks, []
+    for cb in callbacks:
+      try:
+        cb( self )
+      except Exception:
+        pass
+
+  def setResult( self, result=None ):
+    """Complete the future with a result."""
+    self._result = result
+    self._finish()
+
+  def setError( self, error=None ):
+    """Complete the future with an exception."""
+    self._error = error
+    self._finish()
+
+  def addCallback( self, cb=None ):
+    """Call <cb( future )> when the future completes.
+
+    Notes:  If the future is already complete, the callback is called
+            immediately.  Otherwise it is called from the receiver
+            thread, so it should be quick.
+    """
+    if( self.done() ):
+      cb( self )
+    else:
+      self._callbacks.append( cb )
+
+  def result( self, timeout=None ):
+    """Wait for, and return, the result.
+
+    Input:  timeout - Maximum number of seconds to wait, or None to wait
+                      until the future completes.
+
+    Output: The result, or None if the timeout expired.
+
+    Errors: Any exception stored with <setError()> is raised.
+    """
+    if( not self._event.wait( timeout ) ):
+      return( None )
+    if( self._error is not None ):
+      raise self._error
+    return( self._result )
+
+
+class SMB2_Connection( object ):
+  """A multiplexed SMB2 client connection over Direct TCP.
+
+  Instance Attributes:
+    transport   - The <SMB_Transport> used to send messages.
+    receiver    - The <SMB2_Receiver> used to receive messages.
+    credits     - The <SMB2_CreditWindow>.
+    creditGoal  - The number of credits the connection tries to hold.
+                  Each request asks for enough credits to get back up to
+                  this level.
+    unsolicited - A function that is called with (header view, body)
+                  for messages that do not match a request (e.g., oplock
+                  breaks).  The views are only valid for the duration of
+                  the call.  If None, such messages are counted and
+                  dropped.
+    dropCount   - Number of messages that did not match a request.
+
+  Doctest:
+    >>> a, b = socket.socketpair()
+    >>> conn = SMB2_Connection( a )
+    >>> srv  = SMB_Transport( b )
+    >>> f1 = conn.send( _SMB2_Header( SMB2_COM_ECHO ), "\\x04\\0\\0\\0" )
+    >>> f2 = conn.send( _SMB2_Header( SMB2_COM_ECHO ), "\\x04\\0\\0\\0",
+    ...                 wait=False )
+    >>> f2 is None        # Only one credit to start with.
+    True
+    >>> def reply( req, status, async=False ):
+    ...   rsp = bytearray( req.tobytes() )
+    ...   hv  = SMB2_HeaderView( rsp )
+    ...   hv.flags = SMB2_FLAGS_SERVER_TO_REDIR | \\
+    ...              (SMB2_FLAGS_ASYNC_COMMAND if( async ) else 0)
+    ...   hv.status, hv.creditReqResp = status, 8
+    ...   if( async ):
+    ...     hv.asyncId = 99
+    ...   srv.send( rsp )
+    >>> n = srv.recv(); req = list( srv.messages() )[0]
+    >>> reply( req, STATUS_PENDING, True )
+    >>> reply( req, 0 )
+    >>> hv, body = f1.result( 5 )
+    >>> print hv.messageId, hv.status, f1.asyncId, f1.interim
+    0 0 99 1
+    >>> print conn.credits.credits
+    16
+    >>> from SMB2_ReadWrite import SMB2_ReadRequest, SMB2_ReadResponse
+    >>> dest = bytearray( 0x20000 )
+    >>> req  = SMB2_ReadRequest( 'F' * 16, 0, len( dest ) )
+    >>> f3 = conn.send( _SMB2_Header( SMB2_COM_READ ), req.compose(),
+    ...                 req.charge, into=memoryview( dest ) )
+    >>> n = srv.recv(); req = list( srv.messages() )[0]
+    >>> rsp = bytearray( req[:SMB2_HDR_SIZE].tobytes() )
+    >>> SMB2_HeaderView( rsp ).flags = SMB2_FLAGS_SERVER_TO_REDIR
+    >>> rsp += SMB2_ReadResponse( len( dest ) ).compose()
+    >>> srv.sendParts( rsp, memoryview( 'D' * len( dest ) ) )
+    >>> hv, body = f3.result( 5 )
+    >>> len( body ), dest == ('D' * len( dest ))
+    (16, True)
+
+    A callback that raises an exception does not disturb the receiver,
+    but a malformed response closes the connection:
+    >>> echo = lambda: conn.send( _SMB2_Header( SMB2_COM_ECHO ),
+    ...                           "\\x04\\0\\0\\0" )
+    >>> f4 = echo()
+    >>> f4.addCallback( lambda fut: 1 / 0 )
+    >>> n = srv.recv(); reply( list( srv.messages() )[0], 0 )
+    >>> f4.result( 5 )[0].status
+    0
+    >>> f5 = echo()
+    >>> n = srv.recv(); reply( list( srv.messages() )[0], 0 )
+    >>> f5.result( 5 )[0].status
+    0
+    >>> f6 = echo()
+    >>> srv.send( "\\xfeSMB" + (6 * "\\0") )
+    >>> try:
+    ...   f6.result( 5 )
+    ... except SMBerror as e:
+    ...   print e.eCode, len( conn )
+    1002 0
+    >>> conn.close(); b.close()
+    >>> try:
+    ...   conn.send( _SMB2_Header( SMB2_COM_ECHO ), "\\x04\\0\\0\\0" )
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1002
+  """
+  def __init__( self, sock=None, credits=None, creditGoal=128 ):
+    """Create a connection and start the receiver thread.
+
+    Input:
+      sock        - A connected stream socket (Direct TCP transport).
+      credits     - An <SMB2_CreditWindow>.  The default is a new window
+                    with one credit, as is correct for a new connection.
+      creditGoal  - The number of credits to ask for.
+    """
+    self.transport   = SMB_Transport( sock, True )
+    self.receiver    = SMB2_Receiver( sock, self._sink )
+    self.credits     = SMB2_CreditWindow() if( credits is None ) else credits
+    self.creditGoal  = creditGoal
+    self.unsolicited = None
+    self.dropCount   = 0
+    # <_pending>  - Maps MessageIds to futures.
+    # <_pendLock> - Protects <_pending>.
+    # <_sendLock> - Serializes writes to the socket.
+    # <_closed>   - Set when the connection is closed or lost.
+    self._pending  = {}
+    self._pendLock = threading.Lock()
+    self._sendLock = threading.Lock()
+    self._closed   = None
+    self._reader   = threading.Thread( target=self._run )
+    self._reader.daemon = True
+    self._reader.start()
+
+  def __len__( self ):
+    """The number of outstanding requests."""
+    return( len( self._pending ) )
+
+  def _sink( self, hv ):
+    # Return the destination buffer for a READ response, if any.
+    fut = self._pending.get( hv.messageId )
+    return( None if( fut is None ) else fut.into )
+
+  def _copyHandler( self, hv, body ):
+    # Default response handler: copy the response out of the receive
+    # buffer, and return a (header view, body) tuple for the copy.
+    msg = bytearray( hv.header() )
+    msg += body
+    return( (SMB2_HeaderView( msg ), memoryview( msg )[SMB2_HDR_SIZE:]) )
+
+  def send( self, hdr=None, body='', charge=1, handler=None, wait=True,
+                  payload=None, into=None ):
+    """Send a request.
+
+    Input:
+      hdr     - The request header; either an <_SMB2_Header> or a
+                composed 64-byte header.  The MessageId, CreditCharge,
+                and CreditRequest fields are filled in here.
+      body    - The request body, as a <str> or anything that supports
+                the buffer interface.
+      charge  - The CreditCharge of the request.  See
+                <SMB2_CreditCharge()>.
+      handler - A function that is called with (header view, body view)
+                when the final response arrives.  Its return value
+                becomes the result of the future.  It is called from the
+                receiver thread, and the views are only valid for the
+                duration of the call.  The default handler copies the
+                response.
+      wait    - If True, block until enough credits are available.  If
+                False, return None if there are not enough credits.
+      payload - Data to be sent following the body, without copying
+                (e.g., a memoryview of WRITE data).
+      into    - A writable buffer (e.g., a memoryview of a bytearray or
+                an mmap) into which READ response data is received.  If
+                given, the body passed to the handler ends at the
+                DataOffset, and the data is found in <into>.  If the
+                response carries more data than <into> can hold, the
+                data is left in the body instead.
+
+    Output: An <SMB2_Future>, or None.
+
+    Errors: SMBerror( 1002 )  - Raised if the connection is closed, or
+                                if there are no credits and none can be
+                                expected.
+            socket.error      - Passed through from the socket.
+
+    Notes:  Don't pass a wait value of True from within a handler or
+            callback; the receiver thread would be waiting on itself.
+    """
+    if( self._closed ):
+      raise SMBerror( 1002, "Connection closed (%s)" % self._closed )
+    if( wait ):
+      messageId = self.credits.acquire( charge )
+    else:
+      messageId = self.credits.tryAcquire( charge )
+    if( messageId is None ):
+      return( None )
+
+    msg = bytearray( hdr.compose() if( isinstance( hdr, _SMB2_Header ) )
+                     else hdr )
+    hv  = SMB2_HeaderView( msg )
+    hv.messageId     = messageId
+    hv.creditCharge  = charge
+    hv.creditReqResp = min( max( charge, self.creditGoal -
+                                 self.credits.credits ), 0xFFFF )
+    del hv
+    msg += body
+
+    fut = SMB2_Future( messageId, handler or self._copyHandler, into )
+    with self._pendLock:
+      # Checked again, under the lock, so that the future cannot be
+      # added after <_shutdown()> has failed the pending requests.
+      if( self._closed ):
+        raise SMBerror( 1002, "Connection closed (%s)" % self._closed )
+      self._pending[ messageId ] = fut
+    try:
+      with self._sendLock:
+        if( payload is None ):
+          self.transport.send( msg )
+        else:
+          self.transport.sendParts( msg, payload )
+    except socket.error:
+      with self._pendLock:
+        self._pending.pop( messageId, None )
+      raise
+    return( fut )
+
+  def cancel( self, fut=None ):
+    """Send an SMB2 CANCEL for an outstanding request.
+
+    Input:  fut - The future of the request to cancel.
+
+    Notes:  CANCEL does not use a credit or a MessageId of its own.  If
+            the server has already sent an interim response, the
+            AsyncId is used to identify the request.  The future will
+            be completed by the server's response to the original
+            request (typically with STATUS_CANCELLED).
+    """
+    hdr = _SMB2_Header( SMB2_COM_CANCEL )
+    hdr.messageId = fut.messageId
+    if( fut.asyncId is not None ):
+      hdr.flagAsync = True
+      hdr.asyncId   = fut.asyncId
+    with self._sendLock:
+      self.transport.send( hdr.compose() + "\x04\0\0\0" )
+
+  def _dispatch( self, hv, body ):
+    # Match a received message to a future.
+    messageId = hv.messageId
+    fut = self._pending.get( messageId )
+    if( fut is None ):
+      if( (SMB2_UNSOLICITED_ID == messageId) and self.unsolicited ):
+        self.unsolicited( hv, body )
+      else:
+        self.dropCount += 1
+      return
+    if( hv.flagAsync and (STATUS_PENDING == hv.status) ):
+      # Interim response.  Park the future until the final reply.
+      self.credits.grant( hv.creditReqResp )
+      fut.asyncId  = hv.asyncId
+      fut.interim += 1
+      return
+    with self._pendLock:
+      self._pending.pop( messageId, None )
+    self.credits.complete( messageId, hv.creditReqResp )
+    try:
+      fut.setResult( fut.handler( hv, body ) )
+    except Exception as e:
+      fut.setError( e )
+
+  def _run( self ):
+    # Receiver thread main loop.
+    why = "connection lost"
+    try:
+      while( self.receiver.recv() ):
+        for msg in self.receiver.messages():
+          for hv, body in SMB2_SplitCompound( msg ):
+            self._dispatch( hv, body )
+    except (socket.error, SMBerror, ValueError,
+            struct.error, AssertionError) as e:
+      # struct.error and AssertionError come from malformed headers.
+      why = str( e )
+    finally:
+      # Whatever happened, no more responses will be received.
+      self._shutdown( why )
+
+  def _shutdown( self, why ):
+    # Fail all outstanding requests.
+    with self._pendLock:
+      if( not self._closed ):
+        self._closed = why
+      pending, self._pending = self._pending, {}
+    for fut in pending.itervalues():
+      fut.setError( SMBerror( 1002, "Connection closed (%s)" % why ) )
+    # Fail anyone waiting for credits.
+    self.credits.abort( why )
+
+  def close( self ):
+    """Close the connection.
+
+    Notes:  Outstanding requests fail with SMBerror( 1002 ).
+    """
+    if( not self._closed ):
+      self._closed = "closed locally"
+      try:
+        self.transport.sock.shutdown( socket.SHUT_RDWR )
+      except socket.error:
+        pass
+      self._reader.join()
+      self.transport.sock.close()
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=20000, window=64 ):
+  # Compare lockstep and pipelined request rates over a socketpair.
+  #
+  # Input:
+  #   count   - Number of ECHO requests to send.
+  #   window  - Number of credits granted by the stand-in server.
+  #
+  # Notes:  The stand-in server answers every request, in order, and
+  #         grants one credit per response (after an initial grant
+  #         of <window> credits).
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import smb.SMB2_Connection as m; m._bench()'
+  #
+  import time
+  def _server( sock ):
+    tx = SMB_Transport( sock )
+    first = True
+    while( tx.recv() ):
+      out = []
+      for req in tx.messages():
+        rsp = bytearray( req )
+        hv  = SMB2_HeaderView( rsp )
+        hv.flags = SMB2_FLAGS_SERVER_TO_REDIR
+        hv.creditReqResp = window if( first ) else 1
+        first = False
+        out.append( tx.header( len( rsp ) ) + str( rsp ) )
+      sock.sendall( ''.join( out ) )
+    sock.close()
+
+  echo = _SMB2_Header( SMB2_COM_ECHO ).compose()
+  for pipelined in (False, True):
+    a, b = socket.socketpair()
+    threading.Thread( target=_server, args=(b,) ).start()
+    conn  = SMB2_Connection( a )
+    conn.send( echo, "\x04\0\0\0" ).result()
+    start = time.time()
+    if( pipelined ):
+      futs = [ conn.send( echo, "\x04\0\0\0" ) for i in xrange( count ) ]
+      futs[-1].result()
+    else:
+      for i in xrange( count ):
+        conn.send( echo, "\x04\0\0\0" ).result()
+    elapsed = time.time() - start
+    conn.close()
+    print "%s: %8.0f requests/second" % \
+          ("Pipelined" if( pipelined ) else "Lockstep.", count / elapsed)
+
+# ============================================================================ #
@@ -0,0 +1,642 @@
+# ============================================================================ #
+#                               SMB2_Credits.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Carnaval Toolkit: SMB2/3 credit and MessageId management.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - SMB2 flow control works like this: the server grants credits, and
+#     each credit allows the client to use one MessageId.  A request that
+#     carries more than 64KiB of payload (a "multi-credit" request) uses
+#     CreditCharge credits and that many consecutive MessageIds, starting
+#     with the MessageId in the header.  Credits are granted in the
+#     CreditResponse field of responses, including interim (async)
+#     responses.
+#
+#   - Python v2.7 has no asyncio, so the "wait for credits" call blocks
+#     on a threading.Condition.  A non-blocking variant is also provided
+#     for single-threaded, event-driven code.
+#
+# References:
+#
+#   [MS-SMB2]   Microsoft Corporation, "Server Message Block (SMB)
+#               Protocol Versions 2 and 3", sections 3.2.4.1.5 (client
+#               credit handling) and 3.3.1.1 (server sequence window)
+#               http://msdn.microsoft.com/en-us/library/cc246482.aspx
+#
+# ============================================================================ #
+#
+"""Carnaval Toolkit: SMB2/3 Credit Management
+
+The <SMB2_CreditWindow> class manages the client side of SMB2 credits.
+It hands out ranges of MessageIds for outgoing requests (blocking, if
+necessary, until enough credits are available), keeps track of which
+requests are outstanding, and applies the credits granted in responses.
+
+The <SMB2_SequenceWindow> class is the server side.  It validates the
+MessageIds of incoming requests, and grants credits according to a
+pluggable policy (by default, an <SMB2_CreditPolicy>).
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   threading     - Condition variable, for waiting on credits.
+#   time          - Timeouts.
+#   SMB_Core      - The SMBerror exception class.
+#   SMB_Status    - NT Status codes.
+#   SMB2_Header   - SMB2 command codes.
+#
+
+import threading    # Condition variables.
+import time         # Timeouts.
+
+from SMB_Core   import SMBerror         # SMB exception class.
+from SMB_Status import STATUS_PENDING   # Interim response status.
+from SMB2_Header import SMB2_COM_CANCEL # Cancel command code.
+
+
+# Constants ------------------------------------------------------------------ #
+#
+
+SMB2_CREDIT_SIZE = 0x10000    # Payload bytes covered by a single credit.
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class SMB2_CreditWindow( object ):
+  """Client-side SMB2 credit and MessageId window.
+
+  MessageIds are allocated in ascending order.  A request with a
+  CreditCharge of N uses N credits and the N MessageIds starting with
+  the one returned by <acquire()> or <tryAcquire()>.  Outstanding
+  requests are recorded in a bitmap, indexed by MessageId relative to
+  the oldest outstanding request, so the memory used is proportional to
+  the span of the window rather than to the number of MessageIds ever
+  used.
+
+  Instance Attributes:
+    credits   - The number of credits currently available.  Read-only.
+    nextId    - The next MessageId to be allocated.  Read-only.
+    lowId     - The MessageId of the oldest outstanding request, or
+                <nextId> if there are no outstanding requests.
+                Read-only.
+
+  Doctest:
+    >>> cw = SMB2_CreditWindow()
+    >>> print cw.tryAcquire(), cw.tryAcquire()  # Only one credit to start.
+    0 None
+    >>> cw.complete( 0, 31 )
+    >>> a, b = cw.tryAcquire( 8 ), cw.tryAcquire( 1 )
+    >>> print a, b, cw.credits, len( cw )
+    1 9 22 2
+    >>> cw.complete( 9, 1 )                     # Out of order is fine.
+    >>> print cw.lowId, cw.credits
+    1 23
+    >>> cw.complete( 1, 8 )
+    >>> print cw.lowId, cw.nextId, cw.credits, len( cw )
+    10 10 31 0
+    >>> try:
+    ...   cw.complete( 9, 1 )
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1002
+    >>> cw.abort( "connection lost" )
+    >>> try:
+    ...   cw.acquire()
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1002
+  """
+  def __init__( self, credits=1, nextId=0, maxCredits=0xFFFF ):
+    """Create a credit window.
+
+    Input:
+      credits     - The initial number of credits.  A new connection
+                    starts with one credit, which is used by the
+                    NEGOTIATE request.
+      nextId      - The first MessageId to be allocated.
+      maxCredits  - An upper bound on the number of credits the window
+                    will accept.  Grants beyond this are ignored, which
+                    protects against a misbehaving server.
+    """
+    self._credits    = int( credits )
+    self._nextId     = long( nextId )
+    self._maxCredits = int( maxCredits )
+    # <_base> is the MessageId that corresponds to bit 0 of <_bits>.
+    # Each set bit marks the first MessageId of an outstanding request.
+    self._base  = self._nextId
+    self._bits  = 0L
+    self._count = 0
+    self._cond  = threading.Condition( threading.Lock() )
+    # <_aborted> is the reason given to <abort()>, or None.
+    self._aborted = None
+
+  @property
+  def credits( self ):
+    """The number of credits currently available.  Read-only."""
+    return( self._credits )
+
+  @property
+  def nextId( self ):
+    """The next MessageId to be allocated.  Read-only."""
+    return( self._nextId )
+
+  @property
+  def lowId( self ):
+    """The oldest outstanding MessageId, or <nextId>.  Read-only."""
+    return( self._base )
+
+  def __len__( self ):
+    """The number of outstanding requests."""
+    return( self._count )
+
+  def __contains__( self, messageId ):
+    """True if <messageId> is the first MessageId of an outstanding
+    request."""
+    bit = messageId - self._base
+    return( (bit >= 0) and bool( (self._bits >> bit) & 1 ) )
+
+  def _check( self ):
+    # Raise an exception if the window has been aborted.  The lock must
+    # be held.
+    if( self._aborted is not None ):
+      raise SMBerror( 1002, "Credit window aborted (%s)" % self._aborted )
+
+  def _take( self, charge ):
+    # Allocate <charge> credits and MessageIds.  The lock must be held.
+    messageId = self._nextId
+    self._bits |= (1L << (messageId - self._base))
+    self._nextId  += max( charge, 1 )
+    self._credits -= charge
+    self._count   += 1
+    return( messageId )
+
+  def tryAcquire( self, charge=1 ):
+    """Allocate MessageIds for a request, without waiting.
+
+    Input:  charge  - The CreditCharge of the request.  See
+                      <SMB2_CreditCharge()>.
+
+    Output: The first MessageId of the allocated range, or None if
+            there are not enough credits available.
+
+    Errors: SMBerror( 1002 )  - Raised if the window has been aborted.
+    """
+    with self._cond:
+      self._check()
+      if( self._credits < charge ):
+        return( None )
+      return( self._take( charge ) )
+
+  def acquire( self, charge=1, timeout=None ):
+    """Allocate MessageIds for a request, waiting for credits if needed.
+
+    Input:
+      charge  - The CreditCharge of the request.
+      timeout - Maximum number of seconds to wait, or None to wait
+                for as long as it takes.
+
+    Output: The first MessageId of the allocated range, or None if the
+            timeout expired.
+
+    Errors: SMBerror( 1002 )  - Raised if there are not enough credits
+                                and no outstanding requests, so that no
+                                more credits can ever arrive, or if the
+                                window is (or becomes) aborted.
+    """
+    with self._cond:
+      self._check()
+      if( (self._credits < charge) and (timeout is not None) ):
+        # Condition.wait() does not report whether it timed out, so
+        # keep track of the deadline ourselves.
+        deadline = time.time() + timeout
+      while( self._credits < charge ):
+        if( not self._count ):
+          s = "Insufficient credits (%d < %d)" % (self._credits, charge)
+          raise SMBerror( 1002, s )
+        if( timeout is None ):
+          self._cond.wait()
+        else:
+          remaining = deadline - time.time()
+          if( remaining <= 0 ):
+            return( None )
+          self._cond.wait( remaining )
+        self._check()
+      return( self._take( charge ) )
+
+  def abort( self, why=None ):
+    """Fail all current and future attempts to acquire credits.
+
+    Input:  why - A short description of the reason, used in the error
+                  message.
+
+    Notes:  This is used when the connection is lost.  Threads waiting
+            in <acquire()> are woken and raise SMBerror( 1002 ).
+    """
+    with self._cond:
+      self._aborted = "aborted" if( why is None ) else why
+      self._cond.notify_all()
+
+  def grant( self, credits=0 ):
+    """Add credits granted by the server.
+
+    Input:  credits - The CreditResponse value from a response.
+
+    Notes:  This is used for interim (STATUS_PENDING) responses, which
+            grant credits but do not complete the request.
+    """
+    with self._cond:
+      self._credits = min( self._credits + credits, self._maxCredits )
+      self._cond.notify_all()
+
+  def complete( self, messageId=0, credits=0 ):
+    """Mark a request as complete and add the credits granted.
+
+    Input:
+      messageId - The MessageId from the final response.
+      credits   - The CreditResponse value from the final response.
+
+    Errors: SMBerror( 1002 )  - Raised if <messageId> is not the first
+                                MessageId of an outstanding request.
+    """
+    with self._cond:
+      bit = messageId - self._base
+      if( (bit < 0) or not ((self._bits >> bit) & 1) ):
+        s = "Response to unknown MessageId (%d)" % messageId
+        raise SMBerror( 1002, s )
+      self._bits  &= ~(1L << bit)
+      self._count -= 1
+      if( not self._bits ):
+        self._base = self._nextId
+      elif( 0 == bit ):
+        # Slide the window up to the new oldest outstanding request.
+        shift = ((self._bits & -self._bits).bit_length() - 1)
+        self._bits >>= shift
+        self._base  += shift
+      self._credits = min( self._credits + credits, self._maxCredits )
+      self._cond.notify_all()
+
+  def apply( self, hdr=None ):
+    """Apply a response header.
+
+    Input:  hdr - An <SMB2_HeaderView> (or <_SMB2_Header>) of a response.
+
+    Output: True if the response completed the request, False if it was
+            an interim response.
+    """
+    if( hdr.flagAsync and (STATUS_PENDING == hdr.status) ):
+      self.grant( hdr.creditReqResp )
+      return( False )
+    self.complete( hdr.messageId, hdr.creditReqResp )
+    return( True )
+
+
+class SMB2_CreditPolicy( object ):
+  """Default server credit granting policy.
+
+  The policy tries to give each client as many credits as it asks for,
+  up to <maxCredits>.  As the server becomes busy, the ceiling is
+  lowered, so that clients are throttled rather than allowed to pile
+  up more requests.  A client is never left with zero credits, since it
+  would then be unable to send anything at all.
+
+  A policy is any callable with the same signature as <__call__()>, so
+  this class can be replaced with something completely different.
+
+  Doctest:
+    >>> pol = SMB2_CreditPolicy( 512 )
+    >>> sw  = SMB2_SequenceWindow( 500 )
+    >>> pol( sw, 1, 64, 0.0 ), pol( sw, 1, 64, 0.9 )
+    (12, 0)
+    >>> pol( SMB2_SequenceWindow( 0 ), 1, 0, 1.0 )
+    1
+  """
+  def __init__( self, maxCredits=512, busy=0.5 ):
+    """Create a credit policy.
+
+    Input:
+      maxCredits  - The most credits a client may hold when the server
+                    is not busy.
+      busy        - The load level above which the ceiling is lowered.
+                    The ceiling falls linearly from <maxCredits> at this
+                    load to one at full load.
+    """
+    self.maxCredits = maxCredits
+    self.busy       = busy
+
+  def __call__( self, window, charge, request, load ):
+    """Decide how many credits to grant.
+
+    Input:
+      window  - The client's <SMB2_SequenceWindow>, after the request
+                has been validated.
+      charge  - The CreditCharge of the request.
+      request - The CreditRequest value from the request header.
+      load    - The server load, in the range 0.0 (idle) to 1.0
+                (saturated).
+
+    Output: The number of credits to grant.
+    """
+    limit = self.maxCredits
+    if( load > self.busy ):
+      scale = (1.0 - load) / (1.0 - self.busy)
+      limit = max( 1, int( limit * scale ) )
+    grant = max( 0, min( max( request, charge ), limit - window.available ) )
+    if( (0 == grant) and (0 == window.available) ):
+      grant = 1
+    return( grant )
+
+
+class SMB2_SequenceWindow( object ):
+  """Server-side SMB2 command sequence window.
+
+  The sequence window is the set of MessageIds that the client may use.
+  It starts out containing only MessageId zero.  Each valid request
+  removes the MessageIds it uses, and each credit granted adds the next
+  MessageId at the top of the window.  See [MS-SMB2; 3.3.1.1].
+
+  The window is kept in a fixed-size ring of flags, indexed by the low
+  bits of the MessageId.  Validating a single-credit request is one
+  range check and one lookup, no matter how large the window is or how
+  many requests have been processed.  Replayed MessageIds (already used)
+  and MessageIds beyond the top of the window are rejected.
+
+  The ring must be large enough to cover the span from the lowest
+  unused MessageId to the top of the window.  If a client holds on to
+  an old MessageId while using newer ones, the span grows; once it
+  reaches the size of the ring, no more credits are granted until the
+  old MessageId is used.
+
+  Instance Attributes:
+    policy    - The credit granting policy.
+    available - The number of MessageIds in the window; that is, the
+                number of credits held by the client.  Read-only.
+    rejected  - Number of requests rejected.
+
+  Doctest:
+    >>> sw = SMB2_SequenceWindow()
+    >>> sw.consume( 0 ), sw.consume( 0 ), sw.consume( 1 )
+    (True, False, False)
+    >>> sw.respond( 1, 31 )             # Grant 31; window is 1..31.
+    31
+    >>> sw.consume( 5, 4 ), sw.consume( 8, 2 ), sw.consume( 1 )
+    (True, False, True)
+    >>> print sw.lowId, sw.highId, sw.available
+    2 32 26
+    >>> sw.consume( 32 ), sw.rejected
+    (False, 4)
+    >>> sw = SMB2_SequenceWindow( 4, ringSize=8 )
+    >>> sw.consume( 1 ), sw.respond( 1, 8 )
+    (True, 4)
+  """
+  def __init__( self, credits=1, policy=None, nextId=0, ringSize=0x10000 ):
+    """Create a sequence window.
+
+    Input:
+      credits   - The initial number of MessageIds in the window.  A new
+                  connection starts with one.
+      policy    - A credit granting policy.  See <SMB2_CreditPolicy>,
+                  which is the default.
+      nextId    - The lowest MessageId in the window.
+      ringSize  - The size of the ring; the maximum span of the window.
+                  This is rounded up to a power of two.
+
+    Errors:
+      ValueError  - Raised if <credits> is larger than the ring.
+    """
+    size = 1
+    while( size < ringSize ):
+      size <<= 1
+    if( credits > size ):
+      raise ValueError( "Initial credits (%d) exceed the ring size." % credits )
+    self.policy   = SMB2_CreditPolicy() if( policy is None ) else policy
+    self.rejected = 0
+    # <_ring>  - One flag per MessageId in [_base, _high), indexed by
+    #            (MessageId & _mask).  Non-zero means available.
+    # <_base>  - The lowest MessageId that has not been used.
+    # <_high>  - One past the highest MessageId in the window.
+    # <_count> - The number of available MessageIds.
+    self._ring  = bytearray( size )
+    self._mask  = size - 1
+    self._base  = long( nextId )
+    self._high  = self._base
+    self._count = 0
+    self.grant( credits )
+
+  @property
+  def available( self ):
+    """The number of MessageIds in the window.  Read-only."""
+    return( self._count )
+
+  @property
+  def lowId( self ):
+    """The lowest unused MessageId in the window.  Read-only."""
+    return( self._base )
+
+  @property
+  def highId( self ):
+    """One past the highest MessageId in the window.  Read-only."""
+    return( self._high )
+
+  def consume( self, messageId=0, charge=1 ):
+    """Validate a request's MessageIds and remove them from the window.
+
+    Input:
+      messageId - The MessageId from the request header.
+      charge    - The CreditCharge of the request.  A charge of zero
+                  (as used by SMB 2.0.2) is treated as one.
+
+    Output: True if all of the MessageIds in the range were available,
+            otherwise False.  If False is returned, the window is not
+            changed.
+    """
+    ring, mask = self._ring, self._mask
+    charge = max( charge, 1 )
+    if( (messageId < self._base) or ((messageId + charge) > self._high) ):
+      self.rejected += 1
+      return( False )
+    if( 1 == charge ):
+      i = messageId & mask
+      if( not ring[i] ):
+        self.rejected += 1
+        return( False )
+      ring[i] = 0
+    else:
+      ids = [ (m & mask) for m in xrange( messageId, messageId + charge ) ]
+      if( not all( ring[i] for i in ids ) ):
+        self.rejected += 1
+        return( False )
+      for i in ids:
+        ring[i] = 0
+    self._count -= charge
+    # Slide the bottom of the window past used MessageIds.  Each
+    # MessageId is passed over only once, so this is constant time when
+    # averaged over all requests.
+    base, high = self._base, self._high
+    while( (base < high) and not ring[base & mask] ):
+      base += 1
+    self._base = base
+    return( True )
+
+  def check( self, hdr=None ):
+    """Validate a request header.
+
+    Input:  hdr - An <SMB2_HeaderView> (or <_SMB2_Header>) of a request.
+
+    Output: True if the request may be processed.
+
+    Notes:  CANCEL requests do not use a MessageId of their own, so they
+            are always accepted here.
+    """
+    if( SMB2_COM_CANCEL == hdr.command ):
+      return( True )
+    return( self.consume( hdr.messageId, hdr.creditCharge ) )
+
+  def grant( self, credits=0 ):
+    """Add MessageIds at the top of the window.
+
+    Input:  credits - The number of credits to grant.
+
+    Output: The number of credits actually granted.  This may be less
+            than requested if the ring is full.
+    """
+    room    = (self._mask + 1) - int( self._high - self._base )
+    credits = max( 0, min( credits, room ) )
+    ring, mask, high = self._ring, self._mask, self._high
+    for m in xrange( high, high + credits ):
+      ring[m & mask] = 1
+    self._high   = high + credits
+    self._count += credits
+    return( credits )
+
+  def respond( self, charge=1, request=1, load=0.0 ):
+    """Decide how many credits to grant in a response, and grant them.
+
+    Input:
+      charge  - The CreditCharge of the request.
+      request - The CreditRequest value from the request header.
+      load    - The server load, in the range 0.0 to 1.0.
+
+    Output: The number of credits granted, for the CreditResponse field
+            of the response header.
+    """
+    credits = self.policy( self, max( charge, 1 ), request, load )
+    return( self.grant( credits ) )
+
+
+# Functions ------------------------------------------------------------------ #
+#
+
+def SMB2_CreditCharge( length=0 ):
+  """Return the CreditCharge for a request or response payload size.
+
+  Input:  length  - The number of payload bytes (the larger of the
+                    bytes sent and the bytes expected in the reply).
+
+  Output: The number of credits required; at least one.
+
+  Doctest:
+    >>> [ SMB2_CreditCharge( n ) for n in (0, 1, 0x10000, 0x10001, 0x800000) ]
+    [1, 1, 1, 2, 128]
+  """
+  return( max( 1, (length + SMB2_CREDIT_SIZE - 1) // SMB2_CREDIT_SIZE ) )
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=200000, window=512 ):
+  # Measure the cost of allocating and completing MessageIds.
+  #
+  # Input:
+  #   count   - Number of requests to simulate.
+  #   window  - Number of requests kept in flight.  Responses arrive in
+  #             a scrambled order.
+  #
+  # Notes:  Run from the directory above the one containing this module:
+  #           $ python -c 'import smb.SMB2_Credits as m; m._bench()'
+  #
+  import random
+  rand = random.Random( 445 )
+  cw   = SMB2_CreditWindow( window )
+  live = []
+  start = time.time()
+  for i in xrange( count ):
+    mid = cw.tryAcquire( 1 )
+    if( mid is None ):
+      j = rand.randrange( len( live ) )
+      live[j], live[-1] = live[-1], live[j]
+      cw.complete( live.pop(), 1 )
+      mid = cw.tryAcquire( 1 )
+    live.append( mid )
+  elapsed = time.time() - start
+
+  print "Requests..........: %d" % count
+  print "Window............: %d (span %d)" % (len( cw ), cw.nextId - cw.lowId)
+  print "Cost per request..: %.3f us" % (elapsed * 1e6 / count)
+
+def _benchServer( count=200000, sizes=(64, 8192) ):
+  # Measure server-side MessageId validation and credit granting.
+  #
+  # Input:
+  #   count - Number of requests to simulate for each window size.
+  #   sizes - Window sizes (credits held by the client).
+  #
+  # Notes:  Requests use MessageIds from anywhere in the window, so that
+  #         the window is fragmented.
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import smb.SMB2_Credits as m; m._benchServer()'
+  #
+  import random
+  for size in sizes:
+    rand = random.Random( 445 )
+    sw   = SMB2_SequenceWindow( size, SMB2_CreditPolicy( size ) )
+    ids  = range( size )
+    start = time.time()
+    for i in xrange( count ):
+      j = rand.randrange( len( ids ) )
+      ids[j], ids[-1] = ids[-1], ids[j]
+      sw.consume( ids.pop() )
+      base = sw.highId
+      n = sw.respond( 1, 1 )
+      ids.extend( xrange( base, base + n ) )
+    elapsed = time.time() - start
+    print "Window %5d......: %.3f us per request (rejected %d)" % \
+          (size, elapsed * 1e6 / count, sw.rejected)
+
+# ============================================================================ #
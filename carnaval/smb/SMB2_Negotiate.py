@@ -0,0 +1,667 @@
+# ============================================================================ #
+#                              SMB2_Negotiate.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Carnaval Toolkit: SMB2/3 NEGOTIATE message parsing and composition.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - The classes in this module handle the message body only; that is,
+#     everything that follows the 64-byte SMB2 header.  The header is
+#     handled by <_SMB2_Header> or <SMB2_HeaderView>.  Offsets stored
+#     in the messages (e.g., NegotiateContextOffset) are relative to the
+#     start of the header, and this module assumes that the body
+#     immediately follows the header.
+#
+#   - Negotiate Contexts are only sent if the SMB 3.1.1 dialect is
+#     offered (in a request) or selected (in a response).
+#
+#   - The SMB 3.1.1 preauthentication integrity hash is a chain of
+#     SHA-512 digests, each computed over the previous value and the
+#     next message.  <SMB2_PreauthHash.update()> feeds the message to
+#     the hash in pieces (e.g., a header and a body, or a memoryview of
+#     a received message) so that the message never needs to be copied
+#     or reassembled.
+#
+# References:
+#
+#   [MS-SMB2]   Microsoft Corporation, "Server Message Block (SMB)
+#               Protocol Versions 2 and 3", sections 2.2.3 (NEGOTIATE
+#               Request), 2.2.3.1 (Negotiate Contexts), 2.2.4 (NEGOTIATE
+#               Response), and 3.2.5.2 (preauth integrity hash)
+#               http://msdn.microsoft.com/en-us/library/cc246482.aspx
+#
+# ============================================================================ #
+#
+"""Carnaval Toolkit: SMB2/3 NEGOTIATE Messages
+
+The NEGOTIATE exchange selects the dialect used on the connection, and
+exchanges the capabilities, security mode, and (with SMB 3.1.1) the
+Negotiate Contexts of the client and server.
+
+CONSTANTS:
+
+  Security Mode:
+    SMB2_NEGOTIATE_SIGNING_ENABLED  : Signing is supported.
+    SMB2_NEGOTIATE_SIGNING_REQUIRED : Signing is required.
+
+  Global Capabilities:
+    SMB2_GLOBAL_CAP_*   : Capability bits.  See [MS-SMB2; 2.2.3].
+
+  Negotiate Context Types:
+    SMB2_PREAUTH_INTEGRITY_CAPABILITIES : Preauth hash algorithms.
+    SMB2_ENCRYPTION_CAPABILITIES        : Encryption ciphers.
+    SMB2_COMPRESSION_CAPABILITIES       : Compression algorithms.
+    SMB2_SIGNING_CAPABILITIES           : Signing algorithms.
+
+  Algorithm Ids:
+    SMB2_PREAUTH_SHA512     : The only defined preauth hash algorithm.
+    SMB2_CIPHER_*           : Encryption ciphers.
+    SMB2_COMPRESSION_*      : Compression algorithms.
+    SMB2_SIGNING_*          : Signing algorithms.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   struct        - Binary data handling.
+#   hashlib       - SHA-512, for the preauth integrity hash.
+#   os            - Random salt and GUID values.
+#   SMB_Core      - The SMBerror exception class, and padding.
+#   SMB2_Header   - Header size and dialect codes.
+#
+
+import struct       # Binary data handling.
+import hashlib      # Secure hashes.
+import os           # Random bytes.
+
+from SMB_Core    import SMBerror          # SMB exception class.
+from SMB_Core    import SMB_Pad8          # 8-octet alignment.
+from SMB2_Header import SMB2_HDR_SIZE     # Header length.
+from SMB2_Header import SMB2_DIALECT_302  # SMB 3.0.2 dialect code.
+from SMB2_Header import SMB2_DIALECT_311  # SMB 3.1.1 dialect code.
+from SMB2_Header import SMB2_DIALECT_LIST # Known dialects.
+
+
+# Constants ------------------------------------------------------------------ #
+#
+
+# Security Mode bits.
+SMB2_NEGOTIATE_SIGNING_ENABLED  = 0x0001
+SMB2_NEGOTIATE_SIGNING_REQUIRED = 0x0002
+
+# Global Capabilities bits.
+SMB2_GLOBAL_CAP_DFS                 = 0x00000001
+SMB2_GLOBAL_CAP_LEASING             = 0x00000002
+SMB2_GLOBAL_CAP_LARGE_MTU           = 0x00000004
+SMB2_GLOBAL_CAP_MULTI_CHANNEL       = 0x00000008
+SMB2_GLOBAL_CAP_PERSISTENT_HANDLES  = 0x00000010
+SMB2_GLOBAL_CAP_DIRECTORY_LEASING   = 0x00000020
+SMB2_GLOBAL_CAP_ENCRYPTION          = 0x00000040
+
+# Negotiate Context types.
+SMB2_PREAUTH_INTEGRITY_CAPABILITIES = 0x0001
+SMB2_ENCRYPTION_CAPABILITIES        = 0x0002
+SMB2_COMPRESSION_CAPABILITIES       = 0x0003
+SMB2_NETNAME_NEGOTIATE_CONTEXT_ID   = 0x0005
+SMB2_TRANSPORT_CAPABILITIES         = 0x0006
+SMB2_RDMA_TRANSFORM_CAPABILITIES    = 0x0007
+SMB2_SIGNING_CAPABILITIES           = 0x0008
+
+# Preauth integrity hash algorithms.
+SMB2_PREAUTH_SHA512 = 0x0001
+
+# Encryption ciphers.
+SMB2_CIPHER_AES128_CCM  = 0x0001
+SMB2_CIPHER_AES128_GCM  = 0x0002
+SMB2_CIPHER_AES256_CCM  = 0x0003
+SMB2_CIPHER_AES256_GCM  = 0x0004
+
+# Compression algorithms.
+SMB2_COMPRESSION_NONE         = 0x0000
+SMB2_COMPRESSION_LZNT1        = 0x0001
+SMB2_COMPRESSION_LZ77         = 0x0002
+SMB2_COMPRESSION_LZ77_HUFFMAN = 0x0003
+SMB2_COMPRESSION_PATTERN_V1   = 0x0004
+SMB2_COMPRESSION_LZ4          = 0x0005
+
+# Signing algorithms.
+SMB2_SIGNING_HMAC_SHA256  = 0x0000
+SMB2_SIGNING_AES_CMAC     = 0x0001
+SMB2_SIGNING_AES_GMAC     = 0x0002
+
+# Message StructureSize values.
+_NEG_REQ_SIZE = 36
+_NEG_RSP_SIZE = 65
+
+# Where the SecurityBuffer starts in a response (relative to the header).
+_NEG_RSP_SECBUF = SMB2_HDR_SIZE + 64
+
+# Structure formats.
+_format_H     = struct.Struct( "<H" )
+_format_2H    = struct.Struct( "<HH" )
+_format_HHL   = struct.Struct( "<HHL" )
+_format_ctx   = struct.Struct( "<HHL" )       # Context header.
+_format_req   = struct.Struct( "<HHHHL16sLHH" )
+_format_rsp   = struct.Struct( "<HHHH16sLLLLQQHHL" )
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class SMB2_NegContext( object ):
+  """An SMB 3.1.1 Negotiate Context.
+
+  Instance Attributes:
+    ctxType - The context type (e.g., SMB2_ENCRYPTION_CAPABILITIES).
+    data    - The context data, in wire format.
+
+  The class methods <preauth()>, <encryption()>, <compression()>, and
+  <signing()> create the common context types, and <values()> decodes
+  them.
+
+  Doctest:
+    >>> ctx = SMB2_NegContext.encryption( [ SMB2_CIPHER_AES128_GCM,
+    ...                                     SMB2_CIPHER_AES128_CCM ] )
+    >>> len( ctx.compose() ), ctx.values()
+    (14, [2, 1])
+    >>> ctx = SMB2_NegContext.preauth( salt='x' * 32 )
+    >>> algs, salt = ctx.values()
+    >>> algs, len( salt )
+    ([1], 32)
+    >>> SMB2_NegContext.compression( [ SMB2_COMPRESSION_LZ4 ] ).values()
+    ([5], 0)
+    >>> SMB2_NegContext( 0x1234, "raw" ).values()
+    'raw'
+    >>> try:
+    ...   SMB2_NegContext( SMB2_PREAUTH_INTEGRITY_CAPABILITIES,
+    ...                    ctx.data[:-1] ).values()
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1001
+    >>> try:
+    ...   SMB2_NegContext.parseList( ctx.compose(), -64, 1 )
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1001
+  """
+  def __init__( self, ctxType=0, data='' ):
+    """Create a Negotiate Context from raw context data.
+
+    Input:
+      ctxType - The context type.
+      data    - The context data (without the context header).
+    """
+    self.ctxType = ctxType
+    self.data    = data
+
+  @classmethod
+  def preauth( cls, hashAlgs=(SMB2_PREAUTH_SHA512,), salt=None ):
+    """Create a preauth integrity capabilities context.
+
+    Input:
+      hashAlgs  - A list of hash algorithm Ids.
+      salt      - The salt.  If None, 32 random bytes are used.
+    """
+    salt = os.urandom( 32 ) if( salt is None ) else salt
+    data = _format_2H.pack( len( hashAlgs ), len( salt ) )
+    data += struct.pack( "<%dH" % len( hashAlgs ), *hashAlgs )
+    return( cls( SMB2_PREAUTH_INTEGRITY_CAPABILITIES, data + salt ) )
+
+  @classmethod
+  def encryption( cls, ciphers=(SMB2_CIPHER_AES128_GCM,) ):
+    """Create an encryption capabilities context.
+
+    Input:  ciphers - A list of cipher Ids, in order of preference.
+    """
+    data = struct.pack( "<H%dH" % len( ciphers ), len( ciphers ), *ciphers )
+    return( cls( SMB2_ENCRYPTION_CAPABILITIES, data ) )
+
+  @classmethod
+  def compression( cls, algs=(SMB2_COMPRESSION_NONE,), flags=0 ):
+    """Create a compression capabilities context.
+
+    Input:
+      algs  - A list of compression algorithm Ids.
+      flags - Compression capability flags.
+    """
+    data = _format_HHL.pack( len( algs ), 0, flags )
+    data += struct.pack( "<%dH" % len( algs ), *algs )
+    return( cls( SMB2_COMPRESSION_CAPABILITIES, data ) )
+
+  @classmethod
+  def signing( cls, algs=(SMB2_SIGNING_AES_CMAC,) ):
+    """Create a signing capabilities context.
+
+    Input:  algs  - A list of signing algorithm Ids.
+    """
+    data = struct.pack( "<H%dH" % len( algs ), len( algs ), *algs )
+    return( cls( SMB2_SIGNING_CAPABILITIES, data ) )
+
+  def values( self ):
+    """Decode the context data.
+
+    Output: For preauth contexts, a tuple: (hash algorithm list, salt).
+            For encryption and signing contexts, a list of Ids.
+            For compression contexts, a tuple: (algorithm list, flags).
+            For other context types, the raw data.
+
+    Errors: SMBerror( 1001 )  - Raised if the context data is too short.
+    """
+    d = self.data
+    try:
+      if( SMB2_PREAUTH_INTEGRITY_CAPABILITIES == self.ctxType ):
+        count, saltLen = _format_2H.unpack_from( d )
+        algs = list( struct.unpack_from( "<%dH" % count, d, 4 ) )
+        start = 4 + (2 * count)
+        if( (start + saltLen) > len( d ) ):
+          raise struct.error( "Short salt" )
+        return( (algs, d[start:start+saltLen]) )
+      if( self.ctxType in (SMB2_ENCRYPTION_CAPABILITIES,
+                           SMB2_SIGNING_CAPABILITIES) ):
+        count = _format_H.unpack_from( d )[0]
+        return( list( struct.unpack_from( "<%dH" % count, d, 2 ) ) )
+      if( SMB2_COMPRESSION_CAPABILITIES == self.ctxType ):
+        count, pad, flags = _format_HHL.unpack_from( d )
+        return( (list( struct.unpack_from( "<%dH" % count, d, 8 ) ), flags) )
+    except struct.error:
+      s = "Short Negotiate Context (type 0x%04X)" % self.ctxType
+      raise SMBerror( 1001, s )
+    return( d )
+
+  def compose( self ):
+    """Compose the context, including the context header.
+
+    Output: The context, in wire format, without trailing padding.
+    """
+    return( _format_ctx.pack( self.ctxType, len( self.data ), 0 ) + self.data )
+
+  @classmethod
+  def composeList( cls, contexts=(), start=0 ):
+    # Compose a list of contexts, with padding between them.
+    #
+    # Input:
+    #   contexts  - A list of <SMB2_NegContext> objects.
+    #   start     - The offset (relative to an 8-octet boundary) at
+    #               which the first context will be placed.
+    #
+    s = ''
+    for ctx in contexts:
+      s += '\0' * SMB_Pad8( start + len( s ) )
+      s += ctx.compose()
+    return( s )
+
+  @classmethod
+  def parseList( cls, body=None, offset=0, count=0 ):
+    """Parse a list of Negotiate Contexts.
+
+    Input:
+      body    - The message body.
+      offset  - The offset of the first context within <body>.
+      count   - The number of contexts to read.
+
+    Output: A list of <SMB2_NegContext> objects.
+
+    Errors: SMBerror( 1001 )  - Raised if a context lies outside of the
+                                message.
+    """
+    if( count and (offset < 0) ):
+      raise SMBerror( 1001, "Negotiate Context offset is out of bounds" )
+    contexts = []
+    for i in xrange( count ):
+      offset += SMB_Pad8( offset )
+      if( (offset + 8) > len( body ) ):
+        raise SMBerror( 1001, "Negotiate Context beyond end of message" )
+      ctxType, dLen, rsvd = _format_ctx.unpack_from( body, offset )
+      offset += 8
+      if( (offset + dLen) > len( body ) ):
+        raise SMBerror( 1001, "Negotiate Context beyond end of message" )
+      contexts.append( cls( ctxType, _bytes( body[offset:offset+dLen] ) ) )
+      offset += dLen
+    return( contexts )
+
+
+class SMB2_NegotiateRequest( object ):
+  """SMB2/3 NEGOTIATE Request body.
+
+  Instance Attributes:
+    dialects      - A list of dialect codes offered by the client.
+    securityMode  - Security Mode bits (SMB2_NEGOTIATE_SIGNING_*).
+    capabilities  - Global Capabilities bits (SMB2_GLOBAL_CAP_*).
+    clientGuid    - A 16-byte client GUID.
+    contexts      - A list of <SMB2_NegContext> objects.  Contexts are
+                    only sent if SMB2_DIALECT_311 is in <dialects>.
+
+  Doctest:
+    >>> req = SMB2_NegotiateRequest( SMB2_DIALECT_LIST,
+    ...         capabilities=SMB2_GLOBAL_CAP_LARGE_MTU,
+    ...         clientGuid='G' * 16,
+    ...         contexts=[ SMB2_NegContext.preauth( salt='s' * 32 ),
+    ...                    SMB2_NegContext.encryption() ] )
+    >>> body = req.compose()
+    >>> len( body )
+    108
+    >>> r2 = SMB2_NegotiateRequest.parse( memoryview( body ) )
+    >>> [ "0x%04X" % d for d in r2.dialects ]
+    ['0x0202', '0x0210', '0x0300', '0x0302', '0x0311']
+    >>> print r2.securityMode, r2.capabilities, r2.clientGuid
+    1 4 GGGGGGGGGGGGGGGG
+    >>> [ (c.ctxType, c.values()) for c in r2.contexts ][1:]
+    [(2, [2])]
+    >>> try:
+    ...   SMB2_NegotiateRequest.parse( body[:40] )
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1001
+  """
+  def __init__( self, dialects=SMB2_DIALECT_LIST,
+                      securityMode=SMB2_NEGOTIATE_SIGNING_ENABLED,
+                      capabilities=0,
+                      clientGuid=None,
+                      contexts=None ):
+    """Create a NEGOTIATE request.
+
+    Input:  See the Instance Attributes, above.  If <clientGuid> is
+            None, a random GUID is generated.
+    """
+    self.dialects     = list( dialects )
+    self.securityMode = securityMode
+    self.capabilities = capabilities
+    self.clientGuid   = os.urandom( 16 ) if( clientGuid is None ) \
+                        else clientGuid
+    self.contexts     = [] if( contexts is None ) else contexts
+
+  def compose( self ):
+    """Compose the request body.
+
+    Output: The request body, in wire format.  The body must directly
+            follow a 64-byte SMB2 header.
+    """
+    n     = len( self.dialects )
+    dlist = struct.pack( "<%dH" % n, *self.dialects )
+    ctxs  = ''
+    ctxOffset = 0
+    if( self.contexts and (SMB2_DIALECT_311 in self.dialects) ):
+      start = _NEG_REQ_SIZE + len( dlist )
+      ctxs  = '\0' * SMB_Pad8( start )
+      ctxOffset = SMB2_HDR_SIZE + start + len( ctxs )
+      ctxs += SMB2_NegContext.composeList( self.contexts )
+    fixed = _format_req.pack( _NEG_REQ_SIZE, n,
+                              self.securityMode, 0,
+                              self.capabilities,
+                              self.clientGuid,
+                              ctxOffset,
+                              len( self.contexts ) if( ctxOffset ) else 0,
+                              0 )
+    return( fixed + dlist + ctxs )
+
+  @classmethod
+  def parse( cls, body=None ):
+    """Parse a NEGOTIATE request body.
+
+    Input:  body  - The message body (the bytes following the header),
+                    as a string, bytearray, or memoryview.
+
+    Output: An <SMB2_NegotiateRequest>.
+
+    Errors: SMBerror( 1001 )  - Raised if the message is malformed.
+    """
+    if( len( body ) < _NEG_REQ_SIZE ):
+      raise SMBerror( 1001, "Short NEGOTIATE request" )
+    tup = _format_req.unpack_from( body )
+    if( _NEG_REQ_SIZE != tup[0] ):
+      raise SMBerror( 1001, "Bad NEGOTIATE request StructureSize" )
+    n = tup[1]
+    if( (_NEG_REQ_SIZE + (2 * n)) > len( body ) ):
+      raise SMBerror( 1001, "NEGOTIATE dialect list is truncated" )
+    dialects = struct.unpack_from( "<%dH" % n, body, _NEG_REQ_SIZE )
+    contexts = []
+    if( SMB2_DIALECT_311 in dialects ):
+      contexts = SMB2_NegContext.parseList( body, tup[6] - SMB2_HDR_SIZE,
+                                            tup[7] )
+    return( cls( dialects, tup[2], tup[4], tup[5], contexts ) )
+
+
+class SMB2_NegotiateResponse( object ):
+  """SMB2/3 NEGOTIATE Response body.
+
+  Instance Attributes:
+    dialect         - The selected dialect code.
+    securityMode    - Security Mode bits (SMB2_NEGOTIATE_SIGNING_*).
+    serverGuid      - A 16-byte server GUID.
+    capabilities    - Global Capabilities bits (SMB2_GLOBAL_CAP_*).
+    maxTransactSize - Maximum transaction buffer size.
+    maxReadSize     - Maximum READ length.
+    maxWriteSize    - Maximum WRITE length.
+    systemTime      - The server's current time (FILETIME).
+    startTime       - Server start time (FILETIME); usually zero.
+    securityBuffer  - The GSS token (e.g., an SPNEGO NegTokenInit).
+    contexts        - A list of <SMB2_NegContext> objects.  Contexts are
+                      only sent if <dialect> is SMB2_DIALECT_311.
+
+  Doctest:
+    >>> rsp = SMB2_NegotiateResponse( SMB2_DIALECT_311, serverGuid='S' * 16,
+    ...         capabilities=SMB2_GLOBAL_CAP_LARGE_MTU,
+    ...         maxReadSize=0x800000, securityBuffer='token',
+    ...         contexts=[ SMB2_NegContext.preauth( salt='s' * 32 ),
+    ...                    SMB2_NegContext.signing() ] )
+    >>> body = rsp.compose()
+    >>> r2 = SMB2_NegotiateResponse.parse( bytearray( body ) )
+    >>> print "0x%04X" % r2.dialect, r2.serverGuid, r2.securityBuffer
+    0x0311 SSSSSSSSSSSSSSSS token
+    >>> print r2.maxReadSize, r2.capabilities, len( r2.contexts )
+    8388608 4 2
+    >>> r2.contexts[1].values()
+    [1]
+    >>> rsp = SMB2_NegotiateResponse( SMB2_DIALECT_302, contexts=rsp.contexts )
+    >>> SMB2_NegotiateResponse.parse( rsp.compose() ).contexts
+    []
+  """
+  def __init__( self, dialect=SMB2_DIALECT_311,
+                      securityMode=SMB2_NEGOTIATE_SIGNING_ENABLED,
+                      serverGuid=None,
+                      capabilities=0,
+                      maxTransactSize=0x10000,
+                      maxReadSize=0x10000,
+                      maxWriteSize=0x10000,
+                      systemTime=0,
+                      startTime=0,
+                      securityBuffer='',
+                      contexts=None ):
+    """Create a NEGOTIATE response.
+
+    Input:  See the Instance Attributes, above.  If <serverGuid> is
+            None, a random GUID is generated.
+    """
+    self.dialect         = dialect
+    self.securityMode    = securityMode
+    self.serverGuid      = os.urandom( 16 ) if( serverGuid is None ) \
+                           else serverGuid
+    self.capabilities    = capabilities
+    self.maxTransactSize = maxTransactSize
+    self.maxReadSize     = maxReadSize
+    self.maxWriteSize    = maxWriteSize
+    self.systemTime      = systemTime
+    self.startTime       = startTime
+    self.securityBuffer  = securityBuffer
+    self.contexts        = [] if( contexts is None ) else contexts
+
+  def compose( self ):
+    """Compose the response body.
+
+    Output: The response body, in wire format.  The body must directly
+            follow a 64-byte SMB2 header.
+    """
+    secLen = len( self.securityBuffer )
+    body   = self.securityBuffer
+    ctxOffset = 0
+    if( self.contexts and (SMB2_DIALECT_311 == self.dialect) ):
+      body += '\0' * SMB_Pad8( secLen )
+      ctxOffset = _NEG_RSP_SECBUF + len( body )
+      body += SMB2_NegContext.composeList( self.contexts )
+    fixed = _format_rsp.pack( _NEG_RSP_SIZE,
+                              self.securityMode,
+                              self.dialect,
+                              len( self.contexts ) if( ctxOffset ) else 0,
+                              self.serverGuid,
+                              self.capabilities,
+                              self.maxTransactSize,
+                              self.maxReadSize,
+                              self.maxWriteSize,
+                              self.systemTime,
+                              self.startTime,
+                              _NEG_RSP_SECBUF, secLen,
+                              ctxOffset )
+    return( fixed + body )
+
+  @classmethod
+  def parse( cls, body=None ):
+    """Parse a NEGOTIATE response body.
+
+    Input:  body  - The message body (the bytes following the header),
+                    as a string, bytearray, or memoryview.
+
+    Output: An <SMB2_NegotiateResponse>.
+
+    Errors: SMBerror( 1001 )  - Raised if the message is malformed.
+    """
+    if( len( body ) < (_NEG_RSP_SIZE - 1) ):
+      raise SMBerror( 1001, "Short NEGOTIATE response" )
+    tup = _format_rsp.unpack_from( body )
+    if( _NEG_RSP_SIZE != tup[0] ):
+      raise SMBerror( 1001, "Bad NEGOTIATE response StructureSize" )
+    secOff = tup[11] - SMB2_HDR_SIZE
+    secLen = tup[12]
+    if( secLen and ((secOff < 0) or ((secOff + secLen) > len( body ))) ):
+      raise SMBerror( 1001, "NEGOTIATE SecurityBuffer is out of bounds" )
+    contexts = []
+    if( SMB2_DIALECT_311 == tup[2] ):
+      contexts = SMB2_NegContext.parseList( body, tup[13] - SMB2_HDR_SIZE,
+                                            tup[3] )
+    return( cls( tup[2], tup[1], tup[4], tup[5], tup[6], tup[7], tup[8],
+                 tup[9], tup[10], _bytes( body[secOff:secOff+secLen] ),
+                 contexts ) )
+
+
+class SMB2_PreauthHash( object ):
+  """SMB 3.1.1 preauthentication integrity hash.
+
+  The hash value starts as 64 zero bytes.  Each message sent or
+  received during negotiation (and, later, session setup) is folded in:
+    value = SHA-512( value + message )
+
+  Doctest:
+    >>> import hashlib
+    >>> hdr, body = 'H' * 64, bytearray( 'B' * 100 )
+    >>> ph = SMB2_PreauthHash()
+    >>> ph.update( hdr, memoryview( body ) )
+    >>> expect = hashlib.sha512( ('\\0' * 64) + hdr + str( body ) ).digest()
+    >>> ph.value == expect
+    True
+    >>> session = ph.copy()
+    >>> session.update( "more" )
+    >>> session.value == ph.value
+    False
+  """
+  __slots__ = ( "_value", )
+
+  def __init__( self, value=None ):
+    """Create a preauth integrity hash.
+
+    Input:  value - The starting value.  The default is 64 zero bytes,
+                    the initial value for a new connection.
+    """
+    self._value = ('\0' * 64) if( value is None ) else value
+
+  @property
+  def value( self ):
+    """The current 64-byte hash value.  Read-only."""
+    return( self._value )
+
+  def update( self, *parts ):
+    """Fold a message into the hash.
+
+    Input:  parts - One or more pieces of the message, in order.  Each
+                    piece may be a string, bytearray, or memoryview.
+                    The pieces are hashed in place; they are not joined.
+    """
+    h = hashlib.sha512( self._value )
+    for part in parts:
+      h.update( part )
+    self._value = h.digest()
+
+  def copy( self ):
+    """Return a copy of the hash.
+
+    Notes:  The session preauth hash starts from the connection preauth
+            hash value after the NEGOTIATE exchange.  Each new session
+            uses its own copy.
+    """
+    return( SMB2_PreauthHash( self._value ) )
+
+
+# Functions ------------------------------------------------------------------ #
+#
+
+def _bytes( buf=None ):
+  # Return a copy of <buf> as a string of octets.
+  #
+  # Notes:  In Python 2.7, str( memoryview ) returns the repr() of the
+  #         view, not its contents.
+  #
+  if( isinstance( buf, memoryview ) ):
+    return( buf.tobytes() )
+  return( str( buf ) )
+
+def SMB2_SelectDialect( offered=(), supported=SMB2_DIALECT_LIST ):
+  """Pick the highest dialect that both sides support.
+
+  Input:
+    offered   - The dialects offered by the client.
+    supported - The dialects supported by the server.
+
+  Output: The selected dialect code, or None if there is no dialect in
+          common.
+
+  Doctest:
+    >>> print "0x%04X" % SMB2_SelectDialect( [0x0202, 0x0300, 0x0400] )
+    0x0300
+    >>> print SMB2_SelectDialect( [0x0400] )
+    None
+  """
+  common = set( offered ).intersection( supported )
+  return( max( common ) if( common ) else None )
+
+# ============================================================================ #
@@ -0,0 +1,602 @@
+# ============================================================================ #
+#                              SMB2_ReadWrite.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Carnaval Toolkit: SMB2/3 READ and WRITE messages, without copying.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - The READ and WRITE codecs handle only the fixed part of each
+#     message body.  The data is never part of the composed or parsed
+#     object.  On the sending side, the data is passed separately to
+#     <SMB_Transport.sendParts()> (a memoryview of a buffer or an mmap
+#     works well).  On the receiving side, <SMB2_Receiver> reads READ
+#     response data straight from the socket into a buffer supplied by
+#     the caller.
+#
+#   - Python 2.7 has no socket.sendmsg(), so the "gather" in the
+#     gather-write is done by <SMB_Transport.sendParts()> using MSG_MORE
+#     rather than by a single system call.
+#
+#   - With large MTU support, a READ or WRITE may move up to 8MiB (or
+#     more) in one message.  The CreditCharge of such a request is given
+#     by the <charge> attribute of the request objects.
+#
+# References:
+#
+#   [MS-SMB2]   Microsoft Corporation, "Server Message Block (SMB)
+#               Protocol Versions 2 and 3", sections 2.2.19 (READ
+#               Request), 2.2.20 (READ Response), 2.2.21 (WRITE
+#               Request), and 2.2.22 (WRITE Response)
+#               http://msdn.microsoft.com/en-us/library/cc246482.aspx
+#
+# ============================================================================ #
+#
+"""Carnaval Toolkit: SMB2/3 READ and WRITE Messages
+
+Bulk data moves in READ responses and WRITE requests.  The classes in
+this module compose and parse the fixed portion of the READ and WRITE
+messages, leaving the data where it is:
+
+  * A WRITE request is sent as header, fixed body, and payload, where
+    the payload is a memoryview of the caller's data.
+  * A READ response is received by <SMB2_Receiver>, which places the
+    data directly into the caller's buffer.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   struct        - Binary data handling.
+#   SMB_Core      - The SMBerror exception class.
+#   SMB2_Header   - Header constants and views.
+#   SMB2_Credits  - Credit charge calculation.
+#   SMB_Transport - The Direct TCP framer.
+#
+
+import struct       # Binary data handling.
+
+from SMB_Core       import SMBerror
+from SMB2_Header    import SMB2_HDR_SIZE, SMB2_COM_READ, SMB2_HeaderView
+from SMB2_Credits   import SMB2_CreditCharge
+from SMB_Transport  import DirectTCPFramer
+
+
+# Constants ------------------------------------------------------------------ #
+#
+
+# READ request flags.
+SMB2_READFLAG_READ_UNBUFFERED     = 0x01
+SMB2_READFLAG_REQUEST_COMPRESSED  = 0x02
+
+# WRITE request flags.
+SMB2_WRITEFLAG_WRITE_THROUGH      = 0x00000001
+SMB2_WRITEFLAG_WRITE_UNBUFFERED   = 0x00000002
+
+# Where the data starts (relative to the header) in messages composed
+# by this module.
+SMB2_READ_DATA_OFFSET   = SMB2_HDR_SIZE + 16  # READ response.
+SMB2_WRITE_DATA_OFFSET  = SMB2_HDR_SIZE + 48  # WRITE request.
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _format_*     - Fixed-length message body formats.
+#   _RCV_BUFSIZE  - Default <SMB2_Receiver> buffer size.
+#
+
+_format_ReadReq   = struct.Struct( "<HBBLQ16sLLLHH" )
+_format_ReadRsp   = struct.Struct( "<HBBLLL" )
+_format_WriteReq  = struct.Struct( "<HHLQ16sLLHHL" )
+_format_WriteRsp  = struct.Struct( "<HHLLHH" )
+
+_RCV_BUFSIZE = 0x40000
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class SMB2_ReadRequest( object ):
+  """SMB2/3 READ Request.
+
+  Instance Attributes:
+    fileId    - The 16-byte FileId of the open file.
+    offset    - File offset at which to start reading.
+    length    - Number of bytes to read.
+    minCount  - Minimum number of bytes for a successful read.
+    flags     - SMB2_READFLAG_* bits (SMB 3.0.2 and above).
+    remaining - Hint: the number of bytes the client will read next.
+    padding   - The requested DataOffset for the response.
+
+  Doctest:
+    >>> req = SMB2_ReadRequest( 'F' * 16, 0x100000, 0x800000 )
+    >>> body = req.compose()
+    >>> len( body ), req.charge
+    (49, 128)
+    >>> r2 = SMB2_ReadRequest.parse( memoryview( body ) )
+    >>> print r2.fileId, r2.offset, r2.length, r2.padding
+    FFFFFFFFFFFFFFFF 1048576 8388608 80
+  """
+  __slots__ = ( "fileId", "offset", "length", "minCount",
+                "flags", "remaining", "padding" )
+
+  def __init__( self, fileId=None, offset=0, length=0, minCount=0,
+                      flags=0, remaining=0,
+                      padding=SMB2_READ_DATA_OFFSET ):
+    """Create a READ request.  See the Instance Attributes, above."""
+    self.fileId    = fileId
+    self.offset    = offset
+    self.length    = length
+    self.minCount  = minCount
+    self.flags     = flags
+    self.remaining = remaining
+    self.padding   = padding
+
+  @property
+  def charge( self ):
+    """The CreditCharge for this request.  Read-only."""
+    return( SMB2_CreditCharge( self.length ) )
+
+  def compose( self ):
+    """Compose the request body (49 bytes)."""
+    return( _format_ReadReq.pack( 49, self.padding, self.flags,
+                                  self.length, self.offset, self.fileId,
+                                  self.minCount, 0, self.remaining, 0, 0 )
+            + '\0' )
+
+  @classmethod
+  def parse( cls, body=None ):
+    """Parse a READ request body.
+
+    Errors: SMBerror( 1001 )  - Raised if the message is malformed.
+    """
+    if( len( body ) < 48 ):
+      raise SMBerror( 1001, "Short READ request" )
+    tup = _format_ReadReq.unpack_from( body )
+    if( 49 != tup[0] ):
+      raise SMBerror( 1001, "Bad READ request StructureSize" )
+    return( cls( tup[5], tup[4], tup[3], tup[6], tup[2], tup[8], tup[1] ) )
+
+
+class SMB2_ReadResponse( object ):
+  """SMB2/3 READ Response (fixed part).
+
+  Instance Attributes:
+    dataOffset  - Offset of the data, relative to the SMB2 header.
+    dataLength  - Number of bytes read.
+    remaining   - Number of bytes still to be read (RDMA only).
+
+  Doctest:
+    >>> rsp = SMB2_ReadResponse( 5 )
+    >>> body = rsp.compose() + "Hello"
+    >>> r2 = SMB2_ReadResponse.parse( body )
+    >>> print r2.dataOffset, r2.dataLength, r2.data( body ).tobytes()
+    80 5 Hello
+  """
+  __slots__ = ( "dataOffset", "dataLength", "remaining" )
+
+  def __init__( self, dataLength=0, remaining=0,
+                      dataOffset=SMB2_READ_DATA_OFFSET ):
+    """Create a READ response.  See the Instance Attributes, above."""
+    self.dataLength = dataLength
+    self.remaining  = remaining
+    self.dataOffset = dataOffset
+
+  def compose( self ):
+    """Compose the fixed part of the response body (16 bytes).
+
+    Notes:  The data is sent separately; see
+            <SMB_Transport.sendParts()>.
+    """
+    return( _format_ReadRsp.pack( 17, self.dataOffset, 0,
+                                  self.dataLength, self.remaining, 0 ) )
+
+  @classmethod
+  def parse( cls, body=None ):
+    """Parse the fixed part of a READ response body.
+
+    Errors: SMBerror( 1001 )  - Raised if the message is malformed.
+    """
+    if( len( body ) < 16 ):
+      raise SMBerror( 1001, "Short READ response" )
+    tup = _format_ReadRsp.unpack_from( body )
+    if( 17 != tup[0] ):
+      raise SMBerror( 1001, "Bad READ response StructureSize" )
+    return( cls( tup[3], tup[4], tup[1] ) )
+
+  def data( self, body=None ):
+    """Return a memoryview of the data within a received body.
+
+    Input:  body  - The body from which this response was parsed.
+
+    Errors: SMBerror( 1001 )  - Raised if the data extends beyond the
+                                end of the body.
+
+    Notes:  If the response was received by an <SMB2_Receiver> with a
+            destination buffer, the data is in that buffer instead.
+    """
+    start = self.dataOffset - SMB2_HDR_SIZE
+    if( (start < 16) or ((start + self.dataLength) > len( body )) ):
+      raise SMBerror( 1001, "READ response data is out of bounds" )
+    if( not isinstance( body, memoryview ) ):
+      body = memoryview( body )
+    return( body[start:start+self.dataLength] )
+
+
+class SMB2_WriteRequest( object ):
+  """SMB2/3 WRITE Request (fixed part).
+
+  Instance Attributes:
+    fileId      - The 16-byte FileId of the open file.
+    offset      - File offset at which to start writing.
+    length      - Number of bytes to write.
+    flags       - SMB2_WRITEFLAG_* bits.
+    remaining   - Hint: the number of bytes the client will write next.
+    dataOffset  - Offset of the data, relative to the SMB2 header.
+
+  Doctest:
+    >>> data = bytearray( 'w' * 0x20000 )
+    >>> req  = SMB2_WriteRequest( 'F' * 16, 4096, len( data ) )
+    >>> body = req.compose()
+    >>> len( body ), req.charge
+    (48, 2)
+    >>> r2 = SMB2_WriteRequest.parse( body + str( data ) )
+    >>> print r2.offset, r2.length, r2.dataOffset
+    4096 131072 112
+    >>> len( r2.data( body + str( data ) ) )
+    131072
+  """
+  __slots__ = ( "fileId", "offset", "length", "flags", "remaining",
+                "dataOffset" )
+
+  def __init__( self, fileId=None, offset=0, length=0, flags=0,
+                      remaining=0, dataOffset=SMB2_WRITE_DATA_OFFSET ):
+    """Create a WRITE request.  See the Instance Attributes, above."""
+    self.fileId     = fileId
+    self.offset     = offset
+    self.length     = length
+    self.flags      = flags
+    self.remaining  = remaining
+    self.dataOffset = dataOffset
+
+  @property
+  def charge( self ):
+    """The CreditCharge for this request.  Read-only."""
+    return( SMB2_CreditCharge( self.length ) )
+
+  def compose( self ):
+    """Compose the fixed part of the request body (48 bytes).
+
+    Notes:  The data is sent separately; see
+            <SMB_Transport.sendParts()>.
+    """
+    return( _format_WriteReq.pack( 49, self.dataOffset, self.length,
+                                   self.offset, self.fileId, 0,
+                                   self.remaining, 0, 0, self.flags ) )
+
+  @classmethod
+  def parse( cls, body=None ):
+    """Parse the fixed part of a WRITE request body.
+
+    Errors: SMBerror( 1001 )  - Raised if the message is malformed.
+    """
+    if( len( body ) < 48 ):
+      raise SMBerror( 1001, "Short WRITE request" )
+    tup = _format_WriteReq.unpack_from( body )
+    if( 49 != tup[0] ):
+      raise SMBerror( 1001, "Bad WRITE request StructureSize" )
+    return( cls( tup[4], tup[3], tup[2], tup[9], tup[6], tup[1] ) )
+
+  def data( self, body=None ):
+    """Return a memoryview of the data within a received body.
+
+    Errors: SMBerror( 1001 )  - Raised if the data extends beyond the
+                                end of the body.
+    """
+    start = self.dataOffset - SMB2_HDR_SIZE
+    if( (start < 48) or ((start + self.length) > len( body )) ):
+      raise SMBerror( 1001, "WRITE request data is out of bounds" )
+    if( not isinstance( body, memoryview ) ):
+      body = memoryview( body )
+    return( body[start:start+self.length] )
+
+
+class SMB2_WriteResponse( object ):
+  """SMB2/3 WRITE Response.
+
+  Instance Attributes:
+    count - The number of bytes written.
+
+  Doctest:
+    >>> SMB2_WriteResponse.parse( SMB2_WriteResponse( 1234 ).compose() ).count
+    1234
+  """
+  __slots__ = ( "count", )
+
+  def __init__( self, count=0 ):
+    """Create a WRITE response."""
+    self.count = count
+
+  def compose( self ):
+    """Compose the response body (16 bytes)."""
+    return( _format_WriteRsp.pack( 17, 0, self.count, 0, 0, 0 ) )
+
+  @classmethod
+  def parse( cls, body=None ):
+    """Parse a WRITE response body.
+
+    Errors: SMBerror( 1001 )  - Raised if the message is malformed.
+    """
+    if( len( body ) < 16 ):
+      raise SMBerror( 1001, "Short WRITE response" )
+    tup = _format_WriteRsp.unpack_from( body )
+    if( 17 != tup[0] ):
+      raise SMBerror( 1001, "Bad WRITE response StructureSize" )
+    return( cls( tup[2] ) )
+
+
+class SMB2_Receiver( DirectTCPFramer ):
+  """Direct TCP receiver that places READ data in the caller's buffers.
+
+  This is a <DirectTCPFramer> with one addition: when a successful,
+  non-compound READ response arrives, the <sink> function is called
+  with an <SMB2_HeaderView> of the response header.  If <sink> returns
+  a writable buffer (e.g., a memoryview of a bytearray or an mmap), the
+  response data is read from the socket directly into that buffer
+  using recv_into().  Data that has already been read into the receive
+  buffer is copied across; the rest of the data never touches the
+  receive buffer.
+
+  Messages whose data has been placed in a sink buffer are returned by
+  <messages()> truncated at the DataOffset; that is, only the header
+  and the fixed part of the body are returned.  The DataLength field
+  still gives the length of the data.  If the sink buffer is too small
+  to hold DataLength bytes, nothing is placed, and the whole message is
+  returned.
+
+  Instance Attributes:
+    sink        - The function that supplies destination buffers, or
+                  None.
+    placedBytes - Number of bytes placed directly in sink buffers.
+    copiedBytes - Number of those bytes that had to be copied from the
+                  receive buffer.
+
+  Doctest:
+    >>> import socket
+    >>> from SMB_Transport import SMB_Transport
+    >>> from SMB2_Header import _SMB2_Header, SMB2_FLAGS_SERVER_TO_REDIR
+    >>> a, b = socket.socketpair()
+    >>> dest = bytearray( 0x30000 )
+    >>> rx = SMB2_Receiver( a, lambda hv: memoryview( dest ), 0x1000 )
+    >>> hdr = _SMB2_Header( SMB2_COM_READ )
+    >>> hdr.flagReply = True
+    >>> data = 'r' * 0x30000
+    >>> rsp = SMB2_ReadResponse( len( data ) )
+    >>> SMB_Transport( b ).sendParts( hdr.compose(), rsp.compose(), data )
+    >>> got = []
+    >>> while( not got ):
+    ...   n = rx.recv()
+    ...   got = list( rx.messages() )
+    >>> len( got[0] ), dest == data, rx.placedBytes
+    (80, True, 196608)
+    >>> rx.copiedBytes < 0x1000, len( rx._buf )
+    (True, 4096)
+    >>> dest = bytearray( 0x100 )
+    >>> SMB_Transport( b ).sendParts( hdr.compose(), rsp.compose(), data )
+    >>> got = []
+    >>> while( not got ):
+    ...   n = rx.recv()
+    ...   got = list( rx.messages() )
+    >>> len( got[0] ), rx.placedBytes, dest == bytearray( 0x100 )
+    (196688, 196608, True)
+  """
+  def __init__( self, sock=None, sink=None, bufSize=_RCV_BUFSIZE ):
+    """Create a receiver.
+
+    Input:
+      sock    - A connected stream socket.
+      sink    - A function that is called with an <SMB2_HeaderView>
+                of a READ response, and returns a writable buffer for
+                the data or None.  A buffer that is too small to hold
+                DataLength bytes is not used.
+      bufSize - The initial size of the receive buffer.
+    """
+    super( SMB2_Receiver, self ).__init__( sock, bufSize )
+    self.sink = sink
+    self.placedBytes = 0
+    self.copiedBytes = 0
+    # <_dest>     - A memoryview of the current destination buffer.
+    # <_destPos>  - Number of data bytes placed so far.
+    # <_hold>     - Offset and length of the truncated message, and
+    #               the offset of the message that follows it.
+    self._dest    = None
+    self._destPos = 0
+    self._hold    = None
+
+  def recv( self ):
+    """Read available data from the socket.
+
+    Output: The number of bytes read.  Zero indicates that the peer
+            has closed the connection.
+
+    Notes:  While READ data is being placed, data is read directly into
+            the destination buffer.
+    """
+    if( self._dest is None ):
+      return( super( SMB2_Receiver, self ).recv() )
+    count = self.sock.recv_into( self._dest[self._destPos:] )
+    self._destPos    += count
+    self.rcvCount    += count
+    self.placedBytes += count
+    return( count )
+
+  def _divert( self, pos, mLen ):
+    # Check whether the message at <pos> is a READ response whose data
+    # can be placed in a sink buffer.  If so, start placing it.
+    #
+    # Input:
+    #   pos   - Buffer offset of the transport header.
+    #   mLen  - Message length.
+    #
+    # Output: True if the data is being (or has been) placed.
+    #
+    buf   = self._buf
+    start = pos + 4
+    if( (self._wpos - start) < SMB2_READ_DATA_OFFSET ):
+      return( False )
+    hv = SMB2_HeaderView( buf, start )
+    if( (SMB2_COM_READ != hv.command) or (not hv.flagReply) or
+        hv.status or hv.nextCommand ):
+      return( False )
+    dOff, dLen = struct.unpack_from( "<xxBxL", buf, start + SMB2_HDR_SIZE )
+    if( (dLen == 0) or (dOff < SMB2_READ_DATA_OFFSET) or
+        ((dOff + dLen) != mLen) ):
+      return( False )
+    dStart = start + dOff
+    if( self._wpos < dStart ):
+      return( False )
+    dest = self.sink( hv )
+    del hv
+    if( dest is None ):
+      return( False )
+    if( not isinstance( dest, memoryview ) ):
+      dest = memoryview( dest )
+    if( len( dest ) < dLen ):
+      # More data than the buffer will hold (e.g., the server returned
+      # more than was asked for).  Receive the message normally.
+      return( False )
+    dest = dest[:dLen]
+    # Copy whatever data is already in the receive buffer.
+    have   = max( 0, min( self._wpos - dStart, dLen ) )
+    if( have ):
+      dest[:have] = self._view[dStart:dStart+have]
+    self.copiedBytes += have
+    self.placedBytes += have
+    self._dest    = dest
+    self._destPos = have
+    if( have < dLen ):
+      # The rest of the data will be read directly into <dest>.  The
+      # receive buffer is trimmed to the end of the fixed part.
+      self._wpos = dStart
+      self._hold = (start, dOff, dStart)
+    else:
+      self._hold = (start, dOff, start + mLen)
+    return( True )
+
+  def messages( self ):
+    """Return the complete SMB messages that have been received.
+
+    Output: A generator that returns memoryviews of the received SMB
+            messages.  Each memoryview is only valid until the next call
+            to <recv()>.
+
+    Errors: SMBerror( 1002 )  - Raised if a Direct TCP header is
+                                invalid.
+    """
+    while( True ):
+      if( self._hold is not None ):
+        if( self._destPos < len( self._dest ) ):
+          return
+        start, dOff, self._rpos = self._hold
+        self._dest = self._hold = None
+        self.msgCount += 1
+        yield( self._view[start:start+dOff] )
+      pos = self._rpos
+      if( (self._wpos - pos) < 4 ):
+        return
+      mLen = self._header( pos )[1]
+      if( self.sink and self._divert( pos, mLen ) ):
+        continue
+      if( (self._wpos - pos - 4) < mLen ):
+        return
+      self._rpos = pos + 4 + mLen
+      self.msgCount += 1
+      yield( self._view[pos+4:self._rpos] )
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=200, size=0x800000 ):
+  # Compare READ response reception with and without data placement.
+  #
+  # Input:
+  #   count - Number of READ responses to receive.
+  #   size  - DataLength of each response.  The default is 8MiB.
+  #
+  # Notes:  Without placement, each response is read into the framer's
+  #         receive buffer and then copied to the destination, which
+  #         is what a caller would otherwise have to do.
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import smb.SMB2_ReadWrite as m; m._bench()'
+  #
+  import socket, threading, time
+  from SMB_Transport import SMB_Transport
+  from SMB2_Header import _SMB2_Header
+
+  hdr = _SMB2_Header( SMB2_COM_READ )
+  hdr.flagReply = True
+  hdr  = hdr.compose()
+  body = SMB2_ReadResponse( size ).compose()
+  data = memoryview( 'd' * size )
+  dest = memoryview( bytearray( size ) )
+
+  def _sender( sock ):
+    tx = SMB_Transport( sock )
+    for i in xrange( count ):
+      tx.sendParts( hdr, body, data )
+    sock.close()
+
+  for placed in (False, True):
+    rcv, snd = socket.socketpair()
+    if( placed ):
+      rx = SMB2_Receiver( rcv, lambda hv: dest )
+    else:
+      rx = SMB2_Receiver( rcv )
+    threading.Thread( target=_sender, args=(snd,) ).start()
+    got   = 0
+    start = time.time()
+    while( rx.recv() ):
+      for msg in rx.messages():
+        if( not placed ):
+          dest[:] = SMB2_ReadResponse.parse( msg[64:] ).data( msg[64:] )
+        got += size
+    elapsed = time.time() - start
+    rcv.close()
+    print "%s: %7.1f MiB/second, receive buffer %d bytes" % \
+          ("Placed" if( placed ) else "Copied",
+           got / elapsed / 0x100000, len( rx._buf ))
+
+# ============================================================================ #
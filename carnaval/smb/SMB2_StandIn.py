@@ -0,0 +1,709 @@
+# ============================================================================ #
+#                               SMB2_StandIn.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Carnaval Toolkit: In-process SMB2 stand-in server, for benchmarks.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - This is not a file server.  It is just enough of one to give the
+#     client-side transfer code something repeatable to talk to.  Files
+#     are buffers in memory, and there is no authentication, no access
+#     checking, and no locking.
+#
+#   - Supported commands are NEGOTIATE, SESSION_SETUP, TREE_CONNECT,
+#     CREATE, CLOSE, READ, WRITE, and ECHO.  Anything else is answered
+#     with STATUS_NOT_SUPPORTED.
+#
+#   - SESSION_SETUP always succeeds, with a null session; the security
+#     token is ignored.  Nothing is signed or encrypted, so the 3.1.1
+#     preauth integrity hash is not kept.
+#
+#   - Only as much state is checked as is needed to do the work:
+#     TREE_CONNECT needs a valid SessionId, and CREATE needs a valid
+#     TreeId (to find the share).  READ, WRITE, and CLOSE need only a
+#     valid FileId, so a benchmark can skip the setup and work directly
+#     with files added by <SMB2_StandInServer.addFile()>.
+#
+#   - Artificial latency is applied to responses, not to requests.  The
+#     server reads and processes requests as soon as they arrive, and
+#     holds each response until <latency> seconds after the request was
+#     received.  Responses are not delayed behind one another, so the
+#     server behaves like a fast server at the far end of a long wire,
+#     and keeping more requests in flight pays off just as it would on a
+#     real network.
+#
+# References:
+#
+#   [MS-SMB2]   Microsoft Corporation, "Server Message Block (SMB)
+#               Protocol Versions 2 and 3"
+#               http://msdn.microsoft.com/en-us/library/cc246482.aspx
+#
+# ============================================================================ #
+#
+"""Carnaval Toolkit: In-process SMB2 Stand-in Server
+
+<SMB2_StandInServer> serves SMB2 requests against files kept in memory.
+It runs in the same process as the client, over a socketpair or over
+loopback TCP, so that client throughput can be measured without a real
+file server.
+
+Shares are added with <SMB2_StandInServer.addShare()>, and the files in
+them may be opened by name (CREATE) after the usual NEGOTIATE,
+SESSION_SETUP, and TREE_CONNECT exchanges.  Open files may also be added
+directly, with <SMB2_StandInServer.addFile()>.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   os              - Random FileIds.
+#   socket          - Sockets.
+#   struct          - Binary data handling.
+#   threading       - Server threads.
+#   time            - Artificial latency.
+#   collections     - deque, for the delayed response queue.
+#   itertools       - count, for SessionIds and TreeIds.
+#   SMB_Core        - Errors and FILETIME values.
+#   SMB_Status      - NT Status codes.
+#   SMB2_Header     - Header views and constants.
+#   SMB2_Credits    - Server-side sequence window and credit policy.
+#   SMB2_Negotiate  - NEGOTIATE codecs.
+#   SMB2_ReadWrite  - READ and WRITE codecs.
+#   SMB_Transport   - Direct TCP framing.
+#
+
+import os           # Random bytes.
+import socket       # Sockets.
+import struct       # Binary data handling.
+import threading    # Threads.
+import time         # Clocks and sleeping.
+
+from collections    import deque
+from itertools      import count
+from SMB_Core       import SMBerror, SMB_FileTime
+from SMB_Status     import *
+from SMB2_Header    import *
+from SMB2_Negotiate import SMB2_NegotiateRequest, SMB2_NegotiateResponse
+from SMB2_Negotiate import SMB2_NegContext, SMB2_SelectDialect, _bytes
+from SMB2_Negotiate import SMB2_GLOBAL_CAP_LARGE_MTU
+from SMB2_Credits   import SMB2_SequenceWindow, SMB2_CreditPolicy
+from SMB2_ReadWrite import SMB2_ReadRequest, SMB2_ReadResponse
+from SMB2_ReadWrite import SMB2_WriteRequest, SMB2_WriteResponse
+from SMB_Transport  import SMB_Transport
+
+
+# Constants ------------------------------------------------------------------ #
+#
+
+SMB2_STANDIN_MAXIO = 0x800000   # Largest READ or WRITE accepted (8MiB).
+
+# CREATE dispositions [MS-SMB2; 2.2.13].
+_FILE_SUPERSEDE     = 0
+_FILE_OPEN          = 1
+_FILE_CREATE        = 2
+_FILE_OPEN_IF       = 3
+_FILE_OVERWRITE     = 4
+_FILE_OVERWRITE_IF  = 5
+
+# CREATE actions [MS-SMB2; 2.2.14].
+_FILE_SUPERSEDED    = 0
+_FILE_OPENED        = 1
+_FILE_CREATED       = 2
+_FILE_OVERWRITTEN   = 3
+
+_FILE_ATTRIBUTE_NORMAL        = 0x00000080
+_SMB2_SESSION_FLAG_IS_NULL    = 0x0002
+_SMB2_SHARE_TYPE_DISK         = 0x01
+_SMB2_CLOSE_FLAG_POSTQUERY    = 0x0001
+_FILE_ALL_ACCESS              = 0x001F01FF
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _ERROR_BODY - The body of an SMB2 ERROR Response with no error data.
+#   _ECHO_BODY  - The body of an SMB2 ECHO Response.
+#   _format_*   - Fixed-length message body formats.  The formats of
+#                 variable-length bodies do not include the one-byte
+#                 Buffer that is counted in the StructureSize.
+#
+
+_ERROR_BODY = "\x09\0\0\0\0\0\0\0\0"
+_ECHO_BODY  = "\x04\0\0\0"
+
+_format_SessReq   = struct.Struct( "<HBBLLHHQ" )
+_format_SessRsp   = struct.Struct( "<HHHH" )
+_format_TreeReq   = struct.Struct( "<HHHH" )
+_format_TreeRsp   = struct.Struct( "<HBBLLL" )
+_format_CreateReq = struct.Struct( "<HBBLQQLLLLLHHLL" )
+_format_CreateRsp = struct.Struct( "<HBBLQQQQQQLL16sLL" )
+_format_CloseReq  = struct.Struct( "<HHL16s" )
+_format_CloseRsp  = struct.Struct( "<HHLQQQQQQL" )
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class SMB2_StandInServer( object ):
+  """A minimal in-memory SMB2 server.
+
+  Instance Attributes:
+    files       - A dictionary that maps FileIds (16-byte strings) to
+                  file contents (strings or bytearrays).  These are the
+                  open files.
+    shares      - A dictionary that maps share names (upper case) to
+                  dictionaries that map file names (lower case) to file
+                  contents.
+    dialects    - The dialects supported by the server.
+    guid        - The server GUID.
+    latency     - Artificial response delay, in seconds.
+    maxCredits  - The most credits granted to a client.
+    maxIO       - The largest READ (or WRITE) length accepted.
+    reqCount    - Number of requests handled.
+
+  Doctest:
+    >>> from smb.SMB2_Connection import SMB2_Connection, _SMB2_Header
+    >>> srv  = SMB2_StandInServer()
+    >>> fid  = srv.addFile( 'abcdefgh' * 1000 )
+    >>> conn = SMB2_Connection( srv.socketpair() )
+    >>> echo = _SMB2_Header( SMB2_COM_ECHO ).compose()
+    >>> print conn.send( echo, _ECHO_BODY ).result()[0].status
+    0
+    >>> read = _SMB2_Header( SMB2_COM_READ ).compose()
+    >>> dest = bytearray( 16 )
+    >>> req  = SMB2_ReadRequest( fid, 8, len( dest ) )
+    >>> hv, body = conn.send( read, req.compose(), into=dest ).result()
+    >>> print hv.status, str( dest )
+    0 abcdefghabcdefgh
+    >>> req.fileId = 'x' * 16
+    >>> hv, body = conn.send( read, req.compose() ).result()
+    >>> print NTStatus( hv.status ).name
+    STATUS_FILE_CLOSED
+    >>> fid  = srv.addFile( bytearray( 4 ) )
+    >>> req  = SMB2_WriteRequest( fid, 2, 6 )
+    >>> hv, body = conn.send( _SMB2_Header( SMB2_COM_WRITE ).compose(),
+    ...                       req.compose(), payload="Hello!" ).result()
+    >>> SMB2_WriteResponse.parse( body ).count, str( srv.files[ fid ] )
+    (6, '\\x00\\x00Hello!')
+    >>> conn.close(); srv.close()
+
+    A full session, over loopback TCP:
+    >>> from smb.SMB2_Negotiate import SMB2_NegotiateRequest as NegReq
+    >>> from smb.SMB2_Negotiate import SMB2_NegotiateResponse as NegRsp
+    >>> srv  = SMB2_StandInServer( latency=0.001 )
+    >>> srv.addShare( "Bench", { "Hello.txt" : "Hi!" } ).keys()
+    ['hello.txt']
+    >>> conn = SMB2_Connection( socket.create_connection( srv.listen() ) )
+    >>> def call( cmd, body, sid=0, tid=0, **kw ):
+    ...   hdr = _SMB2_Header( cmd, SMB2_DIALECT_311 )
+    ...   hdr.sessionId, hdr.treeId = sid, tid
+    ...   return( conn.send( hdr.compose(), body, **kw ).result() )
+    >>> hv, body = call( SMB2_COM_NEGOTIATE, NegReq().compose() )
+    >>> print "0x%04X" % NegRsp.parse( body ).dialect
+    0x0311
+    >>> req = _format_SessReq.pack( 25, 0, 1, 0, 0, 0, 0, 0 ) + '\\0'
+    >>> hv, body = call( SMB2_COM_SESSION_SETUP, req )
+    >>> sid = hv.sessionId
+    >>> print hv.status, _format_SessRsp.unpack_from( body )[1]
+    0 2
+    >>> def tree( share ):
+    ...   path = (u"\\\\\\\\srv\\\\" + share).encode( "utf_16_le" )
+    ...   req  = _format_TreeReq.pack( 9, 0, 72, len( path ) ) + path
+    ...   return( call( SMB2_COM_TREE_CONNECT, req, sid ) )
+    >>> print NTStatus( tree( u"nope" )[0].status ).name
+    STATUS_BAD_NETWORK_NAME
+    >>> hv, body = tree( u"bench" )
+    >>> tid = hv.treeId
+    >>> print hv.status, _format_TreeRsp.unpack_from( body )[1]
+    0 1
+    >>> def create( name, disp ):
+    ...   name = name.encode( "utf_16_le" )
+    ...   req  = _format_CreateReq.pack( 57, 0, 0, 2, 0, 0, _FILE_ALL_ACCESS,
+    ...            _FILE_ATTRIBUTE_NORMAL, 7, disp, 0, 120, len( name ),
+    ...            0, 0 ) + name
+    ...   hv, body = call( SMB2_COM_CREATE, req, sid, tid )
+    ...   if( hv.status ):
+    ...     return( NTStatus( hv.status ).name )
+    ...   rsp = _format_CreateRsp.unpack_from( body )
+    ...   return( rsp[3], rsp[9], rsp[12] )
+    >>> action, size, fid = create( u"HELLO.TXT", _FILE_OPEN )
+    >>> print action, size
+    1 3
+    >>> create( u"new.dat", _FILE_OPEN )
+    'STATUS_OBJECT_NAME_NOT_FOUND'
+    >>> action, size, fid = create( u"new.dat", _FILE_CREATE )
+    >>> print action, size
+    2 0
+    >>> req = SMB2_WriteRequest( fid, 0, 5 ).compose()
+    >>> print call( SMB2_COM_WRITE, req, sid, tid, payload="12345" )[0].status
+    0
+    >>> create( u"new.dat", _FILE_CREATE )
+    'STATUS_OBJECT_NAME_COLLISION'
+    >>> req = _format_CloseReq.pack( 24, _SMB2_CLOSE_FLAG_POSTQUERY, 0, fid )
+    >>> hv, body = call( SMB2_COM_CLOSE, req, sid, tid )
+    >>> print hv.status, _format_CloseRsp.unpack_from( body )[8]
+    0 5
+    >>> print NTStatus( call( SMB2_COM_CLOSE, req, sid, tid )[0].status ).name
+    STATUS_FILE_CLOSED
+    >>> str( srv.shares[ "BENCH" ][ "new.dat" ] ), len( srv.files )
+    ('12345', 1)
+    >>> conn.close(); srv.close()
+  """
+  def __init__( self, latency=0.0, maxCredits=512, maxIO=SMB2_STANDIN_MAXIO,
+                      dialects=SMB2_DIALECT_LIST ):
+    """Create a stand-in server.
+
+    Input:
+      latency     - Artificial response delay, in seconds.
+      maxCredits  - The most credits that will be granted to a client.
+      maxIO       - The largest READ length accepted.
+      dialects    - The dialects supported by the server.
+    """
+    self.files      = {}
+    self.shares     = {}
+    self.dialects   = list( dialects )
+    self.guid       = os.urandom( 16 )
+    self.latency    = latency
+    self.maxCredits = maxCredits
+    self.maxIO      = maxIO
+    self.reqCount   = 0
+    # <_socks>    - Server-side sockets, closed by <close()>.
+    # <_listener> - The listening socket, if any.
+    # <_ids>      - Source of SessionIds and TreeIds.
+    self._socks    = []
+    self._listener = None
+    self._ids      = count( 1 )
+
+  def addFile( self, data='', fileId=None ):
+    """Add a file.
+
+    Input:
+      data    - The file contents.  Use a bytearray if the file will be
+                written.
+      fileId  - The FileId.  If None, a random FileId is generated.
+
+    Output: The FileId.
+    """
+    fileId = os.urandom( 16 ) if( fileId is None ) else fileId
+    self.files[ fileId ] = data
+    return( fileId )
+
+  def addShare( self, name=None, files=None ):
+    """Add a share.
+
+    Input:
+      name  - The share name.  Share names are not case sensitive.
+      files - A dictionary that maps file names to file contents.  Use
+              bytearrays for files that will be written.  Files
+              created by clients are always bytearrays.
+
+    Output: The share's file dictionary, which maps file names (in
+            lower case, because file names are not case sensitive
+            either) to file contents.  Changes made to the dictionary
+            are seen by clients.
+    """
+    files = dict( (k.lower(), v) for k, v in (files or {}).iteritems() )
+    self.shares[ name.upper() ] = files
+    return( files )
+
+  def serve( self, sock=None, background=True ):
+    """Serve a connection.
+
+    Input:
+      sock        - A connected stream socket.
+      background  - If True, the connection is served by its own
+                    thread, and this method returns immediately.  If
+                    False, the connection is served by the calling
+                    thread, and this method returns when the connection
+                    is closed.
+
+    Notes:  If latency is being simulated, responses are sent by an
+            additional thread.
+    """
+    self._socks.append( sock )
+    _StandInSession( self, sock, background )
+
+  def socketpair( self ):
+    """Create a socketpair, serve one end, and return the other.
+
+    Output: A connected stream socket, for use by the client.
+    """
+    a, b = socket.socketpair()
+    self.serve( b )
+    return( a )
+
+  def listen( self, IP="127.0.0.1", port=0 ):
+    """Accept TCP connections in a background thread.
+
+    Input:
+      IP    - The address on which to listen.
+      port  - The port on which to listen.  Zero picks a free port.
+
+    Output: The (IP, port) address on which the server is listening.
+    """
+    lsock = socket.socket( socket.AF_INET, socket.SOCK_STREAM )
+    lsock.setsockopt( socket.SOL_SOCKET, socket.SO_REUSEADDR, 1 )
+    lsock.bind( (IP, port) )
+    lsock.listen( 16 )
+    self._listener = lsock
+    def _accept():
+      try:
+        while( True ):
+          sock, addr = lsock.accept()
+          sock.setsockopt( socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 )
+          self.serve( sock )
+      except socket.error:
+        pass
+    t = threading.Thread( target=_accept )
+    t.daemon = True
+    t.start()
+    return( lsock.getsockname() )
+
+  def close( self ):
+    """Stop listening, and close all connections."""
+    if( self._listener ):
+      try:
+        self._listener.shutdown( socket.SHUT_RDWR )
+      except socket.error:
+        pass
+      self._listener.close()
+      self._listener = None
+    for sock in self._socks:
+      try:
+        sock.shutdown( socket.SHUT_RDWR )
+      except socket.error:
+        pass
+    self._socks = []
+
+  # Command handlers.
+  #
+  # Input:
+  #   sess  - The <_StandInSession>.
+  #   hv    - An <SMB2_HeaderView> of the response header, which starts
+  #           out as a copy of the request header.  Handlers may read
+  #           request fields from it, and may set response fields (e.g.,
+  #           the SessionId or TreeId).
+  #   body  - A memoryview of the request body.
+  #
+  # Output: A tuple: (NT Status code, [response body parts])
+  #
+  def _negotiate( self, sess, hv, body ):
+    req     = SMB2_NegotiateRequest.parse( body )
+    dialect = SMB2_SelectDialect( req.dialects, self.dialects )
+    if( dialect is None ):
+      return( (STATUS_NOT_SUPPORTED, [ _ERROR_BODY ]) )
+    sess.dialect = dialect
+    if( SMB2_DIALECT_202 == dialect ):
+      caps, maxIO = 0, min( self.maxIO, 0x10000 )
+    else:
+      caps, maxIO = SMB2_GLOBAL_CAP_LARGE_MTU, self.maxIO
+    ctxs = [ SMB2_NegContext.preauth() ] \
+           if( SMB2_DIALECT_311 == dialect ) else None
+    rsp  = SMB2_NegotiateResponse( dialect, serverGuid=self.guid,
+                                   capabilities=caps,
+                                   maxTransactSize=maxIO,
+                                   maxReadSize=maxIO,
+                                   maxWriteSize=maxIO,
+                                   systemTime=SMB_FileTime.utcNow(),
+                                   contexts=ctxs )
+    return( (STATUS_SUCCESS, [ rsp.compose() ]) )
+
+  def _sessionSetup( self, sess, hv, body ):
+    _unpack( _format_SessReq, 25, body )
+    sid = next( self._ids )
+    sess.sessions.add( sid )
+    hv.sessionId = sid
+    rsp = _format_SessRsp.pack( 9, _SMB2_SESSION_FLAG_IS_NULL, 0, 0 )
+    return( (STATUS_SUCCESS, [ rsp, '\0' ]) )
+
+  def _treeConnect( self, sess, hv, body ):
+    if( hv.sessionId not in sess.sessions ):
+      return( (STATUS_USER_SESSION_DELETED, [ _ERROR_BODY ]) )
+    tup   = _unpack( _format_TreeReq, 9, body )
+    path  = _name( body, tup[2], tup[3] )
+    files = self.shares.get( path.split( u'\\' )[-1].upper() )
+    if( files is None ):
+      return( (STATUS_BAD_NETWORK_NAME, [ _ERROR_BODY ]) )
+    tid = next( self._ids ) & 0xFFFFFFFF
+    sess.trees[ tid ] = files
+    hv.treeId = tid
+    rsp = _format_TreeRsp.pack( 16, _SMB2_SHARE_TYPE_DISK, 0, 0, 0,
+                                _FILE_ALL_ACCESS )
+    return( (STATUS_SUCCESS, [ rsp ]) )
+
+  def _create( self, sess, hv, body ):
+    files = sess.trees.get( hv.treeId )
+    if( files is None ):
+      return( (STATUS_NETWORK_NAME_DELETED, [ _ERROR_BODY ]) )
+    tup  = _unpack( _format_CreateReq, 57, body )
+    disp = tup[9]
+    name = _name( body, tup[11], tup[12] ).lstrip( u'\\' ).lower()
+    if( not name ):
+      # The share root.  There are no directories here.
+      return( (STATUS_FILE_IS_A_DIRECTORY, [ _ERROR_BODY ]) )
+    data = files.get( name )
+    if( data is None ):
+      if( disp in (_FILE_OPEN, _FILE_OVERWRITE) ):
+        return( (STATUS_OBJECT_NAME_NOT_FOUND, [ _ERROR_BODY ]) )
+      action = _FILE_CREATED
+      data   = files[ name ] = bytearray()
+    elif( _FILE_CREATE == disp ):
+      return( (STATUS_OBJECT_NAME_COLLISION, [ _ERROR_BODY ]) )
+    elif( disp in (_FILE_OPEN, _FILE_OPEN_IF) ):
+      action = _FILE_OPENED
+    else:
+      action = _FILE_SUPERSEDED if( _FILE_SUPERSEDE == disp ) \
+               else _FILE_OVERWRITTEN
+      data   = files[ name ] = bytearray()
+    fileId = self.addFile( data )
+    now    = SMB_FileTime.utcNow()
+    rsp    = _format_CreateRsp.pack( 89, 0, 0, action, now, now, now, now,
+                                     len( data ), len( data ),
+                                     _FILE_ATTRIBUTE_NORMAL, 0, fileId, 0, 0 )
+    return( (STATUS_SUCCESS, [ rsp, '\0' ]) )
+
+  def _close( self, sess, hv, body ):
+    tup  = _unpack( _format_CloseReq, 24, body )
+    data = self.files.pop( tup[3], None )
+    if( data is None ):
+      return( (STATUS_FILE_CLOSED, [ _ERROR_BODY ]) )
+    if( tup[1] & _SMB2_CLOSE_FLAG_POSTQUERY ):
+      now = SMB_FileTime.utcNow()
+      rsp = _format_CloseRsp.pack( 60, _SMB2_CLOSE_FLAG_POSTQUERY, 0,
+                                   now, now, now, now,
+                                   len( data ), len( data ),
+                                   _FILE_ATTRIBUTE_NORMAL )
+    else:
+      rsp = _format_CloseRsp.pack( 60, 0, 0, 0, 0, 0, 0, 0, 0, 0 )
+    return( (STATUS_SUCCESS, [ rsp ]) )
+
+  def _echo( self, sess, hv, body ):
+    return( (STATUS_SUCCESS, [ _ECHO_BODY ]) )
+
+  def _read( self, sess, hv, body ):
+    req  = SMB2_ReadRequest.parse( body )
+    data = self.files.get( req.fileId )
+    if( data is None ):
+      return( (STATUS_FILE_CLOSED, [ _ERROR_BODY ]) )
+    if( req.length > self.maxIO ):
+      return( (STATUS_INVALID_PARAMETER, [ _ERROR_BODY ]) )
+    if( req.offset >= len( data ) ):
+      return( (STATUS_END_OF_FILE, [ _ERROR_BODY ]) )
+    data = memoryview( data )[req.offset:req.offset+req.length]
+    return( (STATUS_SUCCESS, [ SMB2_ReadResponse( len( data ) ).compose(),
+                               data ]) )
+
+  def _write( self, sess, hv, body ):
+    req  = SMB2_WriteRequest.parse( body )
+    data = self.files.get( req.fileId )
+    if( data is None ):
+      return( (STATUS_FILE_CLOSED, [ _ERROR_BODY ]) )
+    if( not isinstance( data, bytearray ) ):
+      return( (STATUS_ACCESS_DENIED, [ _ERROR_BODY ]) )
+    if( req.length > self.maxIO ):
+      return( (STATUS_INVALID_PARAMETER, [ _ERROR_BODY ]) )
+    end = req.offset + req.length
+    if( end > len( data ) ):
+      data.extend( bytearray( end - len( data ) ) )
+    data[req.offset:end] = req.data( body )
+    return( (STATUS_SUCCESS, [ SMB2_WriteResponse( req.length ).compose() ]) )
+
+  # Command dispatch table.  Handlers are looked up by name, so that a
+  # subclass may override them (e.g., to inject failures).
+  _handlers = { SMB2_COM_NEGOTIATE     : "_negotiate",
+                SMB2_COM_SESSION_SETUP : "_sessionSetup",
+                SMB2_COM_TREE_CONNECT  : "_treeConnect",
+                SMB2_COM_CREATE        : "_create",
+                SMB2_COM_CLOSE         : "_close",
+                SMB2_COM_ECHO          : "_echo",
+                SMB2_COM_READ          : "_read",
+                SMB2_COM_WRITE         : "_write" }
+
+
+class _StandInSession( object ):
+  # One client connection to an <SMB2_StandInServer>.
+  #
+  # The reader thread parses and handles requests.  Responses are sent
+  # immediately or, if latency is being simulated, queued for the
+  # sender thread, which sends each one when its time comes.
+  #
+  def __init__( self, server, sock, background=True ):
+    # Create the session and start the threads.
+    self.server = server
+    self.sock   = sock
+    self.tx     = SMB_Transport( sock )
+    self.window = SMB2_SequenceWindow( 1,
+                    SMB2_CreditPolicy( server.maxCredits ) )
+    # <dialect>   - The negotiated dialect, or None.
+    # <sessions>  - The set of SessionIds established on this connection.
+    # <trees>     - A dictionary that maps TreeIds to share file
+    #               dictionaries.
+    self.dialect  = None
+    self.sessions = set()
+    self.trees    = {}
+    # <_queue>  - Delayed responses: (due time, [message parts]).
+    # <_cond>   - Protects the queue.
+    self._queue = deque()
+    self._cond  = threading.Condition( threading.Lock() )
+    self._done  = False
+    if( server.latency > 0 ):
+      sender = threading.Thread( target=self._sender )
+      sender.daemon = True
+      sender.start()
+    if( background ):
+      reader = threading.Thread( target=self._run )
+      reader.daemon = True
+      reader.start()
+    else:
+      self._run()
+
+  def _respond( self, hv, body ):
+    # Handle one request, and return the response message parts.
+    srv = self.server
+    srv.reqCount += 1
+    rsp = bytearray( hv.header() )
+    rv  = SMB2_HeaderView( rsp )
+    handler = srv._handlers.get( hv.command )
+    try:
+      status, parts = getattr( srv, handler )( self, rv, body ) \
+                      if( handler ) \
+                      else (STATUS_NOT_SUPPORTED, [ _ERROR_BODY ])
+    except Exception:
+      status, parts = (STATUS_INVALID_PARAMETER, [ _ERROR_BODY ])
+    rv.flags         = SMB2_FLAGS_SERVER_TO_REDIR | (rv.flags &
+                                                     SMB2_FLAGS_ASYNC_COMMAND)
+    rv.status        = status
+    rv.nextCommand   = 0
+    rv.creditReqResp = self.window.respond( max( 1, hv.creditCharge ),
+                                            hv.creditReqResp )
+    del rv
+    return( [ rsp ] + parts )
+
+  def _send( self, parts ):
+    # Send a response now.
+    self.tx.sendParts( *parts )
+
+  def _sender( self ):
+    # Send delayed responses when they are due.
+    cond = self._cond
+    try:
+      while( True ):
+        with cond:
+          while( not self._queue and not self._done ):
+            cond.wait()
+          if( not self._queue ):
+            return
+          due, parts = self._queue.popleft()
+        delay = due - time.time()
+        if( delay > 0 ):
+          time.sleep( delay )
+        self._send( parts )
+    except socket.error:
+      pass
+
+  def _run( self ):
+    # Read and handle requests until the connection closes.
+    latency = self.server.latency
+    try:
+      while( self.tx.recv() ):
+        now = time.time()
+        for msg in self.tx.messages():
+          for hv, body in SMB2_SplitCompound( msg ):
+            if( not self.window.check( hv ) ):
+              # Bad MessageId.  A real server drops the connection.
+              raise socket.error( "MessageId out of sequence" )
+            if( SMB2_COM_CANCEL == hv.command ):
+              continue
+            parts = self._respond( hv, body )
+            if( latency > 0 ):
+              with self._cond:
+                self._queue.append( (now + latency, parts) )
+                self._cond.notify()
+            else:
+              self._send( parts )
+    except (socket.error, ValueError, SMBerror):
+      pass
+    with self._cond:
+      self._done = True
+      self._cond.notify()
+    try:
+      self.sock.shutdown( socket.SHUT_RDWR )
+    except socket.error:
+      pass
+
+
+# Functions ------------------------------------------------------------------ #
+#
+
+def _unpack( fmt=None, size=0, body=None ):
+  # Unpack the fixed part of a request body.
+  #
+  # Input:
+  #   fmt   - The struct.Struct format of the fixed part of the body.
+  #   size  - The expected StructureSize.
+  #   body  - The request body.
+  #
+  # Output: The unpacked tuple.
+  #
+  # Errors: SMBerror( 1001 )  - The body is short, or the StructureSize
+  #                             is wrong.
+  #
+  if( len( body ) < fmt.size ):
+    raise SMBerror( 1001, "Short request" )
+  tup = fmt.unpack_from( body )
+  if( size != tup[0] ):
+    raise SMBerror( 1001, "Bad request StructureSize" )
+  return( tup )
+
+def _name( body=None, offset=0, length=0 ):
+  # Extract a UTF-16LE name from a request body.
+  #
+  # Input:
+  #   body    - The request body.
+  #   offset  - The offset of the name, relative to the header.
+  #   length  - The length of the name, in bytes.
+  #
+  # Output: The name, as a unicode string.
+  #
+  # Errors: SMBerror( 1001 )  - The name is out of bounds.
+  #
+  if( not length ):
+    return( u'' )
+  start = offset - SMB2_HDR_SIZE
+  if( (start < 0) or ((start + length) > len( body )) ):
+    raise SMBerror( 1001, "Name is out of bounds" )
+  return( _bytes( body[start:start+length] ).decode( "utf_16_le" ) )
+
+# ============================================================================ #
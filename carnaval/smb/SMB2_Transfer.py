@@ -0,0 +1,795 @@
+# ============================================================================ #
+#                              SMB2_Transfer.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Carnaval Toolkit: Bulk SMB2 file transfer.
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - A single READ has to wait a full round trip.  To fill the pipe,
+#     many READs must be outstanding at once; the number needed is the
+#     bandwidth-delay product divided by the READ size.  Too few, and
+#     the link sits idle.  Too many, and requests just queue up at the
+#     server (which uses up credits and adds latency without adding
+#     throughput).
+#
+#   - The window (the number of outstanding READs) is adjusted using the
+#     same idea as TCP Vegas: the shortest round trip time seen so far
+#     is taken to be the unloaded latency, and the difference between
+#     the expected and actual rates tells us how many requests are
+#     sitting in a queue somewhere.  If fewer than <_VEGAS_ALPHA> are
+#     queued, the window grows; if more than <_VEGAS_BETA>, it shrinks.
+#     Round trip times are noisy (thread scheduling adds jitter), so the
+#     window also grows (by a quarter) as long as each increase is still
+#     paying off in measured throughput.  The window is adjusted at
+#     most once per window's worth of completions.
+#
+#   - Python 2.7 mmap objects do not support memoryview, so the file
+#     mapping is exposed through a ctypes array, which does.  See
+#     SMB2_MapView().
+#
+# ============================================================================ #
+#
+"""Carnaval Toolkit: Bulk SMB2 File Transfer
+
+<SMB2_Download> reads a file using many outstanding SMB2 READ requests
+on an <SMB2_Connection>.  Responses may arrive in any order; the data
+is received directly into its place in the destination buffer, which is
+typically a memory-mapped file.
+
+<SMB2_Upload> does the reverse, using SMB2 WRITE requests whose payloads
+are memoryview slices of the source (again, typically a memory-mapped
+file), so the data is never copied on its way to the socket.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   ctypes          - Writable memoryviews of mmap objects.
+#   mmap            - Memory-mapped files.
+#   os              - File handling.
+#   time            - Round trip timing.
+#   Queue           - Completion queue.
+#   SMB_Core        - The SMBerror exception class.
+#   SMB_Status      - NT Status codes.
+#   SMB2_Header     - SMB2 header composition.
+#   SMB2_Credits    - Credit size.
+#   SMB2_ReadWrite  - READ and WRITE codecs.
+#
+
+import ctypes       # Foreign function interface; used for buffer access.
+import mmap         # Memory-mapped files.
+import os           # File handling.
+import time         # Timing.
+import Queue        # Thread-safe queue.
+
+from SMB_Core       import SMBerror
+from SMB_Status     import *
+from SMB2_Header    import *
+from SMB2_Header    import _SMB2_Header
+from SMB2_Credits   import SMB2_CREDIT_SIZE
+from SMB2_ReadWrite import SMB2_ReadRequest, SMB2_ReadResponse
+from SMB2_ReadWrite import SMB2_WriteRequest, SMB2_WriteResponse
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _VEGAS_ALPHA  - Grow the window if fewer requests than this are
+#                   estimated to be queued.
+#   _VEGAS_BETA   - Shrink the window if more requests than this are
+#                   estimated to be queued.
+#   _RATE_GAIN    - Also grow the window if the last increase raised the
+#                   transfer rate by at least this factor.
+#
+
+_VEGAS_ALPHA = 2.0
+_VEGAS_BETA  = 4.0
+_RATE_GAIN   = 1.05
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class SMB2_Download( object ):
+  """Windowed, parallel SMB2 file reader.
+
+  Instance Attributes:
+    conn      - The <SMB2_Connection>.
+    chunk     - The length of each READ request.
+    window    - The current number of outstanding READs allowed.
+    minWindow - The smallest window.
+    maxWindow - The largest window.
+    adaptive  - If False, the window is fixed.
+    minRtt    - The shortest READ round trip seen, in seconds.
+    rtt       - Smoothed READ round trip time, in seconds.
+    reads     - Number of READ requests sent.
+    retries   - Number of READs re-sent after a short read.
+    peak      - The largest number of READs outstanding at once.
+
+  Doctest:
+    >>> from smb.SMB2_StandIn import SMB2_StandInServer
+    >>> from smb.SMB2_Connection import SMB2_Connection
+    >>> srv  = SMB2_StandInServer( latency=0.002 )
+    >>> data = os.urandom( 0x500000 )
+    >>> fid  = srv.addFile( data )
+    >>> conn = SMB2_Connection( srv.socketpair() )
+    >>> dest = bytearray( len( data ) )
+    >>> dl = SMB2_Download( conn, fid, chunk=0x10000 )
+    >>> dl.run( dest, len( data ) ) == len( data ), dest == data
+    (True, True)
+    >>> dl.peak > 1, dl.reads
+    (True, 80)
+    >>> dest = bytearray( 0x100000 )
+    >>> dl.run( dest, len( dest ), offset=len( data ) - 10 )
+    10
+    >>> conn.close(); srv.close()
+
+    If a READ fails, the others are allowed to finish before the error
+    is raised, so nothing is left writing into the buffer:
+    >>> class Flaky( SMB2_StandInServer ):
+    ...   count = 0
+    ...   def _read( self, sess, hv, body ):
+    ...     self.count += 1
+    ...     if( 5 == self.count ):
+    ...       return( (STATUS_INSUFFICIENT_RESOURCES, [ "\\x09" + 8 * "\\0" ]) )
+    ...     return( SMB2_StandInServer._read( self, sess, hv, body ) )
+    >>> srv  = Flaky( latency=0.002 )
+    >>> fid  = srv.addFile( data )
+    >>> conn = SMB2_Connection( srv.socketpair() )
+    >>> dl = SMB2_Download( conn, fid, chunk=0x10000, window=16,
+    ...                     adaptive=False )
+    >>> try:
+    ...   dl.run( bytearray( len( data ) ), len( data ) )
+    ... except SMBerror as e:
+    ...   print e.eCode, len( conn )
+    1002 0
+    >>> dest = bytearray( len( data ) )
+    >>> dl.run( dest, len( data ) ) == len( data ), dest == data
+    (True, True)
+    >>> conn.close(); srv.close()
+
+    If the data cannot be received in place (here, because the server
+    pads its responses), it is copied from the response instead:
+    >>> class Padded( SMB2_StandInServer ):
+    ...   def _read( self, sess, hv, body ):
+    ...     status, parts = SMB2_StandInServer._read( self, sess, hv, body )
+    ...     return( (status, parts + [ 8 * "\\0" ]) )
+    >>> srv  = Padded( latency=0.002 )
+    >>> fid  = srv.addFile( data )
+    >>> conn = SMB2_Connection( srv.socketpair() )
+    >>> dl = SMB2_Download( conn, fid, chunk=0x10000, window=8 )
+    >>> dest = bytearray( len( data ) )
+    >>> dl.run( dest, len( data ) ) == len( data ), dest == data
+    (True, True)
+    >>> conn.receiver.placedBytes
+    0
+    >>> conn.close(); srv.close()
+  """
+  def __init__( self, conn=None, fileId=None, treeId=0, sessionId=0,
+                      chunk=0x100000, window=4, minWindow=1,
+                      maxWindow=64, adaptive=True,
+                      dialect=SMB2_DIALECT_302, timeout=60 ):
+    """Create a downloader.
+
+    Input:
+      conn      - An <SMB2_Connection>.
+      fileId    - The 16-byte FileId of the open file.
+      treeId    - The TreeId to place in each request header.
+      sessionId - The SessionId to place in each request header.
+      chunk     - The READ size.  The CreditCharge is calculated from
+                  this.  Large MTU must have been negotiated if the
+                  chunk is larger than 64KiB.
+      window    - The initial window; the number of READs to keep
+                  outstanding.
+      minWindow - The smallest window.
+      maxWindow - The largest window.
+      adaptive  - If True, adjust the window based on round trip times.
+      dialect   - The dialect used to compose request headers.
+      timeout   - The longest time, in seconds, to wait for any single
+                  READ response.
+    """
+    hdr = _SMB2_Header( SMB2_COM_READ, dialect )
+    hdr.treeId    = treeId
+    hdr.sessionId = sessionId
+    self._hdr     = hdr.compose()
+    self._fileId  = fileId
+    self._timeout = timeout
+    self.conn      = conn
+    self.chunk     = chunk
+    self.window    = max( minWindow, min( window, maxWindow ) )
+    self.minWindow = minWindow
+    self.maxWindow = maxWindow
+    self.adaptive  = adaptive
+    self.minRtt    = None
+    self.rtt       = None
+    self.reads     = 0
+    self.retries   = 0
+    self.peak      = 0
+
+  @staticmethod
+  def _readHandler( into, hv, body ):
+    # Response handler, called in the receiver thread.
+    #
+    # Input:
+    #   into  - The destination of the READ data.
+    #   hv    - The response header view.
+    #   body  - The response body.
+    #
+    # Output: A (status, DataLength) tuple.
+    #
+    # Normally the data has already been placed in <into>, and the body
+    # ends at the DataOffset.  If the receiver could not place it (e.g.,
+    # the response was padded or compounded), it is still in the body
+    # and is copied across here.
+    #
+    status = hv.status
+    if( status ):
+      return( (status, 0) )
+    rsp = SMB2_ReadResponse.parse( body )
+    if( rsp.dataLength and (len( body ) > (rsp.dataOffset - SMB2_HDR_SIZE)) ):
+      data = rsp.data( body )
+      if( len( data ) <= len( into ) ):
+        into[:len( data )] = data
+    return( (0, rsp.dataLength) )
+
+  def _adjust( self, rtt, count ):
+    # Update the round trip estimates, and possibly the window.
+    #
+    # Input:
+    #   rtt   - The round trip time of a completed READ.
+    #   count - The number of bytes it returned.
+    #
+    if( (self.minRtt is None) or (rtt < self.minRtt) ):
+      self.minRtt = rtt
+    self.rtt = rtt if( self.rtt is None ) else (0.875 * self.rtt) + (rtt / 8)
+    if( not self.adaptive ):
+      return
+    self._count += 1
+    self._bytes += count
+    if( self._count < self.window ):
+      return
+    now  = time.time()
+    rate = self._bytes / max( now - self._epoch, 1e-6 )
+    queued = self.window * (1.0 - (self.minRtt / self.rtt))
+    if( rate > (self._rate * _RATE_GAIN) ):
+      self.window = min( self.window + max( 1, self.window // 4 ),
+                         self.maxWindow )
+    elif( queued < _VEGAS_ALPHA ):
+      self.window = min( self.window + 1, self.maxWindow )
+    elif( queued > _VEGAS_BETA ):
+      self.window = max( self.window - 1, self.minWindow )
+    self._rate  = rate
+    self._epoch = now
+    self._count = self._bytes = 0
+
+  def run( self, dest=None, length=0, offset=0 ):
+    """Read part (or all) of the file into a buffer.
+
+    Input:
+      dest    - A writable buffer: a bytearray, a memoryview, or the
+                result of <SMB2_MapView()>.
+      length  - The number of bytes to read.
+      offset  - The file offset at which to start reading.  The byte
+                at <offset> is placed at dest[0].
+
+    Output: The number of bytes read.  This is less than <length> only
+            if the end of the file was reached.
+
+    Errors: SMBerror( 1002 )  - Raised if a READ fails, times out, or
+                                the connection is lost.  Outstanding
+                                READs are abandoned.
+
+    Notes:  No data is written to <dest> after this method returns or
+            raises an exception.  Before an exception is passed on, the
+            outstanding READs are allowed to complete.  If they do not
+            complete within the timeout, or if a READ has timed out,
+            the connection is closed.
+    """
+    dest  = dest if( isinstance( dest, memoryview ) ) else memoryview( dest )
+    conn  = self.conn
+    done  = Queue.Queue()
+    todo  = []            # Short-read remainders to re-send: (off, len).
+    sent  = {}            # Outstanding READs: future -> (off, len, time).
+    nextOff = 0
+    eof     = length
+    got     = 0
+    self._count = self._bytes = self._rate = 0
+    self._epoch = time.time()
+    req     = SMB2_ReadRequest( self._fileId, padding=0 )
+
+    try:
+      while( todo or (nextOff < eof) or sent ):
+        # Fill the window.
+        while( (len( sent ) < self.window) and (todo or (nextOff < eof)) ):
+          if( todo ):
+            off, rlen = todo.pop()
+          else:
+            off, rlen = nextOff, min( self.chunk, eof - nextOff )
+            nextOff  += rlen
+          if( not sent ):
+            # Nothing outstanding, so no more credits are on the way.  If
+            # there are too few for a full READ, send a shorter one.
+            have = max( 1, conn.credits.credits ) * SMB2_CREDIT_SIZE
+            if( rlen > have ):
+              todo.append( (off + have, rlen - have) )
+              rlen = have
+          req.offset, req.length = (offset + off), rlen
+          into = dest[off:off+rlen]
+          fut  = conn.send( self._hdr, req.compose(), req.charge,
+                            lambda hv, body, into=into:
+                              self._readHandler( into, hv, body ),
+                            not sent, into=into )
+          if( fut is None ):
+            # Out of credits.  Put it back and wait for a completion.
+            todo.append( (off, rlen) )
+            break
+          sent[ fut ] = (off, rlen, time.time())
+          fut.addCallback( done.put )
+          self.reads += 1
+        self.peak = max( self.peak, len( sent ) )
+
+        # Collect a completion.
+        try:
+          fut = done.get( True, self._timeout )
+        except Queue.Empty:
+          conn.close()
+          raise SMBerror( 1002, "READ timed out" )
+        off, rlen, start = sent.pop( fut )
+        status, dLen = fut.result()
+        if( status and (STATUS_END_OF_FILE != status) ):
+          s = NTStatus( status )
+          raise SMBerror( 1002, "READ failed: %s" % (s.name if( s )
+                                                     else "0x%08X" % status) )
+        if( dLen > rlen ):
+          raise SMBerror( 1002, "READ returned more data than requested" )
+        self._adjust( time.time() - start, dLen )
+        if( (0 == dLen) or (STATUS_END_OF_FILE == status) ):
+          # End of file.  Drop everything beyond it.
+          eof  = min( eof, off )
+          todo = [ t for t in todo if( t[0] < eof ) ]
+        elif( dLen < rlen ):
+          # Short read.  Ask for the rest; if the end of the file has
+          # been reached, that READ will say so.
+          todo.append( (off + dLen, rlen - dLen) )
+          self.retries += 1
+        got += dLen
+    finally:
+      _quiesce( conn, sent, done, self._timeout )
+    return( got )
+
+
+class SMB2_Upload( object ):
+  """Pipelined SMB2 file writer.
+
+  Instance Attributes:
+    conn        - The <SMB2_Connection>.
+    chunk       - The length of each WRITE request.
+    window      - The number of WRITEs to keep outstanding.
+    maxRetries  - The number of times a failed WRITE is retried.
+    writes      - Number of WRITE requests sent.
+    retries     - Number of WRITEs re-sent after a failure.
+    peak        - The largest number of WRITEs outstanding at once.
+
+  Doctest:
+    >>> from smb.SMB2_StandIn import SMB2_StandInServer
+    >>> from smb.SMB2_Connection import SMB2_Connection
+    >>> class Flaky( SMB2_StandInServer ):
+    ...   fail = 3
+    ...   def _write( self, sess, hv, body ):
+    ...     self.fail -= 1
+    ...     if( self.fail >= 0 ):
+    ...       return( (STATUS_INSUFFICIENT_RESOURCES, [ "\\x09" + 8 * "\\0" ]) )
+    ...     return( SMB2_StandInServer._write( self, sess, hv, body ) )
+    >>> srv  = Flaky( latency=0.002 )
+    >>> fid  = srv.addFile( bytearray() )
+    >>> conn = SMB2_Connection( srv.socketpair() )
+    >>> data = os.urandom( 0x300000 )
+    >>> ul = SMB2_Upload( conn, fid, chunk=0x10000, window=8 )
+    >>> ul.run( data ) == len( data ), srv.files[ fid ] == data
+    (True, True)
+    >>> ul.writes, ul.retries, ul.peak
+    (51, 3, 8)
+    >>> srv.fail, ul.maxRetries = 1000, 2
+    >>> try:
+    ...   ul.run( data )
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1002
+    >>> srv._write = lambda sess, hv, body: \\
+    ...   (STATUS_SUCCESS, [ SMB2_WriteResponse( 0 ).compose() ])
+    >>> try:
+    ...   ul.run( data )
+    ... except SMBerror as e:
+    ...   print e
+    1002: SMB Semantic Error; WRITE at offset 0 failed: nothing was written.
+    >>> conn.close(); srv.close()
+  """
+  def __init__( self, conn=None, fileId=None, treeId=0, sessionId=0,
+                      chunk=0x100000, window=16, maxRetries=3,
+                      dialect=SMB2_DIALECT_302, timeout=60 ):
+    """Create an uploader.
+
+    Input:
+      conn        - An <SMB2_Connection>.
+      fileId      - The 16-byte FileId of the open file.
+      treeId      - The TreeId to place in each request header.
+      sessionId   - The SessionId to place in each request header.
+      chunk       - The WRITE size.  Large MTU must have been negotiated
+                    if the chunk is larger than 64KiB.
+      window      - The number of WRITEs to keep outstanding.
+      maxRetries  - The number of times a failed WRITE is retried before
+                    the upload is abandoned.
+      dialect     - The dialect used to compose request headers.
+      timeout     - The longest time, in seconds, to wait for any single
+                    WRITE response.
+    """
+    hdr = _SMB2_Header( SMB2_COM_WRITE, dialect )
+    hdr.treeId    = treeId
+    hdr.sessionId = sessionId
+    self._hdr     = hdr.compose()
+    self._fileId  = fileId
+    self._timeout = timeout
+    self.conn       = conn
+    self.chunk      = chunk
+    self.window     = window
+    self.maxRetries = maxRetries
+    self.writes     = 0
+    self.retries    = 0
+    self.peak       = 0
+
+  @staticmethod
+  def _writeHandler( hv, body ):
+    # Response handler, called in the receiver thread.
+    status = hv.status
+    if( status ):
+      return( (status, 0) )
+    return( (0, SMB2_WriteResponse.parse( body ).count) )
+
+  def run( self, src=None, length=None, offset=0 ):
+    """Write a buffer to the file.
+
+    Input:
+      src     - The data to write: a string, bytearray, memoryview, or
+                the result of <SMB2_MapView()>.
+      length  - The number of bytes to write.  If None, all of <src> is
+                written.
+      offset  - The file offset at which to write src[0].
+
+    Output: The number of bytes written.
+
+    Errors: SMBerror( 1002 )  - Raised if a WRITE fails more than
+                                <maxRetries> times, if a WRITE times
+                                out, or if the connection is lost.
+                                Outstanding WRITEs are abandoned.
+                                As with <SMB2_Download.run()>, they are
+                                allowed to complete first, or else the
+                                connection is closed.
+
+    Notes:  A failed WRITE is put back in the queue and re-sent after
+            the WRITEs already outstanding; the rest of the pipeline
+            keeps moving in the meantime.  A short WRITE is completed
+            by writing the remainder.
+    """
+    src    = src if( isinstance( src, memoryview ) ) else memoryview( src )
+    length = len( src ) if( length is None ) else length
+    conn   = self.conn
+    done   = Queue.Queue()
+    todo   = []           # Chunks to re-send: (off, len).
+    failed = {}           # Failure counts, by chunk offset.
+    sent   = {}           # Outstanding WRITEs: future -> (off, len).
+    nextOff = 0
+    put     = 0
+    req     = SMB2_WriteRequest( self._fileId )
+
+    try:
+      while( todo or (nextOff < length) or sent ):
+        # Fill the window.
+        while( (len( sent ) < self.window) and (todo or (nextOff < length)) ):
+          if( todo ):
+            off, wlen = todo.pop()
+          else:
+            off, wlen = nextOff, min( self.chunk, length - nextOff )
+            nextOff  += wlen
+          if( not sent ):
+            # Nothing outstanding; shrink the WRITE to fit the credits.
+            have = max( 1, conn.credits.credits ) * SMB2_CREDIT_SIZE
+            if( wlen > have ):
+              todo.append( (off + have, wlen - have) )
+              wlen = have
+          req.offset, req.length = (offset + off), wlen
+          fut = conn.send( self._hdr, req.compose(), req.charge,
+                           self._writeHandler, not sent,
+                           payload=src[off:off+wlen] )
+          if( fut is None ):
+            todo.append( (off, wlen) )
+            break
+          sent[ fut ] = (off, wlen)
+          fut.addCallback( done.put )
+          self.writes += 1
+        self.peak = max( self.peak, len( sent ) )
+
+        # Collect a completion.
+        try:
+          fut = done.get( True, self._timeout )
+        except Queue.Empty:
+          conn.close()
+          raise SMBerror( 1002, "WRITE timed out" )
+        off, wlen = sent.pop( fut )
+        status, count = fut.result()
+        if( status or (0 == count) ):
+          # A WRITE that succeeds without writing anything is counted
+          # as a failure; otherwise it could be retried forever.
+          tries = failed.get( off, 0 ) + 1
+          if( tries > self.maxRetries ):
+            if( status ):
+              s = NTStatus( status )
+              s = s.name if( s ) else ("0x%08X" % status)
+            else:
+              s = "nothing was written"
+            raise SMBerror( 1002, "WRITE at offset %d failed: %s" % (off, s) )
+          failed[ off ] = tries
+          todo.insert( 0, (off, wlen) )
+          self.retries += 1
+        else:
+          failed.pop( off, None )
+          if( count < wlen ):
+            todo.insert( 0, (off + count, wlen - count) )
+          put += count
+    finally:
+      _quiesce( conn, sent, done, self._timeout )
+    return( put )
+
+
+# Functions ------------------------------------------------------------------ #
+#
+
+def _quiesce( conn=None, sent=None, done=None, timeout=60 ):
+  # Wait for abandoned requests to complete.
+  #
+  # Input:
+  #   conn    - The <SMB2_Connection>.
+  #   sent    - The outstanding requests; a dictionary keyed by future.
+  #   done    - The Queue to which completed futures are posted.
+  #   timeout - The longest time to wait, in seconds.
+  #
+  # Notes:  The futures of outstanding READs refer to slices of the
+  #         caller's buffer, which is often a mapping that is about to
+  #         be closed.  The receiver thread must not be left writing to
+  #         it.  If the requests do not complete in time, the
+  #         connection is closed, which stops the receiver thread and
+  #         fails the requests.
+  #
+  deadline = time.time() + timeout
+  while( sent ):
+    try:
+      fut = done.get( True, max( 0, deadline - time.time() ) )
+    except Queue.Empty:
+      conn.close()
+      deadline = time.time() + timeout
+      continue
+    sent.pop( fut, None )
+
+def SMB2_MapView( mm=None ):
+  """Return a writable memoryview of an mmap object.
+
+  Input:  mm  - An mmap object.
+
+  Output: A memoryview of the whole mapping.
+
+  Notes:  In Python 2.7, memoryview() does not accept an mmap object.
+          A ctypes array created from the mapping does support it.
+          The view (and any slices of it) must be deleted before the
+          mmap is closed.  Python 2.7 does not track views created this
+          way, so mmap.close() succeeds even if they remain, and any
+          later use of them touches unmapped memory.
+
+  Doctest:
+    >>> mm = mmap.mmap( -1, 4096 )
+    >>> mv = SMB2_MapView( mm )
+    >>> mv[4:9] = "Hello"
+    >>> mm[:10], len( mv )
+    ('\\x00\\x00\\x00\\x00Hello\\x00', 4096)
+    >>> del mv; mm.close()
+  """
+  return( memoryview( (ctypes.c_char * len( mm )).from_buffer( mm ) ) )
+
+def SMB2_DownloadFile( dl=None, path=None, length=0 ):
+  """Download a file into a memory-mapped local file.
+
+  Input:
+    dl      - An <SMB2_Download>.
+    path    - The pathname of the local file.  It is created (or
+              truncated) and extended to <length> bytes.
+    length  - The size of the remote file.
+
+  Output: The number of bytes read.  If the remote file turned out to
+          be shorter than <length>, the local file is truncated.
+  """
+  fd = os.open( path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0644 )
+  try:
+    if( 0 == length ):
+      return( 0 )
+    os.ftruncate( fd, length )
+    mm = mmap.mmap( fd, length )
+    try:
+      mv  = SMB2_MapView( mm )
+      got = dl.run( mv, length )
+      del mv
+    finally:
+      mm.close()
+    if( got < length ):
+      os.ftruncate( fd, got )
+    return( got )
+  finally:
+    os.close( fd )
+
+
+def SMB2_UploadFile( ul=None, path=None ):
+  """Upload a local file, using a memory mapping of the file as the source.
+
+  Input:
+    ul    - An <SMB2_Upload>.
+    path  - The pathname of the local file.
+
+  Output: The number of bytes written.
+
+  Notes:  The file is mapped copy-on-write (ACCESS_COPY) because
+          ctypes, which is used to get a memoryview of the mapping,
+          refuses read-only buffers.  Nothing is written, so no pages
+          are copied.
+  """
+  fd = os.open( path, os.O_RDONLY )
+  try:
+    length = os.fstat( fd ).st_size
+    if( 0 == length ):
+      return( 0 )
+    mm = mmap.mmap( fd, length, access=mmap.ACCESS_COPY )
+    try:
+      mv  = SMB2_MapView( mm )
+      put = ul.run( mv, length )
+      del mv
+    finally:
+      mm.close()
+    return( put )
+  finally:
+    os.close( fd )
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( size=0x10000000, chunk=0x100000, latency=0.005 ):
+  # Download from an in-process stand-in server, with simulated latency.
+  #
+  # Input:
+  #   size    - File size.  The default is 256MiB.
+  #   chunk   - READ size.
+  #   latency - Simulated round trip time, in seconds.
+  #
+  # Notes:  Compares a few fixed windows against the adaptive window.
+  #         The file is downloaded into an anonymous mapping.
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import smb.SMB2_Transfer as m; m._bench()'
+  #
+  from SMB2_StandIn    import SMB2_StandInServer
+  from SMB2_Connection import SMB2_Connection
+
+  srv = SMB2_StandInServer( latency=latency )
+  fid = srv.addFile( 'x' * size )
+  mm  = mmap.mmap( -1, size )
+  mv  = SMB2_MapView( mm )
+  print "%d MiB file, %d KiB READs, %.1fms latency" % \
+        (size >> 20, chunk >> 10, latency * 1000)
+  for window, adaptive in ((1, False), (4, False), (16, False), (64, False),
+                           (2, True)):
+    conn = SMB2_Connection( srv.socketpair() )
+    dl = SMB2_Download( conn, fid, chunk=chunk, window=window,
+                        adaptive=adaptive )
+    start = time.time()
+    dl.run( mv, size )
+    elapsed = time.time() - start
+    conn.close()
+    print "%s window %2d: %7.1f MiB/second, peak %2d, rtt %.1fms" % \
+          ("Adaptive," if( adaptive ) else "Fixed,   ", dl.window,
+           size / elapsed / 0x100000, dl.peak, dl.rtt * 1000)
+  del mv
+  mm.close()
+  srv.close()
+
+def _benchUpload( size=0x10000000, chunk=0x100000, latency=0.005 ):
+  # Upload to a stand-in server and report throughput and CPU cost.
+  #
+  # Input:
+  #   size    - Amount of data to upload.  The default is 256MiB.
+  #   chunk   - WRITE size.
+  #   latency - Simulated round trip time, in seconds.
+  #
+  # Notes:  The stand-in server runs in a child process, so the CPU
+  #         time reported is the client's alone.  The "copied" run
+  #         sends a copy of each chunk instead of a memoryview slice,
+  #         for comparison.
+  #         Run from the directory above the one containing this module:
+  #           $ python -c 'import smb.SMB2_Transfer as m; m._benchUpload()'
+  #
+  import socket
+  from SMB2_StandIn    import SMB2_StandInServer
+  from SMB2_Connection import SMB2_Connection
+
+  class _Copied( SMB2_Upload ):
+    # An uploader that copies each chunk before sending it.
+    def run( self, src=None, length=None, offset=0 ):
+      send = self.conn.send
+      def _copySend( *args, **kw ):
+        if( kw.get( "payload" ) is not None ):
+          kw[ "payload" ] = kw[ "payload" ].tobytes()
+        return( send( *args, **kw ) )
+      self.conn.send = _copySend
+      try:
+        return( SMB2_Upload.run( self, src, length, offset ) )
+      finally:
+        del self.conn.send
+
+  mm = mmap.mmap( -1, size )
+  mv = SMB2_MapView( mm )
+  print "%d MiB upload, %d KiB WRITEs, %.1fms latency" % \
+        (size >> 20, chunk >> 10, latency * 1000)
+  for window, cls in ((1, SMB2_Upload), (16, SMB2_Upload),
+                      (16, _Copied)):
+    a, b = socket.socketpair()
+    pid = os.fork()
+    if( 0 == pid ):
+      a.close()
+      srv = SMB2_StandInServer( latency=latency )
+      srv.addFile( bytearray( size ), 'F' * 16 )
+      srv.serve( b, False )
+      os._exit( 0 )
+    b.close()
+    conn  = SMB2_Connection( a )
+    ul    = cls( conn, 'F' * 16, chunk=chunk, window=window )
+    cpu   = sum( os.times()[:2] )
+    start = time.time()
+    ul.run( mv, size )
+    elapsed = time.time() - start
+    cpu     = sum( os.times()[:2] ) - cpu
+    conn.close()
+    os.waitpid( pid, 0 )
+    mib = size / float( 0x100000 )
+    print "%s window %2d: %7.1f MiB/second, %5.2fms CPU/MiB" % \
+          ("Copied, " if( cls is _Copied ) else "In place,", window,
+           mib / elapsed, (cpu * 1000) / mib)
+  del mv
+  mm.close()
+
+# ============================================================================ #
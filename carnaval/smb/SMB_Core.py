@@ -154,7 +154,10 @@ class SMB_FileTime( object ):
             means that by the time the result is actually returned it
             is already a bit stale.
     """
-    return( long( round( time(), 7 ) * 10000000 ) + cls._EPOCH_DELTA_SECS )
+    # Scale before adding the epoch offset; near 1.3e17 a double can
+    # only resolve steps of 16 FILETIME units.
+    t = long( round( time() * 10000000 ) )
+    return( t + (cls._EPOCH_DELTA_SECS * 10000000) )
 
 
 # Functions ------------------------------------------------------------------ #
@@ -446,6 +446,8 @@ _init_dict = \
   0xC00000C3: ("STATUS_INVALID_NETWORK_RESPONSE",
     "The network responded incorrectly."),
   0xC00000C9: ("STATUS_NETWORK_NAME_DELETED", "The network name was deleted."),
+  0xC00000CC: ("STATUS_BAD_NETWORK_NAME",
+    "The specified share name cannot be found on the remote server."),
   0xC00000D0: ("STATUS_REQUEST_NOT_ACCEPTED", "No more connections can be " \
     "made to this remote computer at this time because the computer has " \
     "already accepted the maximum number of connections."),
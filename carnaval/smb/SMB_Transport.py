@@ -0,0 +1,373 @@
+# ============================================================================ #
+#                               SMB_Transport.py
+#
+# Copyright:
+#   Copyright (C) 2026 by Christopher R. Hertel
+#
+# $Id$
+#
+# ---------------------------------------------------------------------------- #
+#
+# Description:
+#   Carnaval Toolkit: SMB transport framing; NBT (port 139) and Direct TCP
+#                     (port 445).
+#
+# ---------------------------------------------------------------------------- #
+#
+# License:
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 3.0 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public License
+#   along with this library.  If not, see <http://www.gnu.org/licenses/>.
+#
+# See Also:
+#   The 0.README file included with the distribution.
+#
+# ---------------------------------------------------------------------------- #
+#              This code was developed in participation with the
+#                   Protocol Freedom Information Foundation.
+#                          <www.protocolfreedom.org>
+# ---------------------------------------------------------------------------- #
+#
+# Notes:
+#
+#   - Direct TCP transport (what Microsoft calls "Direct hosting of SMB
+#     over TCP/IP") is a vestigial form of the NBT Session Service.  The
+#     four-byte header is a zero octet (the Session Message type) followed
+#     by a 24-bit length.  There are no other message types, so there are
+#     no session requests and no keepalives.
+#
+#   - SMB2/3 allows messages larger than the NBT 17-bit limit when large
+#     MTU support is negotiated.  Those messages can only be carried over
+#     Direct TCP.
+#
+# References:
+#
+#   [MS-SMB2]   Microsoft Corporation, "Server Message Block (SMB)
+#               Protocol Versions 2 and 3", section 2.1 (Transport)
+#               http://msdn.microsoft.com/en-us/library/cc246482.aspx
+#
+# ============================================================================ #
+#
+"""Carnaval Toolkit: SMB Transport Framing
+
+SMB messages are carried over TCP in one of two ways:
+  * NBT transport, typically on port 139.  Each message is preceded by
+    an NBT Session Message header, which has a 17-bit length field.
+    The NBT Session Service must be set up first, using a Session
+    Request, and the stream may also carry Session Keepalives.
+  * Direct TCP transport, on port 445.  Each message is preceded by a
+    four-byte header: a zero octet followed by a 24-bit length.
+
+The <SMB_Transport> class hides the difference.  Received SMB messages
+are returned as memoryviews of the receive buffer, which is sized to
+fit the largest message received so far.
+"""
+
+# Imports -------------------------------------------------------------------- #
+#
+#   struct              - Binary data packing and parsing tools.
+#   socket              - Send flags.
+#   sys                 - Platform detection.
+#   SMB_Core            - The SMBerror exception class.
+#   NBT_SessionService  - The NBT Session Service framer and messages.
+#
+
+import struct       # Binary data handling.
+import socket       # Send flags.
+import sys          # Platform detection.
+
+from SMB_Core               import SMBerror
+from nbt.NBT_SessionService import SessionFramer, SessionMessage
+from nbt.NBT_SessionService import SS_PORT, SS_SESSION_MESSAGE
+from nbt.NBT_SessionService import SS_SESSION_KEEPALIVE, MsgTypeStr
+
+
+# Constants ------------------------------------------------------------------ #
+#
+
+SMB_DIRECT_PORT = 445       # Direct TCP transport port.
+SMB_NBT_PORT    = SS_PORT   # NBT transport port.
+
+SMB_DIRECT_MAXLEN = 0x00FFFFFF  # Largest Direct TCP message.
+
+
+# Globals -------------------------------------------------------------------- #
+#
+#   _formatLong - Pack a 32-bit unsigned integer in network byte order.
+#   _SEND_COPY  - Payloads shorter than this are copied into a single
+#                 buffer along with the header, and sent with a single
+#                 system call.  Longer payloads are sent in place.
+#   _MSG_MORE   - Send flag that tells the kernel more data will follow,
+#                 so that the pieces of a message are coalesced into
+#                 full segments.  Python 2.7 does not define MSG_MORE,
+#                 so the Linux value is used directly.  Zero elsewhere.
+#
+
+_formatLong = struct.Struct( "!L" )
+_SEND_COPY  = 0x4000
+_MSG_MORE   = getattr( socket, "MSG_MORE",
+                       0x8000 if( sys.platform.startswith( "linux" ) ) else 0 )
+
+
+# Classes -------------------------------------------------------------------- #
+#
+
+class DirectTCPFramer( SessionFramer ):
+  """Split a Direct TCP transport byte stream into messages.
+
+  This is a <SessionFramer> that understands the Direct TCP header.
+  All messages are returned with a message type of SS_SESSION_MESSAGE.
+
+  Doctest:
+    >>> fr = DirectTCPFramer()
+    >>> fr.feed( "\\0\\0\\0\\x05Hello" + "\\0\\0\\0\\x02Hi" )
+    15
+    >>> [ (t, v.tobytes()) for t, v in fr.frames() ]
+    [(0, 'Hello'), (0, 'Hi')]
+    >>> fr.feed( "\\x85\\0\\0\\0" )
+    4
+    >>> try:
+    ...   list( fr.frames() )
+    ... except SMBerror as e:
+    ...   print e.eCode
+    1002
+  """
+  # The maximum message length.
+  maxLen = SMB_DIRECT_MAXLEN
+
+  def _header( self, pos ):
+    # Parse a Direct TCP transport header.
+    #
+    # Input:  pos - The buffer offset of the header.
+    #
+    # Output: A tuple: (SS_SESSION_MESSAGE, message length)
+    #
+    # Errors: SMBerror( 1002 )  - The first octet is not zero.
+    #
+    buf = self._buf
+    if( buf[pos] ):
+      s = "Invalid Direct TCP transport header (0x%02X)" % buf[pos]
+      raise SMBerror( 1002, s )
+    return( (SS_SESSION_MESSAGE,
+             (buf[pos+1] << 16) | (buf[pos+2] << 8) | buf[pos+3]) )
+
+
+class SMB_Transport( object ):
+  """SMB transport; NBT or Direct TCP framing over a stream socket.
+
+  Instance Attributes:
+    sock      - The connected stream socket.
+    direct    - True for Direct TCP framing, False for NBT framing.
+    framer    - The <SessionFramer> (or <DirectTCPFramer>) used to split
+                the received stream into messages.
+    kaCount   - Number of NBT Session Keepalives received (and ignored).
+
+  Doctest:
+    >>> import socket
+    >>> for direct in (True, False):
+    ...   a, b = socket.socketpair()
+    ...   ta, tb = SMB_Transport( a, direct ), SMB_Transport( b, direct )
+    ...   ta.send( "\\xfeSMB" + ('x' * 60) )
+    ...   if( not direct ):
+    ...     a.sendall( "\\x85\\0\\0\\0" )   # Keepalive.
+    ...   ta.send( memoryview( "\\xfeSMB" + ('y' * 0x5000) ) )
+    ...   got = []
+    ...   while( len( got ) < 2 ):
+    ...     n = tb.recv()
+    ...     got += [ len( m ) for m in tb.messages() ]
+    ...   print direct, got, tb.kaCount
+    ...   a.close(); b.close()
+    True [64, 20484] 0
+    False [64, 20484] 1
+    >>> print [ hex( ord( c ) ) for c in SMB_Transport().header( 0x123456 ) ]
+    ['0x0', '0x12', '0x34', '0x56']
+    >>> SMB_Transport( None, False ).header( 0x123456 )
+    Traceback (most recent call last):
+      ...
+    ValueError: Message length (1193046) exceeds the transport maximum.
+  """
+  def __init__( self, sock=None, direct=True ):
+    """Create an SMB transport.
+
+    Input:
+      sock    - A connected stream socket.  If NBT framing is used, the
+                NBT session must already have been established.
+      direct  - True for Direct TCP transport (port 445), False for NBT
+                transport (port 139).
+    """
+    self.sock    = sock
+    self.direct  = bool( direct )
+    self.framer  = DirectTCPFramer( sock ) if( direct ) \
+                   else SessionFramer( sock )
+    self.kaCount = 0
+
+  @property
+  def maxLen( self ):
+    """The largest message that can be sent or received.  Read-only."""
+    return( self.framer.maxLen )
+
+  def header( self, mLen=0 ):
+    """Compose a transport header.
+
+    Input:  mLen  - The length of the message that will follow.
+
+    Errors: ValueError  - Raised if <mLen> is out of range for the
+                          transport.
+
+    Output: The four-byte transport header.
+    """
+    if( (mLen < 0) or (mLen > self.framer.maxLen) ):
+      s = "Message length (%d) exceeds the transport maximum." % mLen
+      raise ValueError( s )
+    if( self.direct ):
+      return( _formatLong.pack( mLen ) )
+    return( SessionMessage( mLen ) )
+
+  def send( self, msg=None ):
+    """Send a single SMB message.
+
+    Input:  msg - The message to send, as a string of octets or any
+                  object that supports the buffer interface (such as a
+                  memoryview).
+
+    Errors: ValueError    - Raised if the message is too long.
+            socket.error  - Passed through from the socket.
+
+    Notes:  Short messages are copied into a single buffer along with
+            the header.  Long messages are sent in place, following a
+            separate send of the header.
+    """
+    hdr = self.header( len( msg ) )
+    if( len( msg ) < _SEND_COPY ):
+      if( isinstance( msg, memoryview ) ):
+        msg = msg.tobytes()
+      self.sock.sendall( hdr + msg )
+    else:
+      self.sock.sendall( hdr, _MSG_MORE )
+      self.sock.sendall( msg )
+
+  def sendParts( self, *parts ):
+    """Send a single SMB message that is given in pieces.
+
+    Input:  parts - The pieces of the message, in order.  Each may be a
+                    string of octets, a bytearray, or a memoryview (of
+                    a buffer, an mmap, etc.).
+
+    Errors: ValueError    - Raised if the message is too long.
+            socket.error  - Passed through from the socket.
+
+    Notes:  This is the gather-write used to send a request header,
+            request body, and bulk payload (e.g., SMB2 WRITE data)
+            without first joining them.  Python 2.7 has no sendmsg(),
+            so short pieces are joined (along with the transport
+            header) and long pieces are sent in place, with MSG_MORE
+            set on all but the last send.
+
+    Doctest:
+      >>> import socket
+      >>> a, b = socket.socketpair()
+      >>> ta, tb = SMB_Transport( a ), SMB_Transport( b )
+      >>> data = bytearray( 'd' * 0x8000 )
+      >>> ta.sendParts( "\\xfeSMB", bytearray( 'h' * 60 ),
+      ...               memoryview( data )[0x10:], "tail" )
+      >>> got = []
+      >>> while( not got ):
+      ...   n = tb.recv()
+      ...   got = [ m.tobytes() for m in tb.messages() ]
+      >>> len( got[0] ), got[0][64:68], got[0][-4:]
+      (32820, 'dddd', 'tail')
+      >>> a.close(); b.close()
+    """
+    hdr   = self.header( sum( len( p ) for p in parts ) )
+    small = [ hdr ]
+    last  = len( parts ) - 1
+    for i, part in enumerate( parts ):
+      if( len( part ) < _SEND_COPY ):
+        small.append( part.tobytes() if( isinstance( part, memoryview ) )
+                      else str( part ) )
+      else:
+        if( small ):
+          self.sock.sendall( ''.join( small ), _MSG_MORE )
+          small = []
+        self.sock.sendall( part, _MSG_MORE if( i < last ) else 0 )
+    if( small ):
+      self.sock.sendall( ''.join( small ) )
+
+  def recv( self ):
+    """Read available data from the socket.
+
+    Output: The number of bytes read.  Zero indicates that the peer has
+            closed the connection.
+    """
+    return( self.framer.recv() )
+
+  def messages( self ):
+    """Return the complete SMB messages that have been received.
+
+    Output: A generator that returns memoryviews of the received SMB
+            messages.  Each memoryview is only valid until the next call
+            to <recv()>.
+
+    Errors: SMBerror( 1002 )  - Raised if an NBT message other than a
+                                Session Message or a Keepalive is found
+                                in the stream, or if the Direct TCP
+                                header is invalid.
+            NBTerror          - Raised if the NBT header is invalid.
+    """
+    for mType, payload in self.framer.frames():
+      if( SS_SESSION_MESSAGE == mType ):
+        yield( payload )
+      elif( SS_SESSION_KEEPALIVE == mType ):
+        self.kaCount += 1
+      else:
+        s = "Unexpected %s on an SMB transport" % MsgTypeStr( mType )
+        raise SMBerror( 1002, s )
+
+
+# Benchmarks ----------------------------------------------------------------- #
+#
+
+def _bench( count=400, size=0x800000 ):
+  # Measure Direct TCP throughput with large (multi-megabyte) messages.
+  #
+  # Input:
+  #   count - Number of messages to send.
+  #   size  - Message size.  The default is 8MiB.
+  #
+  # Notes:  Run from the directory above the one containing this module:
+  #           $ python -c 'import smb.SMB_Transport as m; m._bench()'
+  #
+  import socket, threading, time
+  rcv, snd = socket.socketpair()
+  msg = memoryview( 'x' * size )
+  def _sender():
+    tx = SMB_Transport( snd )
+    for i in xrange( count ):
+      tx.send( msg )
+    snd.close()
+  rx  = SMB_Transport( rcv )
+  got = 0
+  start = time.time()
+  threading.Thread( target=_sender ).start()
+  while( rx.recv() ):
+    for payload in rx.messages():
+      got += len( payload )
+  elapsed = time.time() - start
+  rcv.close()
+
+  print "Messages received.: %d" % rx.framer.msgCount
+  print "Buffer size.......: %d" % len( rx.framer._buf )
+  print "Elapsed...........: %.3f seconds" % elapsed
+  print "Throughput........: %.1f MiB/second" % (got / elapsed / 0x100000)
+
+# ============================================================================ #